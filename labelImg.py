@@ -1,10 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import sys
+
+from libs.startup_profiler import StartupProfiler, PROFILE_STARTUP_FLAG
+
+# Installed before the remaining imports so they are timed too, only when run
+# as a script: importers such as spawned worker processes must not install it
+startup_profiler = StartupProfiler.from_argv(sys.argv) if __name__ == "__main__" else None
+
 import argparse
+import bisect
 import codecs
 import os
 import platform
 import shutil
+import sqlite3
+import threading
 import webbrowser as wb
 from functools import partial
 
@@ -31,10 +42,27 @@ from libs.create_ml_io import CreateMLReader
 from libs.create_ml_io import JSON_EXT
 from libs.ustr import ustr
 from libs.hashableQListWidgetItem import HashableQListWidgetItem
-from libs.auto_annotate import YOLOAutoAnnotator
+from libs.trash import Trash, TRASH_DIR_NAME
+from libs.file_watcher import DatasetWatcher
+from libs.auto_annotate import RAW_CONFIDENCE_FLOOR, YOLOModelManager
+from libs import batch_annotate
+from libs.batch_annotate import BatchAnnotationEngine, ShardedAnnotationEngine
+from libs.pre_annotation import PreAnnotationWorker
+from libs.dataset_index import DatasetIndex
+from libs.label_cache import LabelCache
+from libs.label_reader import LabelReader
+from libs.dataset_stats import DatasetStats, stats_html
+from libs.snapshot import SnapshotBuilder
+from libs.quantization import compare_models, quantize_model, sample_images
+from libs.video_source import (
+    VIDEO_EXTENSIONS, close_videos, is_frame_path, is_video_file, open_video, parse_frame_path, video_frame_paths,
+)
 
 __appname__ = "labelImg Refresh"
 
+if startup_profiler:
+    startup_profiler.mark("modules imported")
+
 
 class WindowMixin(object):
 
@@ -57,6 +85,37 @@ class WindowMixin(object):
 
 class MainWindow(QMainWindow, WindowMixin):
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = list(range(3))
+    # Larger batches of file system changes rebuild the file list at once.
+    INCREMENTAL_UPDATE_LIMIT = 100
+    # Emitted from the batch auto-annotation thread
+    batchAnnotationProgress = pyqtSignal(int, int, float)
+    batchAnnotationFinished = pyqtSignal(object)
+    preAnnotationReady = pyqtSignal(str)
+    # QuantizationReport, or the exception that stopped quantization
+    quantizationFinished = pyqtSignal(object)
+    # (written label files, keyframe count, failures, class list), or the exception that stopped interpolation
+    interpolationFinished = pyqtSignal(object)
+    # (COCO file, images, annotations), or the exception that stopped the export
+    cocoExportFinished = pyqtSignal(object)
+    # (CocoImport, label files it would replace), or the exception that stopped reading the COCO file
+    cocoImportRead = pyqtSignal(object)
+    # CocoImportResult, or the exception that stopped the import
+    cocoImportFinished = pyqtSignal(object)
+    # (snapshot file, images, boxes), or the exception that stopped the export
+    snapshotExportFinished = pyqtSignal(object)
+    # (generation, DatasetStats or the exception that stopped counting)
+    statisticsReady = pyqtSignal(object)
+    # LintReport, or the exception that stopped the check
+    lintFinished = pyqtSignal(object)
+    # DuplicateReport, or the exception that stopped the search
+    duplicatesFound = pyqtSignal(object)
+    # Issues listed in the details of the check labels report
+    LINT_DETAILS_LIMIT = 1000
+    # Detections overlapping an existing box at least this much are not added when merging
+    MERGE_IOU_THRESHOLD = 0.5
+    # Label file format of each label file extension
+    LABEL_FORMAT_OF_EXT = {XML_EXT: LabelFileFormat.PASCAL_VOC, TXT_EXT: LabelFileFormat.YOLO,
+                           JSON_EXT: LabelFileFormat.CREATE_ML}
 
     def __init__(
             self,
@@ -173,12 +232,42 @@ class MainWindow(QMainWindow, WindowMixin):
         file_list_layout.addWidget(self.idx_text_box)
         file_list_layout.addWidget(self.jump_button)
         file_list_layout.addWidget(self.file_list_widget)
+        # Near-duplicate groups of File > Find duplicate images, under the file list until closed
+        self.duplicate_tree = QTreeWidget()
+        self.duplicate_tree.setHeaderHidden(True)
+        self.duplicate_tree.currentItemChanged.connect(self.duplicate_item_selected)
+        delete_duplicates_button = QPushButton("Delete checked", self)
+        delete_duplicates_button.clicked.connect(self.delete_checked_duplicates)
+        close_duplicates_button = QPushButton("Close", self)
+        close_duplicates_button.clicked.connect(self.close_duplicates)
+        duplicate_buttons_layout = QHBoxLayout()
+        duplicate_buttons_layout.addWidget(delete_duplicates_button)
+        duplicate_buttons_layout.addWidget(close_duplicates_button)
+        duplicate_layout = QVBoxLayout()
+        duplicate_layout.setContentsMargins(0, 0, 0, 0)
+        duplicate_layout.addWidget(self.duplicate_tree)
+        duplicate_layout.addLayout(duplicate_buttons_layout)
+        self.duplicate_panel = QWidget()
+        self.duplicate_panel.setLayout(duplicate_layout)
+        self.duplicate_panel.hide()
+        file_list_layout.addWidget(self.duplicate_panel)
         file_list_container = QWidget()
         file_list_container.setLayout(file_list_layout)
         self.file_dock = QDockWidget(self.get_str("fileList"), self)
         self.file_dock.setObjectName(self.get_str("files"))
         self.file_dock.setWidget(file_list_container)
 
+        # Class balance and box sizes of the opened directory, counted when shown
+        self.stats_browser = QTextBrowser()
+        self.stats_dock = QDockWidget("Dataset statistics", self)
+        self.stats_dock.setObjectName("statistics")
+        self.stats_dock.setWidget(self.stats_browser)
+        self.dataset_stats = None
+        # Bumped whenever the statistics being counted are out of date
+        self._stats_generation = 0
+        # Images saved while the statistics were being counted
+        self._stats_saved_paths = set()
+
         self.zoom_widget = ZoomWidget()
         self.light_widget = LightWidget(self.get_str("lightWidgetTitle"))
         self.color_dialog = ColorDialog(parent=self)
@@ -207,6 +296,10 @@ class MainWindow(QMainWindow, WindowMixin):
         self.addDockWidget(Qt.RightDockWidgetArea, self.dock)
         self.addDockWidget(Qt.RightDockWidgetArea, self.file_dock)
         self.file_dock.setFeatures(QDockWidget.DockWidgetFloatable)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.stats_dock)
+        self.stats_dock.hide()
+        self.stats_dock.visibilityChanged.connect(self.on_statistics_visibility_changed)
+        self.statisticsReady.connect(self.on_statistics_ready)
 
         self.dock_features = QDockWidget.DockWidgetClosable | QDockWidget.DockWidgetFloatable
         self.dock.setFeatures(self.dock.features() & ~int(self.dock_features))
@@ -609,6 +702,10 @@ class MainWindow(QMainWindow, WindowMixin):
         a_labels_toggle.setText(self.get_str("showHide"))
         a_labels_toggle.setShortcut("Ctrl+Shift+L")
 
+        a_statistics_toggle = self.stats_dock.toggleViewAction()
+        a_statistics_toggle.setText("Dataset statistics")
+        a_statistics_toggle.setStatusTip("Show the class balance and box sizes of the opened directory")
+
         # Label list context menu.
         m_labels = QMenu()
         add_actions(m_labels, (a_edit, a_delete))
@@ -709,6 +806,71 @@ class MainWindow(QMainWindow, WindowMixin):
         self.a_auto_annotate_all.setStatusTip("Automatically annotate ALL images using YOLO")
         self.a_auto_annotate_all.triggered.connect(self.auto_annotate_all_images)
 
+        self.a_reload_yolo_model = QAction("Reload YOLO model", self)
+        self.a_reload_yolo_model.setStatusTip("Load the YOLO model again after its weights changed")
+        self.a_reload_yolo_model.triggered.connect(self.reload_yolo_model)
+
+        self.a_set_yolo_confidence = QAction("Set YOLO confidence threshold...", self)
+        self.a_set_yolo_confidence.setStatusTip("Change the minimum confidence of auto-annotated boxes")
+        self.a_set_yolo_confidence.triggered.connect(self.set_yolo_confidence)
+
+        self.a_set_yolo_workers = QAction("Set auto-annotate worker processes...", self)
+        self.a_set_yolo_workers.setStatusTip("Annotate all images in several processes on CPU-only machines")
+        self.a_set_yolo_workers.triggered.connect(self.set_yolo_workers)
+
+        self.a_toggle_yolo_tiling = QAction("Tiled inference for large images", self)
+        self.a_toggle_yolo_tiling.setCheckable(True)
+        self.a_toggle_yolo_tiling.setChecked(settings.get(SETTING_AUTO_ANNOTATE_TILING, False))
+        self.a_toggle_yolo_tiling.setStatusTip("Detect small objects by running the model on overlapping tiles")
+        self.a_toggle_yolo_tiling.triggered.connect(self.update_yolo_tiling)
+        self.a_configure_yolo_tiling = QAction("Configure tiled inference...", self)
+        self.a_configure_yolo_tiling.setStatusTip("Set the tile size, overlap and merge method of tiled inference")
+        self.a_configure_yolo_tiling.triggered.connect(self.configure_yolo_tiling)
+
+        self.a_quantize_yolo_model = QAction("Quantize YOLO model to int8...", self)
+        self.a_quantize_yolo_model.setStatusTip(
+            "Make a faster int8 version of the model for CPU-only machines, calibrated on the opened images"
+        )
+        self.a_quantize_yolo_model.triggered.connect(self.quantize_yolo_model)
+        self.a_toggle_yolo_int8 = QAction("Use int8 quantized YOLO model", self)
+        self.a_toggle_yolo_int8.setCheckable(True)
+        self.a_toggle_yolo_int8.setChecked(settings.get(SETTING_AUTO_ANNOTATE_INT8, False))
+        self.a_toggle_yolo_int8.setStatusTip("Auto-annotate with the int8 version of the model if there is one")
+        self.a_toggle_yolo_int8.triggered.connect(self.toggle_yolo_int8)
+        self.quantization_dialog = None
+        self.quantizationFinished.connect(self.on_quantization_finished)
+        self.yolo_models = YOLOModelManager(
+            conf_threshold=self.settings.get(SETTING_AUTO_ANNOTATE_CONF, 0.25),
+            tiling=self.yolo_tiling_config(),
+            quantized=self.a_toggle_yolo_int8.isChecked(),
+        )
+        self.batch_engine = None
+        self.batch_progress_dialog = None
+
+        self.a_toggle_pre_annotation = QAction("Pre-annotate upcoming images", self)
+        self.a_toggle_pre_annotation.setCheckable(True)
+        self.a_toggle_pre_annotation.setChecked(settings.get(SETTING_AUTO_ANNOTATE_PREFETCH, False))
+        self.a_toggle_pre_annotation.setStatusTip(
+            "Run YOLO on the next unlabelled images in the background and show its boxes when they are opened"
+        )
+        self.a_toggle_pre_annotation.triggered.connect(self.toggle_pre_annotation)
+        self.a_toggle_merge_auto_annotations = QAction("Merge auto-annotations with existing boxes", self)
+        self.a_toggle_merge_auto_annotations.setCheckable(True)
+        self.a_toggle_merge_auto_annotations.setChecked(settings.get(SETTING_AUTO_ANNOTATE_MERGE, False))
+        self.a_toggle_merge_auto_annotations.setStatusTip(
+            "Keep the existing boxes and only add detected boxes that do not overlap them"
+        )
+        self.a_toggle_flag_disagreements = QAction("Flag label disagreements", self)
+        self.a_toggle_flag_disagreements.setCheckable(True)
+        self.a_toggle_flag_disagreements.setChecked(settings.get(SETTING_AUTO_ANNOTATE_FLAG_DISAGREEMENTS, True))
+        self.a_toggle_flag_disagreements.setStatusTip(
+            "When merging, highlight existing boxes whose label differs from the detected one"
+        )
+        self.pre_annotator = PreAnnotationWorker(self.yolo_models.get, self.preAnnotationReady.emit)
+        self.preAnnotationReady.connect(self.on_pre_annotation_ready)
+        self.batchAnnotationProgress.connect(self.on_batch_annotation_progress)
+        self.batchAnnotationFinished.connect(self.on_batch_annotation_finished)
+
         self.menus = Menus(
             m_file=self.menu(self.get_str("menu_file")),
             m_edit=self.menu(self.get_str("menu_edit")),
@@ -734,6 +896,68 @@ class MainWindow(QMainWindow, WindowMixin):
         self.a_toggle_display_label_option.setCheckable(True)
         self.a_toggle_display_label_option.setChecked(settings.get(SETTING_PAINT_LABEL, False))
         self.a_toggle_display_label_option.triggered.connect(self.toggle_paint_labels_option)
+        # Move deleted images into a recoverable trash folder instead of removing them
+        self.a_toggle_delete_to_trash = QAction("Move deleted images to trash", self)
+        self.a_toggle_delete_to_trash.setCheckable(True)
+        self.a_toggle_delete_to_trash.setChecked(settings.get(SETTING_DELETE_TO_TRASH, False))
+        self.trash = Trash()
+
+        # Keep the file list in sync with images and labels changed by other processes
+        self.dataset_watcher = DatasetWatcher(self.supported_image_extensions(), self)
+        self.dataset_watcher.imagesChanged.connect(self.on_dataset_images_changed)
+        self.dataset_watcher.labelsChanged.connect(self.on_dataset_labels_changed)
+
+        # Data computed from the images of the opened directory, e.g. uncertainty scores
+        self.dataset_index = None
+        # Boxes read from the label files of the opened directory
+        self.label_cache = None
+        self.a_toggle_review_uncertain = QAction("Review most uncertain images first", self)
+        self.a_toggle_review_uncertain.setCheckable(True)
+        self.a_toggle_review_uncertain.setChecked(settings.get(SETTING_REVIEW_BY_UNCERTAINTY, False))
+        self.a_toggle_review_uncertain.setStatusTip(
+            "Go to the next / previous image in order of how unsure YOLO was about them"
+        )
+        self.a_toggle_review_uncertain.triggered.connect(self.toggle_review_uncertain)
+        self._review_order = None
+        self._review_positions = None
+        self.a_interpolate_keyframes = QAction("Interpolate boxes between keyframes", self)
+        self.a_interpolate_keyframes.setStatusTip(
+            "Label the images between hand-labelled keyframes by moving the boxes of the keyframes linearly"
+        )
+        self.a_interpolate_keyframes.triggered.connect(self.interpolate_keyframes)
+        self.interpolation_dialog = None
+        self.interpolationFinished.connect(self.on_interpolation_finished)
+        self.a_export_coco = QAction("Export dataset as COCO JSON...", self)
+        self.a_export_coco.setStatusTip("Write the labels of all images of the opened directory to one COCO file")
+        self.a_export_coco.triggered.connect(self.export_coco)
+        self.a_import_coco = QAction("Import COCO JSON...", self)
+        self.a_import_coco.setStatusTip(
+            "Write a label file in the selected format for every image of the opened directory in a COCO file"
+        )
+        self.a_import_coco.triggered.connect(self.import_coco)
+        self.a_export_snapshot = QAction("Export dataset snapshot...", self)
+        self.a_export_snapshot.setStatusTip(
+            "Compile the boxes of all images of the opened directory into one .npz or .parquet file for analysis"
+        )
+        self.a_export_snapshot.triggered.connect(self.export_snapshot)
+        self.a_lint_dataset = QAction("Check labels...", self)
+        self.a_lint_dataset.setStatusTip(
+            "Find boxes outside the image or without area, unknown classes, decimal commas, label files "
+            "without an image and wrong image sizes in the label files of the opened directory"
+        )
+        self.a_lint_dataset.triggered.connect(self.lint_dataset)
+        self.lintFinished.connect(self.on_lint_finished)
+        self.a_find_duplicates = QAction("Find duplicate images...", self)
+        self.a_find_duplicates.setStatusTip(
+            "Group the near-duplicate images of the opened directory by perceptual hash to delete them in bulk"
+        )
+        self.a_find_duplicates.triggered.connect(self.find_duplicate_images)
+        self.duplicatesFound.connect(self.on_duplicates_found)
+        self.dataset_dialog = None
+        self.cocoExportFinished.connect(self.on_coco_export_finished)
+        self.cocoImportRead.connect(self.on_coco_import_read)
+        self.cocoImportFinished.connect(self.on_coco_import_finished)
+        self.snapshotExportFinished.connect(self.on_snapshot_export_finished)
 
         add_actions(
             self.menus.m_file,
@@ -743,6 +967,12 @@ class MainWindow(QMainWindow, WindowMixin):
                 change_label_dir,
                 a_open_annotation,
                 a_copy_prev_bounding,
+                self.a_interpolate_keyframes,
+                self.a_export_coco,
+                self.a_import_coco,
+                self.a_export_snapshot,
+                self.a_lint_dataset,
+                self.a_find_duplicates,
                 self.menus.m_recent_files,
                 a_save,
                 a_label_format_change,
@@ -750,6 +980,7 @@ class MainWindow(QMainWindow, WindowMixin):
                 a_close,
                 a_reset_all,
                 a_delete_image,
+                self.a_toggle_delete_to_trash,
                 a_quit,
             ),
         )
@@ -761,9 +992,21 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.a_toggle_single_class_mode,
                 self.a_toggle_display_label_option,
                 a_labels_toggle,
+                a_statistics_toggle,
                 a_toggle_advanced_mode,
                 None,
                 self.a_auto_annotate_all,
+                self.a_reload_yolo_model,
+                self.a_set_yolo_confidence,
+                self.a_set_yolo_workers,
+                self.a_toggle_pre_annotation,
+                self.a_toggle_merge_auto_annotations,
+                self.a_toggle_flag_disagreements,
+                self.a_toggle_review_uncertain,
+                self.a_toggle_yolo_tiling,
+                self.a_configure_yolo_tiling,
+                self.a_quantize_yolo_model,
+                self.a_toggle_yolo_int8,
                 None,
                 a_labels_hide_all,
                 a_labels_show_all,
@@ -936,6 +1179,10 @@ class MainWindow(QMainWindow, WindowMixin):
         if self.file_path and os.path.isdir(self.file_path):
             self.open_dir_dialog(dir_path=self.file_path, silent=True)
 
+        # Load the YOLO model in the background so the first auto-annotation is fast
+        if self.yolo_models.has_model():
+            self.queue_event(self.yolo_models.warm_up_async)
+
     def keyReleaseEvent(self, event, QKeyEvent=None):
         if event.key() == Qt.Key_Control:
             self.canvas.set_drawing_shape_to_square(False)
@@ -1185,7 +1432,7 @@ class MainWindow(QMainWindow, WindowMixin):
         item = self.file_list_widget.currentItem()
         if item is None:
             return
-        self.cur_img_idx = self.img_list.index(ustr(item.text()))
+        self.cur_img_idx = self.file_list_widget.currentRow()
         filename = self.img_list[self.cur_img_idx]
         if filename:
             self.load_file(filename)
@@ -1324,32 +1571,35 @@ class MainWindow(QMainWindow, WindowMixin):
 
         s = []
         for label, points, line_color, fill_color, difficult in shapes:
-            shape = Shape(label=label)
-            for x, y in points:
+            shape = self.shape_from_points(label, points, line_color, fill_color, difficult)
+            s.append(shape)
+            self.add_label(shape)
+        self.update_combo_box()
+        self.canvas.load_shapes(s)
 
-                # Ensure the labels are within the bounds of the image. If not, fix them.
-                x, y, snapped = self.canvas.snap_point_to_canvas(x, y)
-                if snapped:
-                    self.set_dirty()
+    def shape_from_points(self, label, points, line_color=None, fill_color=None, difficult=False):
+        shape = Shape(label=label)
+        for x, y in points:
 
-                shape.add_point(QPointF(x, y))
-            shape.difficult = difficult
-            shape.close()
-            s.append(shape)
+            # Ensure the labels are within the bounds of the image. If not, fix them.
+            x, y, snapped = self.canvas.snap_point_to_canvas(x, y)
+            if snapped:
+                self.set_dirty()
 
-            if line_color:
-                shape.line_color = QColor(*line_color)
-            else:
-                shape.line_color = generate_color_by_text(label)
+            shape.add_point(QPointF(x, y))
+        shape.difficult = difficult
+        shape.close()
 
-            if fill_color:
-                shape.fill_color = QColor(*fill_color)
-            else:
-                shape.fill_color = generate_color_by_text(label)
+        if line_color:
+            shape.line_color = QColor(*line_color)
+        else:
+            shape.line_color = generate_color_by_text(label)
 
-            self.add_label(shape)
-        self.update_combo_box()
-        self.canvas.load_shapes(s)
+        if fill_color:
+            shape.fill_color = QColor(*fill_color)
+        else:
+            shape.fill_color = generate_color_by_text(label)
+        return shape
 
     def update_combo_box(self):
         # Get the unique labels and add them to the Combobox.
@@ -1388,6 +1638,7 @@ class MainWindow(QMainWindow, WindowMixin):
             if os.path.exists(annotation_file_path):
                 try:
                     os.remove(annotation_file_path)
+                    self.dataset_watcher.acknowledge(annotation_file_path)
                     print(f"Label file deleted: {annotation_file_path}")
                 except Exception as e:
                     QMessageBox.warning(self, "Error", f"Failed to delete label file: {str(e)}")
@@ -1433,6 +1684,7 @@ class MainWindow(QMainWindow, WindowMixin):
                     )
                 case _:
                     raise ValueError(f"Unknown label file format: {self.label_file_format}")
+            self.dataset_watcher.acknowledge(annotation_file_path)
             print(
                 "Image: {0} -> Annotation: {1} \nShapes: {2}".format(
                     os.path.basename(self.file_path), os.path.basename(annotation_file_path), shapes
@@ -1619,6 +1871,8 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def load_file(self, file_path=None):
         """Load the specified file, or the last opened file if None."""
+        if file_path is not None and is_video_file(ustr(file_path)):
+            return self.import_video(os.path.abspath(ustr(file_path)))
         self.reset_state()
         self.canvas.setEnabled(False)
         if file_path is None:
@@ -1639,7 +1893,7 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.file_list_widget.clear()
                 self.img_list.clear()
 
-        if unicode_file_path and os.path.exists(unicode_file_path):
+        if unicode_file_path and (os.path.exists(unicode_file_path) or is_frame_path(unicode_file_path)):
             if LabelFile.is_label_file(unicode_file_path):
                 try:
                     self.label_file = LabelFile(unicode_file_path)
@@ -1687,6 +1941,8 @@ class MainWindow(QMainWindow, WindowMixin):
             self.add_recent_file(self.file_path)
             self.toggle_actions(True)
             self.show_bounding_box_from_annotation_file(self.file_path)
+            self.dataset_watcher.watch_files(self.annotation_paths(self.file_path))
+            self.schedule_pre_annotation()
 
             counter = self.counter_str()
             self.setWindowTitle(__appname__ + " " + file_path + " " + counter)
@@ -1695,6 +1951,8 @@ class MainWindow(QMainWindow, WindowMixin):
         return False
 
     def read(self, filename):
+        if is_frame_path(filename):
+            return self.read_video_frame(filename)
         try:
             reader = QImageReader(filename)
             reader.setAutoTransform(True)
@@ -1703,6 +1961,21 @@ class MainWindow(QMainWindow, WindowMixin):
             QMessageBox.warning(self, "Error", f"Failed to read file: {filename}\nError: {str(e)}")
             return None
 
+    def read_video_frame(self, frame_path):
+        video_path, index = parse_frame_path(frame_path)
+        try:
+            source = open_video(video_path)
+        except (IOError, ImportError) as e:
+            QMessageBox.warning(self, "Error", f"Failed to read video: {video_path}\nError: {str(e)}")
+            return QImage()
+        frame = source.read(index)
+        # The user most likely steps to the next frame
+        source.prefetch(index)
+        if frame is None:
+            return QImage()
+        height, width = frame.shape[:2]
+        return QImage(frame.data, width, height, frame.strides[0], QImage.Format_BGR888).copy()
+
     def counter_str(self):
         """
         Converts image counter to string representation.
@@ -1733,11 +2006,26 @@ class MainWindow(QMainWindow, WindowMixin):
 
         return self.try_load_all_formats(file_path, json_path, txt_path, xml_path)
 
+    def label_reader(self):
+        """LabelReader of the current label directory, label cache and class file.
+
+        Background threads get one made on the GUI thread, they never read
+        the window state themselves.
+        """
+        return LabelReader(self.default_label_dir, self.label_cache, self.default_prefdef_class_file)
+
+    def annotation_paths(self, file_path):
+        """All label file paths that may hold annotations of `file_path`."""
+        return self.label_reader().annotation_paths(file_path)
+
     def try_load_all_formats(self, file_path, json_path, txt_path, xml_path) -> bool:
         """Annotation file priority:
             PascalXML > YOLO > CreateML
             Return True if the file was successfully loaded.
             """
+        label_path = next((p for p in (xml_path, txt_path, json_path) if os.path.isfile(p)), None)
+        if label_path is not None and file_path == self.file_path and self.load_cached_labels(label_path):
+            return True
         if os.path.isfile(xml_path):
             return self.load_pascal_xml_by_filename(xml_path)
         elif os.path.isfile(txt_path):
@@ -1812,33 +2100,75 @@ class MainWindow(QMainWindow, WindowMixin):
         settings[SETTING_PAINT_LABEL] = self.a_toggle_display_label_option.isChecked()
         settings[SETTING_DRAW_SQUARE] = self.actions.a_draw_squares_option.isChecked()
         settings[SETTING_LABEL_FILE_FORMAT] = self.label_file_format
+        settings[SETTING_DELETE_TO_TRASH] = self.a_toggle_delete_to_trash.isChecked()
+        settings[SETTING_AUTO_ANNOTATE_TILING] = self.a_toggle_yolo_tiling.isChecked()
+        settings[SETTING_AUTO_ANNOTATE_PREFETCH] = self.a_toggle_pre_annotation.isChecked()
+        settings[SETTING_AUTO_ANNOTATE_MERGE] = self.a_toggle_merge_auto_annotations.isChecked()
+        settings[SETTING_AUTO_ANNOTATE_FLAG_DISAGREEMENTS] = self.a_toggle_flag_disagreements.isChecked()
+        settings[SETTING_REVIEW_BY_UNCERTAINTY] = self.a_toggle_review_uncertain.isChecked()
+        settings[SETTING_AUTO_ANNOTATE_INT8] = self.a_toggle_yolo_int8.isChecked()
         settings.save()
+        self.trash.flush()
+        self.pre_annotator.stop()
+        close_videos()
+        if self.dataset_index is not None:
+            self.dataset_index.close()
+        if self.label_cache is not None:
+            self.label_cache.close()
+        if self.batch_engine is not None:
+            self.batch_engine.cancel()
 
     def load_recent(self, filename):
         if self.may_continue():
             self.load_file(filename)
 
     @staticmethod
-    def scan_all_images(folder_path):
-        extensions = [
+    def supported_image_extensions():
+        return tuple(
             ".%s" % fmt.data().decode("ascii").lower()
             for fmt in QImageReader.supportedImageFormats()
-        ]
+        )
+
+    @staticmethod
+    def scan_all_images(folder_path, listings=None):
+        """Sorted paths of the images and video frames below `folder_path`.
+
+        If `listings` is given, the names in every scanned directory are added
+        to it by directory, for DatasetWatcher.watch to reuse.
+        """
+        extensions = MainWindow.supported_image_extensions()
         images = []
 
         for root, dirs, files in os.walk(folder_path):
+            if listings is not None:
+                listings[root] = set(files).union(dirs)
+            if TRASH_DIR_NAME in dirs:
+                dirs.remove(TRASH_DIR_NAME)
             for file in files:
-                if file.lower().endswith(tuple(extensions)):
+                if file.lower().endswith(extensions):
                     relative_path = os.path.join(root, file)
                     path = ustr(os.path.abspath(relative_path))
                     images.append(path)
+                elif is_video_file(file):
+                    images.extend(MainWindow.video_frame_paths(os.path.abspath(os.path.join(root, file))))
         images.sort()
         return images
 
+    @staticmethod
+    def video_frame_paths(video_path):
+        """Paths of the frames of a video; they are decoded when opened, nothing is extracted."""
+        try:
+            return video_frame_paths(video_path)
+        except (IOError, ImportError) as e:
+            print(f"Unable to read video {video_path}: {e}")
+            return []
+
     def change_label_dir_dialog(self, _value=False):
         if isinstance(_value, str) and os.path.isdir(_value):
             self.default_label_dir = _value
+            self.dataset_watcher.set_label_dir(self.default_label_dir)
             self.show_bounding_box_from_annotation_file(self.file_path)
+            self.compute_statistics()
             self.statusBar().showMessage(
                 "%s . Annotation will be saved to %s"
                 % ("Change saved folder", self.default_label_dir)
@@ -1869,7 +2199,9 @@ class MainWindow(QMainWindow, WindowMixin):
 
         if dir_path is not None and len(dir_path) > 1:
             self.default_label_dir = dir_path
+            self.dataset_watcher.set_label_dir(self.default_label_dir)
             self.show_bounding_box_from_annotation_file(self.file_path)
+            self.compute_statistics()
 
             self.status(
                 "%s . Annotation will be saved to %s"
@@ -1952,6 +2284,7 @@ class MainWindow(QMainWindow, WindowMixin):
 
         if not self.default_label_dir:
             self.default_label_dir = target_dir_path
+            self.dataset_watcher.set_label_dir(self.default_label_dir)
         file_containing_labels = os.path.join(self.default_label_dir, "labels.txt")
         if not self.label_hist:
             self.load_predefined_classes(file_containing_labels)
@@ -1978,11 +2311,96 @@ class MainWindow(QMainWindow, WindowMixin):
         self.dir_name = dir_path
         self.file_path = None
         self.file_list_widget.clear()
-        self.img_list = self.scan_all_images(dir_path)
+        listings = {}
+        self.img_list = self.scan_all_images(dir_path, listings)
+        self._review_order = None
+        self.close_duplicates()
+        self.open_dataset_index(dir_path)
+        self.compute_statistics()
         self.open_next_image()
         for imgPath in self.img_list:
             item = QListWidgetItem(imgPath)
             self.file_list_widget.addItem(item)
+        self.dataset_watcher.watch(dir_path, self.default_label_dir, listings)
+
+    def import_video(self, video_path):
+        """List the frames of `video_path` like the images of a directory and open the first one."""
+        if not self.may_continue():
+            return False
+        frame_paths = self.video_frame_paths(video_path)
+        if not frame_paths:
+            self.error_message("Error opening file", "<p>Make sure <i>%s</i> is a readable video file." % video_path)
+            return False
+
+        dir_path = os.path.dirname(video_path)
+        self.last_open_dir = dir_path
+        self.dir_name = dir_path
+        self.file_path = None
+        self.file_list_widget.clear()
+        self.img_list = frame_paths
+        self._review_order = None
+        self.close_duplicates()
+        self.open_dataset_index(dir_path)
+        self.compute_statistics()
+        self.file_list_widget.addItems(self.img_list)
+        # Other files next to the video are not part of the list
+        self.dataset_watcher.stop()
+        self._jump_to_image_index(0)
+        return self.file_path is not None
+
+    def on_dataset_images_changed(self, added, removed):
+        """Apply images added or removed by other processes to the file list."""
+        if self.dir_name is None:
+            return
+        known = set(self.img_list)
+        added = [p for p in added if p not in known]
+        removed = [p for p in removed if p in known]
+        if not added and not removed:
+            return
+
+        current_path = self.file_path
+        current_removed = current_path in removed
+        self.file_list_widget.blockSignals(True)
+        if len(added) + len(removed) <= self.INCREMENTAL_UPDATE_LIMIT:
+            for path in removed:
+                if path != current_path:
+                    idx = bisect.bisect_left(self.img_list, path)
+                    del self.img_list[idx]
+                    self.file_list_widget.takeItem(idx)
+            for path in added:
+                idx = bisect.bisect_left(self.img_list, path)
+                self.img_list.insert(idx, path)
+                self.file_list_widget.insertItem(idx, QListWidgetItem(path))
+        else:
+            removed = set(removed)
+            removed.discard(current_path)
+            self.img_list = sorted([p for p in self.img_list if p not in removed] + added)
+            self.file_list_widget.clear()
+            self.file_list_widget.addItems(self.img_list)
+        if current_path in self.img_list:
+            self.cur_img_idx = bisect.bisect_left(self.img_list, current_path)
+            self.file_list_widget.setCurrentRow(self.cur_img_idx)
+        self.file_list_widget.blockSignals(False)
+        self._review_order = None
+
+        if current_removed:
+            self.status("%s was removed from disk" % os.path.basename(current_path))
+            self.set_clean()
+            self.remove_image_from_list(current_path)
+        elif self.file_path:
+            self.setWindowTitle(__appname__ + " " + self.file_path + " " + self.counter_str())
+
+    def on_dataset_labels_changed(self, label_paths):
+        """Reload the annotations of the current image if another process changed them."""
+        if not self.file_path or self.dirty:
+            return
+        current_labels = set(self.annotation_paths(self.file_path))
+        if current_labels.isdisjoint(label_paths):
+            return
+        self.load_labels([])
+        self.show_bounding_box_from_annotation_file(self.file_path)
+        self.dataset_watcher.watch_files(current_labels)
+        self.status("Annotations of %s changed on disk" % os.path.basename(self.file_path))
 
     def verify_image(self, _value=False):
         # Proceeding next image without dialog if having any label
@@ -2023,14 +2441,14 @@ class MainWindow(QMainWindow, WindowMixin):
         if not self.is_okay_to_load_new_image():
             return
 
-        self._jump_to_image_index(self.cur_img_idx - 1)
+        self._jump_to_image_index(self.step_image_index(-1))
 
     def open_next_image(self, _value=False):
         # Proceeding next image without dialog if having any label
         if not self.is_okay_to_load_new_image():
             return
 
-        self._jump_to_image_index(self.cur_img_idx + 1)
+        self._jump_to_image_index(self.step_image_index(1))
 
     def open_file(self, _value=False):
         if not self.may_continue():
@@ -2040,9 +2458,10 @@ class MainWindow(QMainWindow, WindowMixin):
             "*.%s" % fmt.data().decode("ascii").lower()
             for fmt in QImageReader.supportedImageFormats()
         ]
-        filters = "Image & Label files (%s)" % " ".join(formats + ["*%s" % LabelFile.suffix])
+        videos = ["*%s" % ext for ext in VIDEO_EXTENSIONS]
+        filters = "Image, Video & Label files (%s)" % " ".join(formats + videos + ["*%s" % LabelFile.suffix])
         filename, _ = QFileDialog.getOpenFileName(
-            self, "%s - Choose Image or Label file" % __appname__, path, filters
+            self, "%s - Choose Image, Video or Label file" % __appname__, path, filters
         )
         if filename:
             if isinstance(filename, (tuple, list)):
@@ -2097,9 +2516,15 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def _save_labels_file(self, annotation_file_path):
         if annotation_file_path and self.save_labels(annotation_file_path):
+            if self.dataset_index is not None:
+                # Labels saved by hand make the image a keyframe
+                self.dataset_index.clear_interpolated([self.file_path])
             self.set_clean()
             self.statusBar().showMessage("Saved to  %s" % annotation_file_path)
             self.statusBar().show()
+        if annotation_file_path:
+            # Also when saving removed the label file
+            self.update_statistics(self.file_path)
 
     def close_file(self, _value=False):
         if not self.may_continue():
@@ -2114,23 +2539,33 @@ class MainWindow(QMainWindow, WindowMixin):
         if not self.file_path:
             QMessageBox.warning(self, "Warning", "No image selected for deletion.")
             return
+
+        delete_path = self.file_path
+        self._delete_image_files(delete_path)
+        # The image is gone, so there is nothing left to save for it.
+        self.set_clean()
+        self.remove_image_from_list(delete_path)
+
+    def _delete_image_files(self, delete_path):
+        """Delete the image `delete_path` and its label file, or move them to the trash."""
+        if self.default_label_dir:
+            label_file_path = os.path.join(
+                self.default_label_dir,
+                os.path.splitext(os.path.basename(delete_path))[0] + LabelFile.suffix,
+            )
         else:
-            delete_path = self.file_path
-            idx = self.cur_img_idx
+            label_file_path = os.path.splitext(delete_path)[0] + LabelFile.suffix
 
-            # Удаление изображения
-            if os.path.exists(delete_path):
+        # Удаление изображения
+        if os.path.exists(delete_path):
+            if self.a_toggle_delete_to_trash.isChecked():
+                image_root = self.last_open_dir or os.path.dirname(delete_path)
+                self.trash.put(delete_path, image_root)
+                if os.path.exists(label_file_path):
+                    self.trash.put(label_file_path, self.default_label_dir or image_root)
+            else:
                 print(f"Deleted image: {delete_path}")
                 os.remove(delete_path)
-
-                if self.default_label_dir:
-                    label_file_path = os.path.join(
-                        self.default_label_dir,
-                        os.path.splitext(os.path.basename(self.file_path))[0] + LabelFile.suffix,
-                    )
-                else:
-                    label_file_path = os.path.splitext(self.file_path)[0] + LabelFile.suffix
-
                 if os.path.exists(label_file_path):
                     try:
                         print(f"Deleted label file: {label_file_path}")
@@ -2138,13 +2573,32 @@ class MainWindow(QMainWindow, WindowMixin):
                     except Exception as e:
                         QMessageBox.warning(self, "Error", f"Failed to delete label file: {str(e)}")
 
-            self.import_dir_images(self.last_open_dir)
-            if len(self.img_list) > 0:
-                self.cur_img_idx = min(idx, len(self.img_list) - 1)
-                filename = self.img_list[self.cur_img_idx]
-                self.load_file(filename)
-            else:
+    def remove_image_from_list(self, path):
+        """Drop `path` from the file list without rescanning the directory.
+
+        Opens the image that took its place, or closes the canvas if the list is now empty.
+        """
+        idx = self.cur_img_idx
+        if not (0 <= idx < len(self.img_list) and self.img_list[idx] == path):
+            if path not in self.img_list:
                 self.close_file()
+                return
+            idx = self.img_list.index(path)
+
+        del self.img_list[idx]
+        self._review_order = None
+        self.file_list_widget.blockSignals(True)
+        self.file_list_widget.takeItem(idx)
+        self.file_list_widget.clearSelection()
+        self.file_list_widget.blockSignals(False)
+
+        if self.img_list:
+            self.cur_img_idx = min(idx, len(self.img_list) - 1)
+            # Triggers `self.file_item_selected()` which loads the image.
+            self.file_list_widget.setCurrentRow(self.cur_img_idx)
+        else:
+            self.cur_img_idx = 0
+            self.close_file()
 
     def reset_all(self):
         self.settings.reset()
@@ -2250,6 +2704,7 @@ class MainWindow(QMainWindow, WindowMixin):
         shapes = t_voc_parse_reader.get_shapes()
         self.load_labels(shapes)
         self.canvas.verified = t_voc_parse_reader.verified
+        self.cache_labels(xml_path, shapes, t_voc_parse_reader.verified)
         return True
 
     def load_yolo_txt_by_filename(self, txt_path) -> bool:
@@ -2262,12 +2717,13 @@ class MainWindow(QMainWindow, WindowMixin):
             return False
 
         self.set_format(LabelFileFormat.YOLO)
-        t_yolo_parse_reader = YoloReader(txt_path, self.image, self.default_prefdef_class_file)
+        t_yolo_parse_reader = YoloReader(txt_path, LabelFile.image_shape(self.image), self.default_prefdef_class_file)
         shapes = t_yolo_parse_reader.get_shapes()
 
         # print(os.path.basename(txt_path), shapes)
         self.load_labels(shapes)
         self.canvas.verified = t_yolo_parse_reader.verified
+        self.cache_labels(txt_path, shapes, t_yolo_parse_reader.verified)
         return True
 
     def load_create_ml_json_by_filename(self, json_path, file_path) -> bool:
@@ -2285,8 +2741,37 @@ class MainWindow(QMainWindow, WindowMixin):
         shapes = create_ml_parse_reader.get_shapes()
         self.load_labels(shapes)
         self.canvas.verified = create_ml_parse_reader.verified
+        self.cache_labels(json_path, shapes, create_ml_parse_reader.verified)
         return True
 
+    def label_class_file(self, label_path):
+        """The class list YOLO label file `label_path` is read with, None for the other formats."""
+        return self.label_reader().label_class_file(label_path)
+
+    def load_cached_labels(self, label_path) -> bool:
+        """Show the boxes of the current image from the label cache.
+
+        Returns False if they are not cached or `label_path` changed since.
+        """
+        if self.label_cache is None:
+            return False
+        cached = self.label_cache.get(self.file_path, label_path, self.label_class_file(label_path))
+        if cached is None:
+            return False
+        self.set_format(self.LABEL_FORMAT_OF_EXT[os.path.splitext(label_path)[1]])
+        self.load_labels([(s['label'], s['points'], None, None, s['difficult']) for s in cached.shapes()])
+        self.canvas.verified = cached.verified
+        return True
+
+    def cache_labels(self, label_path, shapes, verified):
+        """Store the reader shapes just read from `label_path` in the label cache, if it describes the current image."""
+        if self.label_cache is None or label_path not in self.annotation_paths(self.file_path):
+            return
+        shapes = [dict(label=label, points=points, difficult=difficult)
+                  for label, points, _line_color, _fill_color, difficult in shapes]
+        self.label_cache.put(self.file_path, label_path, LabelFile.image_shape(self.image), shapes, verified,
+                             self.label_class_file(label_path))
+
     def copy_previous_bounding_boxes(self):
         current_index = self.img_list.index(self.file_path)
         if current_index - 1 >= 0:
@@ -2294,6 +2779,542 @@ class MainWindow(QMainWindow, WindowMixin):
             self.show_bounding_box_from_annotation_file(prev_file_path)
             self.save_labels_file()
 
+    def read_label_shapes(self, file_path):
+        """Shape dicts, [height, width, depth] and verified flag of `file_path` from its label file.
+
+        The canvas is not touched and only the image header is read. Returns
+        None if the image has no label file.
+        """
+        return self.label_reader().read_label_shapes(file_path)
+
+    def cached_labels(self, file_path):
+        """CachedLabels of `file_path`, parsing its label file into the label cache first if it changed.
+
+        Returns None if the image has no label file or there is no label cache.
+        """
+        return self.label_reader().cached_labels(file_path)
+
+    def compute_statistics(self):
+        """Count the boxes of all images of the opened directory in the background, if the statistics are shown."""
+        self._stats_generation += 1
+        self.dataset_stats = None
+        self._stats_saved_paths.clear()
+        if not self.stats_dock.isVisible():
+            return
+        if not self.img_list:
+            self.stats_browser.setPlainText("Open a directory to see its statistics.")
+            return
+        self.stats_browser.setPlainText("Counting the boxes of %d images..." % len(self.img_list))
+        threading.Thread(
+            target=self._run_statistics,
+            args=(self._stats_generation, list(self.img_list), self.dir_name, self.label_reader()),
+            name="labelImg-statistics",
+            daemon=True,
+        ).start()
+
+    def _run_statistics(self, generation, image_paths, image_root, label_reader):
+        try:
+            builder = SnapshotBuilder(image_root)
+            for image_path in image_paths:
+                if generation != self._stats_generation:
+                    # Another directory was opened meanwhile
+                    return
+                cached = label_reader.cached_labels(image_path)
+                if cached is not None:
+                    builder.add_boxes(image_path, cached.image_shape, cached.labels(), cached.boxes,
+                                      cached.difficult, cached.verified)
+                    continue
+                labels = label_reader.read_label_shapes(image_path)
+                if labels is None:
+                    builder.add_image(image_path, [0, 0, 0], [])
+                else:
+                    shapes, image_shape, verified = labels
+                    builder.add_image(image_path, image_shape, shapes, verified)
+            result = DatasetStats(image_paths, builder.arrays())
+        except Exception as e:
+            result = e
+        self.statisticsReady.emit((generation, result))
+
+    def on_statistics_ready(self, result):
+        generation, stats = result
+        if generation != self._stats_generation:
+            return
+        if isinstance(stats, Exception):
+            self.stats_browser.setPlainText("Unable to count the boxes: %s" % stats)
+            return
+        self.dataset_stats = stats
+        for path in self._stats_saved_paths:
+            self.update_statistics(path, show=False)
+        self._stats_saved_paths.clear()
+        self.stats_browser.setHtml(stats_html(stats))
+
+    def on_statistics_visibility_changed(self, visible):
+        if visible and self.dataset_stats is None:
+            self.compute_statistics()
+
+    def update_statistics(self, file_path, show=True):
+        """Count the labels of `file_path` as they are on disk now, without counting the other images again."""
+        if self.dataset_stats is None:
+            if self.stats_dock.isVisible():
+                # Applied once counting finishes
+                self._stats_saved_paths.add(file_path)
+            return
+        cached = self.cached_labels(file_path)
+        if cached is not None:
+            self.dataset_stats.replace_image(file_path, cached.labels(), cached.boxes, cached.image_shape)
+        else:
+            labels = self.read_label_shapes(file_path)
+            shapes, image_shape, _verified = labels if labels is not None else ([], [0, 0, 0], False)
+            boxes = [(min(p[0] for p in s['points']), min(p[1] for p in s['points']),
+                      max(p[0] for p in s['points']), max(p[1] for p in s['points'])) for s in shapes]
+            self.dataset_stats.replace_image(file_path, [s['label'] for s in shapes], boxes, image_shape)
+        if show:
+            self.stats_browser.setHtml(stats_html(self.dataset_stats))
+
+    def interpolate_keyframes(self, _value=False):
+        """Write unverified labels for the images between keyframes.
+
+        Keyframes are the images whose labels were not interpolated; every
+        image between two of them of the same video, or among the plain
+        images of the same directory, gets the boxes of both keyframes moved
+        linearly, replacing the labels of an earlier interpolation.
+        """
+        if not self.img_list or not self.may_continue():
+            return
+        interpolated = self.dataset_index.interpolated() if self.dataset_index is not None else set()
+
+        dialog = QProgressDialog("Interpolating boxes between keyframes...", None, 0, 0, self)
+        dialog.setWindowTitle("Interpolate boxes between keyframes")
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        dialog.show()
+        self.interpolation_dialog = dialog
+        self.a_interpolate_keyframes.setEnabled(False)
+        threading.Thread(
+            target=self._run_interpolation,
+            args=(list(self.img_list), interpolated, self.label_file_format, list(self.label_hist),
+                  self.label_reader()),
+            name="labelImg-interpolate",
+            daemon=True,
+        ).start()
+
+    def _run_interpolation(self, image_paths, interpolated, label_format, class_list, label_reader):
+        from libs.interpolation import interpolate_sequence
+        try:
+            # Every video and the plain images of every directory are sequences of their own,
+            # boxes never move from one video to the next or between videos and images
+            sequences = {}
+            for path in image_paths:
+                frame = parse_frame_path(path)
+                key = ('video', frame[0]) if frame is not None else ('images', os.path.dirname(path))
+                sequences.setdefault(key, []).append(path)
+            frames = {}
+            keyframe_count = 0
+            for sequence in sequences.values():
+                keyframes = {}
+                image_shapes = {}
+                for i, path in enumerate(sequence):
+                    if path in interpolated:
+                        continue
+                    labels = label_reader.read_label_shapes(path)
+                    if labels is not None:
+                        keyframes[i], image_shapes[i], _verified = labels
+                keyframe_count += len(keyframes)
+                frames.update(interpolate_sequence(sequence, keyframes, image_shapes))
+
+            # Interpolated frames are written unverified
+            label_file = LabelFile()
+            written = {}
+            failed = 0
+            for path, (shapes, image_shape) in frames.items():
+                target = batch_annotate.label_file_path(path, label_format, label_reader.label_dir)
+                try:
+                    for stale in label_reader.annotation_paths(path):
+                        if stale != target and os.path.isfile(stale):
+                            os.remove(stale)
+                    if shapes:
+                        label_file.save_with_image_shape(label_format, target, shapes, path, image_shape, class_list)
+                    elif os.path.isfile(target):
+                        os.remove(target)
+                except (OSError, ValueError) as e:
+                    print(f"Unable to write interpolated labels of {path}: {e}")
+                    failed += 1
+                    continue
+                written[path] = target
+        except Exception as e:
+            self.interpolationFinished.emit(e)
+        else:
+            self.interpolationFinished.emit((written, keyframe_count, failed, class_list))
+
+    def on_interpolation_finished(self, result):
+        self.interpolation_dialog.close()
+        self.interpolation_dialog = None
+        self.a_interpolate_keyframes.setEnabled(True)
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "Interpolation Failed", str(result))
+            return
+        written, keyframe_count, failed, class_list = result
+        for target in written.values():
+            self.dataset_watcher.acknowledge(target)
+        if self.dataset_index is not None:
+            self.dataset_index.set_interpolated(list(written))
+        for label in class_list:
+            if label not in self.label_hist:
+                self.label_hist.append(label)
+        if self.file_path in written and not self.dirty:
+            self.load_labels([])
+            self.show_bounding_box_from_annotation_file(self.file_path)
+
+        summary = "Interpolated %d images between %d keyframes." % (len(written), keyframe_count)
+        if failed:
+            summary += "\n%d images failed." % failed
+        QMessageBox.information(self, "Interpolation", summary)
+
+    def _show_dataset_dialog(self, title, text):
+        """Busy dialog of an import or export of the whole dataset, one at a time."""
+        dialog = QProgressDialog(text, None, 0, 0, self)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        dialog.show()
+        self.dataset_dialog = dialog
+        for action in (self.a_export_coco, self.a_import_coco, self.a_export_snapshot, self.a_lint_dataset,
+                       self.a_find_duplicates):
+            action.setEnabled(False)
+
+    def _close_dataset_dialog(self):
+        self.dataset_dialog.close()
+        self.dataset_dialog = None
+        for action in (self.a_export_coco, self.a_import_coco, self.a_export_snapshot, self.a_lint_dataset,
+                       self.a_find_duplicates):
+            action.setEnabled(True)
+
+    def export_coco(self, _value=False):
+        """Write the labels of every labelled image of the opened directory to one COCO file."""
+        if not self.img_list or not self.may_continue():
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export dataset as COCO JSON", os.path.join(self.dir_name, "annotations.json"),
+            "COCO JSON (*.json)")
+        if not path:
+            return
+        self._show_dataset_dialog("COCO JSON", "Exporting labels to COCO JSON...")
+        threading.Thread(
+            target=self._run_coco_export,
+            args=(list(self.img_list), path, self.dir_name, list(self.label_hist), self.label_reader()),
+            name="labelImg-coco-export",
+            daemon=True,
+        ).start()
+
+    def _run_coco_export(self, image_paths, path, image_root, class_list, label_reader):
+        from libs.coco_io import export_coco
+
+        def labelled_images():
+            for image_path in image_paths:
+                labels = label_reader.read_label_shapes(image_path)
+                if labels is not None:
+                    shapes, image_shape, _verified = labels
+                    yield image_path, image_shape, shapes
+
+        try:
+            image_count, annotation_count = export_coco(labelled_images(), path, image_root, class_list)
+        except Exception as e:
+            self.cocoExportFinished.emit(e)
+        else:
+            self.cocoExportFinished.emit((path, image_count, annotation_count))
+
+    def on_coco_export_finished(self, result):
+        self._close_dataset_dialog()
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "COCO Export Failed", str(result))
+            return
+        path, image_count, annotation_count = result
+        QMessageBox.information(
+            self, "COCO Export", "Exported %d boxes of %d images to\n%s" % (annotation_count, image_count, path))
+
+    def import_coco(self, _value=False):
+        """Write label files for the images of the opened directory from a COCO file.
+
+        File names in the COCO file are relative to the opened directory.
+        Categories that are not in the class list yet are added to it. If
+        images already have label files, the user chooses to replace or keep
+        them before anything is written.
+        """
+        if not self.img_list or not self.may_continue():
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Import COCO JSON", self.dir_name, "COCO JSON (*.json)")
+        if not path:
+            return
+        self._show_dataset_dialog("COCO JSON", "Reading COCO JSON...")
+        threading.Thread(
+            target=self._run_coco_read,
+            args=(path, self.dir_name, self.label_file_format, self.default_label_dir, list(self.label_hist)),
+            name="labelImg-coco-import",
+            daemon=True,
+        ).start()
+
+    def _run_coco_read(self, path, image_root, label_format, label_dir, class_list):
+        from libs.coco_io import CocoImport
+        try:
+            coco = CocoImport(path, image_root, label_format, label_dir, class_list)
+            try:
+                existing = coco.count_existing()
+            except BaseException:
+                coco.close()
+                raise
+        except Exception as e:
+            self.cocoImportRead.emit(e)
+        else:
+            self.cocoImportRead.emit((coco, existing))
+
+    def on_coco_import_read(self, result):
+        if isinstance(result, Exception):
+            self._close_dataset_dialog()
+            QMessageBox.critical(self, "COCO Import Failed", str(result))
+            return
+        coco, existing = result
+        skip_existing = False
+        if existing:
+            box = QMessageBox(self)
+            box.setWindowTitle("Import COCO JSON")
+            box.setIcon(QMessageBox.Warning)
+            box.setText("%d of the %d images in the COCO file already have label files.\n"
+                        "Replace them with the COCO annotations, or keep them and import only the other images?"
+                        % (existing, coco.result.images))
+            replace_button = box.addButton("Replace %d label files" % existing, QMessageBox.DestructiveRole)
+            keep_button = box.addButton("Keep existing label files", QMessageBox.AcceptRole)
+            box.addButton(QMessageBox.Cancel)
+            box.setDefaultButton(keep_button)
+            self.dataset_dialog.hide()
+            box.exec_()
+            self.dataset_dialog.show()
+            if box.clickedButton() not in (replace_button, keep_button):
+                coco.close()
+                self._close_dataset_dialog()
+                return
+            skip_existing = box.clickedButton() is keep_button
+        self.dataset_dialog.setLabelText("Importing labels from COCO JSON...")
+        threading.Thread(
+            target=self._run_coco_import,
+            args=(coco, skip_existing),
+            name="labelImg-coco-import",
+            daemon=True,
+        ).start()
+
+    def _run_coco_import(self, coco, skip_existing):
+        try:
+            result = coco.write(skip_existing)
+        except Exception as e:
+            self.cocoImportFinished.emit(e)
+        else:
+            self.cocoImportFinished.emit(result)
+        finally:
+            coco.close()
+
+    def on_coco_import_finished(self, result):
+        self._close_dataset_dialog()
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "COCO Import Failed", str(result))
+            return
+        for target in result.written:
+            self.dataset_watcher.acknowledge(target)
+        for label in result.class_list:
+            if label not in self.label_hist:
+                self.label_hist.append(label)
+        if self.file_path is not None and not self.dirty:
+            self.load_labels([])
+            self.show_bounding_box_from_annotation_file(self.file_path)
+
+        summary = "Wrote %d label files for %d boxes of %d images." % (
+            len(result.written), result.annotations, result.images)
+        if result.skipped:
+            summary += "\nKept the existing label files of %d images." % result.skipped
+        if result.failed:
+            summary += "\n%d problems, see the console." % result.failed
+            for error in result.errors:
+                print(error)
+        QMessageBox.information(self, "COCO Import", summary)
+
+    def export_snapshot(self, _value=False):
+        """Compile the boxes of every labelled image of the opened directory into one snapshot file."""
+        if not self.img_list or not self.may_continue():
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export dataset snapshot", os.path.join(self.dir_name, "snapshot.npz"),
+            "NumPy snapshot (*.npz);;Parquet snapshot (*.parquet)")
+        if not path:
+            return
+        self._show_dataset_dialog("Dataset snapshot", "Compiling the boxes of all images...")
+        threading.Thread(
+            target=self._run_snapshot_export,
+            args=(list(self.img_list), path, self.dir_name, list(self.label_hist), self.label_reader()),
+            name="labelImg-snapshot-export",
+            daemon=True,
+        ).start()
+
+    def _run_snapshot_export(self, image_paths, path, image_root, class_list, label_reader):
+        try:
+            builder = SnapshotBuilder(image_root, class_list)
+            for image_path in image_paths:
+                labels = label_reader.read_label_shapes(image_path)
+                if labels is not None:
+                    shapes, image_shape, verified = labels
+                    builder.add_image(image_path, image_shape, shapes, verified)
+            box_count = builder.save(path)
+        except Exception as e:
+            self.snapshotExportFinished.emit(e)
+        else:
+            self.snapshotExportFinished.emit((path, len(builder.images), box_count))
+
+    def on_snapshot_export_finished(self, result):
+        self._close_dataset_dialog()
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "Snapshot Export Failed", str(result))
+            return
+        path, image_count, box_count = result
+        QMessageBox.information(
+            self, "Dataset snapshot", "Compiled %d boxes of %d images into\n%s" % (box_count, image_count, path))
+
+    def lint_dataset(self, _value=False):
+        """Check the label files of the opened directory, then offer to fix the mechanical problems."""
+        if not self.img_list or not self.may_continue():
+            return
+        self._start_lint(fix=False)
+
+    def _start_lint(self, fix):
+        self._show_dataset_dialog("Check labels", "Fixing label files..." if fix else "Checking label files...")
+        threading.Thread(
+            target=self._run_lint,
+            args=(self.default_label_dir or self.dir_name, self.dir_name, fix),
+            name="labelImg-lint",
+            daemon=True,
+        ).start()
+
+    def _run_lint(self, label_dir, image_dir, fix):
+        from libs.lint import lint
+        try:
+            report = lint(label_dir, image_dir, fix=fix)
+        except Exception as e:
+            self.lintFinished.emit(e)
+        else:
+            self.lintFinished.emit(report)
+
+    def on_lint_finished(self, report):
+        self._close_dataset_dialog()
+        if isinstance(report, Exception):
+            QMessageBox.critical(self, "Check Labels Failed", str(report))
+            return
+        if report.fixed_files:
+            self.on_dataset_labels_changed({issue.path for issue in report.issues if issue.fixed})
+            self.compute_statistics()
+
+        box = QMessageBox(self)
+        box.setWindowTitle("Check labels")
+        box.setText(report.summary())
+        if report.issues:
+            box.setDetailedText("\n".join(
+                "%s: %s: %s%s" % (os.path.basename(issue.path), issue.kind, issue.message,
+                                  " (fixed)" if issue.fixed else "")
+                for issue in report.issues[:self.LINT_DETAILS_LIMIT]
+            ))
+        fix_button = box.addButton("Fix %d issues" % report.fixable, QMessageBox.AcceptRole) \
+            if report.fixable else None
+        box.addButton(QMessageBox.Close)
+        box.exec_()
+        if fix_button is not None and box.clickedButton() is fix_button:
+            self._start_lint(fix=True)
+
+    def find_duplicate_images(self, _value=False):
+        """Group the near-duplicate images of the opened directory and list the groups under the file list."""
+        if not self.img_list or not self.may_continue():
+            return
+        self._show_dataset_dialog("Find duplicate images", "Hashing images...")
+        threading.Thread(
+            target=self._run_find_duplicates,
+            # Neighbouring frames of a video would all match each other
+            args=([path for path in self.img_list if not is_frame_path(path)], self.dataset_index),
+            name="labelImg-dedup",
+            daemon=True,
+        ).start()
+
+    def _run_find_duplicates(self, image_paths, dataset_index):
+        from libs.dedup import find_duplicates
+        try:
+            report = find_duplicates(image_paths, index=dataset_index)
+        except Exception as e:
+            self.duplicatesFound.emit(e)
+        else:
+            self.duplicatesFound.emit(report)
+
+    def on_duplicates_found(self, report):
+        self._close_dataset_dialog()
+        if isinstance(report, Exception):
+            QMessageBox.critical(self, "Find Duplicate Images Failed", str(report))
+            return
+        for path in report.failed:
+            print(f"Unable to read {path}")
+        if not report.groups:
+            QMessageBox.information(self, "Find duplicate images", report.summary())
+            return
+
+        self.duplicate_tree.clear()
+        for number, group in enumerate(report.groups, 1):
+            group_item = QTreeWidgetItem(["Group %d: %d images" % (number, len(group))])
+            group_item.setFlags(Qt.ItemIsEnabled)
+            for position, path in enumerate(group):
+                item = QTreeWidgetItem([os.path.relpath(path, self.dir_name)])
+                item.setToolTip(0, path)
+                item.setData(0, Qt.UserRole, path)
+                # The largest file of each group is kept unless unchecked
+                item.setCheckState(0, Qt.Unchecked if position == 0 else Qt.Checked)
+                group_item.addChild(item)
+            self.duplicate_tree.addTopLevelItem(group_item)
+        self.duplicate_tree.expandAll()
+        self.duplicate_panel.show()
+        self.file_dock.show()
+        self.status(report.summary())
+
+    def duplicate_item_selected(self, item, _previous=None):
+        path = item.data(0, Qt.UserRole) if item is not None else None
+        if path is None:
+            return
+        idx = bisect.bisect_left(self.img_list, path)
+        if idx < len(self.img_list) and self.img_list[idx] == path:
+            self._jump_to_image_index(idx)
+
+    def checked_duplicates(self):
+        """Paths of the checked images of the duplicate groups."""
+        paths = []
+        for i in range(self.duplicate_tree.topLevelItemCount()):
+            group_item = self.duplicate_tree.topLevelItem(i)
+            for j in range(group_item.childCount()):
+                item = group_item.child(j)
+                if item.checkState(0) == Qt.Checked:
+                    paths.append(item.data(0, Qt.UserRole))
+        return paths
+
+    def delete_checked_duplicates(self, _value=False):
+        paths = self.checked_duplicates()
+        if not paths:
+            return
+        if self.a_toggle_delete_to_trash.isChecked():
+            question = "Move %d images and their label files to the trash?" % len(paths)
+        else:
+            question = "Delete %d images and their label files?" % len(paths)
+        answer = QMessageBox.question(self, "Delete duplicate images", question, QMessageBox.Yes | QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            return
+        for path in paths:
+            self._delete_image_files(path)
+        self.on_dataset_images_changed([], paths)
+        self.close_duplicates()
+        self.compute_statistics()
+        self.status("Deleted %d duplicate images" % len(paths))
+
+    def close_duplicates(self, _value=False):
+        self.duplicate_tree.clear()
+        self.duplicate_panel.hide()
+
     def toggle_paint_labels_option(self):
         for shape in self.canvas.shapes:
             shape.paint_label = self.a_toggle_display_label_option.isChecked()
@@ -2301,22 +3322,202 @@ class MainWindow(QMainWindow, WindowMixin):
     def toggle_draw_square(self):
         self.canvas.set_drawing_shape_to_square(self.actions.a_draw_squares_option.isChecked())
 
+    def get_yolo_annotator(self, force_reload=False):
+        """Return the shared YOLO annotator, or None after telling the user why it is unavailable."""
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            return self.yolo_models.get(force_reload)
+        except FileNotFoundError as e:
+            title, error = "Model Not Found", str(e)
+        except ImportError as e:
+            title, error = "Missing Dependency", "The inference library for this model is not installed:\n%s" % e
+        finally:
+            QApplication.restoreOverrideCursor()
+        QMessageBox.warning(self, title, error)
+        return None
+
+    def reload_yolo_model(self):
+        self.pre_annotator.clear()
+        if self.get_yolo_annotator(force_reload=True) is not None:
+            self.status("YOLO model reloaded")
+            self.schedule_pre_annotation()
+
+    def set_yolo_confidence(self):
+        conf_threshold, ok = QInputDialog.getDouble(
+            self,
+            "Set YOLO confidence threshold",
+            "Minimum confidence of auto-annotated boxes:",
+            self.yolo_models.conf_threshold,
+            RAW_CONFIDENCE_FLOOR,
+            1.0,
+            2,
+        )
+        if ok:
+            self.yolo_models.set_conf_threshold(conf_threshold)
+            self.settings[SETTING_AUTO_ANNOTATE_CONF] = conf_threshold
+            self.status("YOLO confidence threshold set to %.2f" % conf_threshold)
+
+    def set_yolo_workers(self):
+        workers, ok = QInputDialog.getInt(
+            self,
+            "Set auto-annotate worker processes",
+            "Worker processes for auto-annotating all images\n"
+            "(1 runs the model in labelImg itself, use more on CPU-only machines):",
+            self.settings.get(SETTING_AUTO_ANNOTATE_WORKERS, 1),
+            1,
+            os.cpu_count() or 1,
+        )
+        if ok:
+            self.settings[SETTING_AUTO_ANNOTATE_WORKERS] = workers
+            self.status("Auto-annotation uses %d worker processes" % workers)
+
+    def yolo_tiling_config(self):
+        """TilingConfig from the settings, or None if tiled inference is off."""
+        if not self.a_toggle_yolo_tiling.isChecked():
+            return None
+        # Imported here as numpy is not needed until tiling is used
+        from libs.tiling import TilingConfig
+        return TilingConfig(
+            tile_size=self.settings.get(SETTING_AUTO_ANNOTATE_TILE_SIZE, 640),
+            overlap=self.settings.get(SETTING_AUTO_ANNOTATE_TILE_OVERLAP, 0.2),
+            merge=self.settings.get(SETTING_AUTO_ANNOTATE_TILE_MERGE, 'nms'),
+        )
+
+    def update_yolo_tiling(self):
+        self.yolo_models.set_tiling(self.yolo_tiling_config())
+        self.pre_annotator.clear()
+        self.schedule_pre_annotation()
+
+    def configure_yolo_tiling(self):
+        tile_size, ok = QInputDialog.getInt(
+            self,
+            "Configure tiled inference",
+            "Tile size in pixels (usually the model input size):",
+            self.settings.get(SETTING_AUTO_ANNOTATE_TILE_SIZE, 640),
+            64,
+            8192,
+        )
+        if not ok:
+            return
+        overlap, ok = QInputDialog.getDouble(
+            self,
+            "Configure tiled inference",
+            "Overlap between neighbouring tiles (fraction of the tile size):",
+            self.settings.get(SETTING_AUTO_ANNOTATE_TILE_OVERLAP, 0.2),
+            0.0,
+            0.9,
+            2,
+        )
+        if not ok:
+            return
+        merge_methods = ["nms", "wbf"]
+        merge, ok = QInputDialog.getItem(
+            self,
+            "Configure tiled inference",
+            "Merge boxes found in several tiles with:",
+            merge_methods,
+            merge_methods.index(self.settings.get(SETTING_AUTO_ANNOTATE_TILE_MERGE, "nms")),
+            False,
+        )
+        if not ok:
+            return
+        self.settings[SETTING_AUTO_ANNOTATE_TILE_SIZE] = tile_size
+        self.settings[SETTING_AUTO_ANNOTATE_TILE_OVERLAP] = overlap
+        self.settings[SETTING_AUTO_ANNOTATE_TILE_MERGE] = merge
+        self.a_toggle_yolo_tiling.setChecked(True)
+        self.update_yolo_tiling()
+
+    def toggle_yolo_int8(self):
+        self.yolo_models.quantized = self.a_toggle_yolo_int8.isChecked()
+        self.pre_annotator.clear()
+        self.schedule_pre_annotation()
+
+    def quantize_yolo_model(self):
+        model_path = self.yolo_models.find_model()
+        if model_path is None:
+            QMessageBox.warning(self, "Model Not Found", "Place a .pt or .onnx model in the yolo_model directory first.")
+            return
+        if not self.img_list:
+            QMessageBox.information(self, "No Images", "Open the image directory to calibrate the model on first.")
+            return
+        sample_size, ok = QInputDialog.getInt(
+            self,
+            "Quantize YOLO model to int8",
+            "Calibrate and compare on this many of the opened images:",
+            min(100, len(self.img_list)),
+            1,
+            len(self.img_list),
+        )
+        if not ok:
+            return
+
+        dialog = QProgressDialog("Quantizing %s..." % os.path.basename(model_path), None, 0, 0, self)
+        dialog.setWindowTitle("Quantize YOLO model to int8")
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        dialog.show()
+        self.quantization_dialog = dialog
+        self.a_quantize_yolo_model.setEnabled(False)
+        threading.Thread(
+            target=self._run_quantization,
+            args=(model_path, sample_images(self.img_list, sample_size), self.yolo_models.conf_threshold),
+            name="labelImg-quantize",
+            daemon=True,
+        ).start()
+
+    def _run_quantization(self, model_path, image_paths, conf_threshold):
+        try:
+            quantized_path = quantize_model(model_path, image_paths)
+            report = compare_models(model_path, quantized_path, image_paths, conf_threshold)
+        except Exception as e:
+            self.quantizationFinished.emit(e)
+        else:
+            self.quantizationFinished.emit(report)
+
+    def on_quantization_finished(self, result):
+        self.quantization_dialog.close()
+        self.quantization_dialog = None
+        self.a_quantize_yolo_model.setEnabled(True)
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "Quantization Failed", str(result))
+            return
+        answer = QMessageBox.question(
+            self,
+            "Quantization Complete",
+            result.summary() + "\n\nAuto-annotate with the int8 model?",
+            QMessageBox.Yes | QMessageBox.No,
+        )
+        self.a_toggle_yolo_int8.setChecked(answer == QMessageBox.Yes)
+        self.toggle_yolo_int8()
+
     def auto_annotate(self):
         if not hasattr(self, "file_path") or not self.file_path:
             QMessageBox.warning(self, "Warning", "No image loaded for annotation.")
             return
 
-        try:
-            annotator = YOLOAutoAnnotator()
-        except FileNotFoundError as e:
-            QMessageBox.warning(self, "Model Not Found", str(e))
+        annotator = self.get_yolo_annotator()
+        if annotator is None:
             return
 
-        annotations = annotator.annotate(self.file_path)
+        pre_annotation = self.pre_annotator.get(self.file_path)
+        if pre_annotation is not None:
+            annotations = annotator.filter_detections(pre_annotation[0])
+        else:
+            annotations = annotator.annotate(self.file_path)
         if not annotations:
             QMessageBox.information(self, "No Annotations", "No objects detected.")
             return
+        self.show_auto_annotations(annotations)
+
+    def show_auto_annotations(self, annotations, mark_dirty=True):
+        """Put `annotations` on the canvas.
 
+        Suggestions shown without `mark_dirty` are neither auto-saved nor
+        prompted for when the image is left; saving explicitly keeps them.
+        """
+        if self.a_toggle_merge_auto_annotations.isChecked() and self.canvas.shapes:
+            self.merge_auto_annotations(annotations)
+            return
         shapes = []
         for ann in annotations:
             label = ann["label"]
@@ -2326,39 +3527,230 @@ class MainWindow(QMainWindow, WindowMixin):
             shapes.append(shape_data)
 
         self.load_labels(shapes)
-        self.set_dirty()
+        if mark_dirty:
+            self.set_dirty()
+        else:
+            self.actions.a_save.setEnabled(True)
+
+    def merge_auto_annotations(self, annotations):
+        """Add the detections that match no existing box, keeping all existing boxes."""
+        from libs.box_ops import match_boxes
+
+        existing = self.canvas.shapes
+        existing_boxes = [
+            [min(p.x() for p in s.points), min(p.y() for p in s.points),
+             max(p.x() for p in s.points), max(p.y() for p in s.points)]
+            for s in existing
+        ]
+        matches, _ = match_boxes([ann["bbox"] for ann in annotations], existing_boxes, self.MERGE_IOU_THRESHOLD)
+
+        new_shapes = []
+        disagreements = {}
+        for ann, match in zip(annotations, matches.tolist()):
+            if match < 0:
+                x1, y1, x2, y2 = ann["bbox"]
+                shape = self.shape_from_points(ann["label"], [(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+                new_shapes.append(shape)
+                self.add_label(shape)
+            elif existing[match].label != ann["label"]:
+                disagreements.setdefault(match, ann)
+
+        if self.a_toggle_flag_disagreements.isChecked():
+            for match, ann in disagreements.items():
+                item = self.shapes_to_items[existing[match]]
+                item.setForeground(QColor(200, 0, 0))
+                item.setToolTip("YOLO detected %s (%.2f)" % (ann["label"], ann["confidence"]))
+        if new_shapes:
+            self.canvas.load_shapes(existing + new_shapes)
+            self.update_combo_box()
+            self.set_dirty()
+
+        message = "Added %d of %d detected boxes" % (len(new_shapes), len(annotations))
+        if disagreements:
+            message += ", %d existing boxes have a different label" % len(disagreements)
+        self.status(message)
+
+    def open_dataset_index(self, dir_path):
+        if self.dataset_index is not None:
+            self.dataset_index.close()
+        try:
+            self.dataset_index = DatasetIndex(dir_path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Unable to open the dataset index of {dir_path}: {e}")
+            self.dataset_index = None
+        if self.label_cache is not None:
+            self.label_cache.close()
+        try:
+            self.label_cache = LabelCache(dir_path)
+        except OSError as e:
+            print(f"Unable to open the label cache of {dir_path}: {e}")
+            self.label_cache = None
+
+    def review_order(self):
+        """Indices into img_list by descending uncertainty; images without a score follow in list order."""
+        if self._review_order is None:
+            scores = self.dataset_index.uncertainty() if self.dataset_index is not None else {}
+            paths = self.img_list
+            self._review_order = sorted(range(len(paths)), key=lambda i: -scores.get(paths[i], -1.0))
+            self._review_positions = {idx: pos for pos, idx in enumerate(self._review_order)}
+        return self._review_order
+
+    def step_image_index(self, step):
+        """Index of the image `step` places away from the current one in navigation order."""
+        if not self.a_toggle_review_uncertain.isChecked():
+            return self.cur_img_idx + step
+        order = self.review_order()
+        position = self._review_positions.get(self.cur_img_idx)
+        if position is None:
+            return order[0] if order else -1
+        position += step
+        return order[position] if 0 <= position < len(order) else -1
+
+    def toggle_review_uncertain(self):
+        if self.a_toggle_review_uncertain.isChecked() and self.img_list and self.may_continue():
+            order = self.review_order()
+            self._jump_to_image_index(order[0])
+
+    def toggle_pre_annotation(self):
+        if self.a_toggle_pre_annotation.isChecked():
+            self.schedule_pre_annotation()
+        else:
+            self.pre_annotator.schedule([])
+
+    def schedule_pre_annotation(self):
+        """Queue the current image and the next unlabelled ones for pre-annotation."""
+        if not self.a_toggle_pre_annotation.isChecked() or not self.file_path:
+            return
+        lookahead = self.settings.get(SETTING_AUTO_ANNOTATE_LOOKAHEAD, 4)
+        paths = [self.file_path]
+        if 0 <= self.cur_img_idx < len(self.img_list) and self.img_list[self.cur_img_idx] == self.file_path:
+            paths += self.img_list[self.cur_img_idx + 1:self.cur_img_idx + 1 + lookahead]
+        self.pre_annotator.schedule([
+            path for path in paths
+            if not any(os.path.isfile(p) for p in self.annotation_paths(path))
+        ])
+        self.on_pre_annotation_ready(self.file_path)
+
+    def on_pre_annotation_ready(self, path):
+        """Show the suggestions for the current image if it has no boxes yet."""
+        if path != self.file_path or self.dirty or self.canvas.shapes:
+            return
+        if not self.a_toggle_pre_annotation.isChecked():
+            return
+        pre_annotation = self.pre_annotator.get(path)
+        if pre_annotation is None:
+            return
+        try:
+            annotator = self.yolo_models.get()
+        except (FileNotFoundError, ImportError):
+            return
+        annotations = annotator.filter_detections(pre_annotation[0])
+        if annotations:
+            # Unreviewed suggestions must not be written just because the user flipped past the image
+            self.show_auto_annotations(annotations, mark_dirty=False)
+            self.status("Showing %d boxes suggested by YOLO, save to keep them" % len(annotations))
 
     def auto_annotate_all_images(self):
         if not self.img_list:
             QMessageBox.information(self, "No Images", "No images loaded.")
             return
-
-        try:
-            annotator = YOLOAutoAnnotator()
-        except FileNotFoundError as e:
-            QMessageBox.warning(self, "Model Not Found", str(e))
+        if self.batch_engine is not None:
+            self.status("Auto-annotation is already running")
             return
 
-        for index, imgPath in enumerate(self.img_list):
-            self.file_path = imgPath
-            self.load_file(imgPath)
-
-            annotations = annotator.annotate(imgPath)
-            if not annotations:
-                continue
-
-            shapes = []
-            for ann in annotations:
-                label = ann["label"]
-                x1, y1, x2, y2 = ann["bbox"]
-                points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
-                shapes.append((label, points, None, None, False))
+        batch_size, ok = QInputDialog.getInt(
+            self,
+            "Yolo Auto-Annotate All images",
+            "Annotate %d images with batch size:" % len(self.img_list),
+            self.settings.get(SETTING_AUTO_ANNOTATE_BATCH_SIZE, 8),
+            1,
+            256,
+        )
+        if not ok or not self.may_continue():
+            return
 
-            self.load_labels(shapes)
-            self.save_labels_file()
+        annotator = self.get_yolo_annotator()
+        if annotator is None:
+            return
+        self.settings[SETTING_AUTO_ANNOTATE_BATCH_SIZE] = batch_size
+
+        workers = self.settings.get(SETTING_AUTO_ANNOTATE_WORKERS, 1)
+        if workers > 1:
+            engine = ShardedAnnotationEngine(
+                annotator,
+                self.label_file_format,
+                self.default_label_dir,
+                self.label_hist,
+                batch_size,
+                workers,
+            )
+        else:
+            engine = BatchAnnotationEngine(
+                annotator,
+                self.label_file_format,
+                self.default_label_dir,
+                self.label_hist,
+                batch_size,
+            )
+        self.batch_engine = engine
+        dialog = QProgressDialog("Auto-annotating images...", "Cancel", 0, len(self.img_list), self)
+        dialog.setWindowTitle("Yolo Auto-Annotate All images")
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        dialog.canceled.connect(engine.cancel)
+        dialog.setValue(0)
+        self.batch_progress_dialog = dialog
+        self.a_auto_annotate_all.setEnabled(False)
+
+        # Inference and label writing run off the GUI thread; results come back through signals.
+        threading.Thread(
+            target=self._run_batch_annotation,
+            args=(engine, list(self.img_list)),
+            name="labelImg-batch-annotate",
+            daemon=True,
+        ).start()
+
+    def _run_batch_annotation(self, engine, image_paths):
+        result = engine.run(image_paths, self.batchAnnotationProgress.emit)
+        self.batchAnnotationFinished.emit(result)
+
+    def on_batch_annotation_progress(self, done, total, images_per_second):
+        if self.batch_progress_dialog is None or self.batch_engine.cancelled():
+            return
+        self.batch_progress_dialog.setLabelText(
+            "Annotated %d / %d images (%.1f images/s)" % (done, total, images_per_second)
+        )
+        self.batch_progress_dialog.setValue(done)
 
-        QMessageBox.information(self, "Complete", "All images have been auto-annotated.")
+    def on_batch_annotation_finished(self, result):
+        if result.uncertainty and self.dataset_index is not None:
+            self.dataset_index.set_uncertainty(
+                result.uncertainty, os.path.basename(self.batch_engine.annotator.model_path)
+            )
+            self._review_order = None
+        self.batch_engine = None
+        self.batch_progress_dialog.close()
+        self.batch_progress_dialog = None
+        self.a_auto_annotate_all.setEnabled(True)
+
+        for label in result.class_list:
+            if label not in self.label_hist:
+                self.label_hist.append(label)
+        # Show the new annotations of the current image
+        if self.file_path and not self.dirty:
+            self.load_labels([])
+            self.show_bounding_box_from_annotation_file(self.file_path)
 
+        summary = "Annotated %d of %d images in %.1f s (%.1f images/s)." % (
+            result.annotated, result.total, result.elapsed, result.images_per_second)
+        if result.failed:
+            summary += "\n%d images failed." % result.failed
+        if result.error:
+            QMessageBox.critical(self, "Auto-Annotation Failed", result.error + "\n" + summary)
+        elif result.cancelled:
+            QMessageBox.information(self, "Cancelled", "Auto-annotation was cancelled.\n" + summary)
+        else:
+            QMessageBox.information(self, "Complete", summary)
 
 def inverted(color):
     return QColor(*[255 - v for v in color.getRgb()])
@@ -2383,6 +3775,11 @@ def get_main_app(argv=None):
         nargs="?",
     )
     argparser.add_argument("label_dir", nargs="?")
+    argparser.add_argument(
+        PROFILE_STARTUP_FLAG,
+        action="store_true",
+        help="print a breakdown of the startup time, including module imports",
+    )
     args = argparser.parse_args(argv[1:])
 
     args.image_dir = args.image_dir and os.path.normpath(args.image_dir)
@@ -2391,13 +3788,28 @@ def get_main_app(argv=None):
 
     # Usage : labelImg.py image classFile saveDir
     win = MainWindow(args.image_dir, args.class_file, args.label_dir)
+    if startup_profiler:
+        startup_profiler.mark("main window created")
     win.show()
+    if startup_profiler:
+        startup_profiler.mark("main window shown")
     return app, win
 
 
 def main():
     """construct main app and run it"""
+    global startup_profiler
+    if startup_profiler is None:
+        # Started through the console script, the modules are already imported
+        startup_profiler = StartupProfiler.from_argv(sys.argv)
     app, _win = get_main_app(sys.argv)
+    if startup_profiler:
+        def report_startup():
+            startup_profiler.mark("event loop running")
+            startup_profiler.uninstall()
+            startup_profiler.report()
+
+        QTimer.singleShot(0, report_startup)
     return app.exec_()
 
 
@@ -1,37 +1,226 @@
 # libs/auto_annotate.py
 import os
-import torch
-from ultralytics import YOLO
+import threading
 from pathlib import Path
 
+from libs.inference_backends import MODEL_EXTENSIONS, create_backend
+from libs.quantization import quantized_model_path
+from libs.video_source import imread, is_frame_path, read_frame
+
+# Detections are kept down to this confidence, so the threshold can be changed
+# without running the model again; lower thresholds have no effect.
+RAW_CONFIDENCE_FLOOR = 0.01
+
+
 class YOLOAutoAnnotator:
-    def __init__(self, model_dir='yolo_model', class_list=None, conf_threshold=0.25):
+    def __init__(self, model_dir='yolo_model', class_list=None, conf_threshold=0.25, model_path=None,
+                 detection_cache=None, num_threads=None, tiling=None):
         self._ensure_model_directory(model_dir)
-        self.model_path = self._find_model_file(model_dir)
+        self.model_path = model_path if model_path else self._find_model_file(model_dir)
         if not self.model_path:
-            raise FileNotFoundError(f"No .pt model file found in '{model_dir}' directory.")
-        self.model = YOLO(self.model_path)
-        self.class_list = class_list if class_list else self.model.names
+            raise FileNotFoundError(self._missing_model_message(model_dir))
+        # The inference library matching the model file is imported here, on first use
+        self.backend = create_backend(self.model_path, num_threads)
+        self.class_list = class_list if class_list else self.backend.names
         self.conf_threshold = conf_threshold
+        # TilingConfig for sliced inference of large images, None to run on whole images
+        self.tiling = tiling
+        # The model is shared between the GUI and background workers
+        self._lock = threading.Lock()
+        self.detection_cache = detection_cache
+        self.model_digest = None
+        if detection_cache is not None:
+            from libs.detection_cache import file_digest
+            self.model_digest = file_digest(self.model_path)
 
-    def _ensure_model_directory(self, model_dir):
+    @staticmethod
+    def _ensure_model_directory(model_dir):
         model_dir_path = Path(model_dir)
         if not model_dir_path.exists():
             model_dir_path.mkdir(parents=True, exist_ok=True)
 
-    def _find_model_file(self, model_dir):
+    @staticmethod
+    def _find_model_file(model_dir):
         model_dir_path = Path(model_dir)
-        pt_files = sorted(model_dir_path.glob("*.pt"))
-        return str(pt_files[0]) if pt_files else None
+        for extension in MODEL_EXTENSIONS:
+            model_files = sorted(model_dir_path.glob("*" + extension))
+            if model_files:
+                return str(model_files[0])
+        return None
+
+    @staticmethod
+    def _missing_model_message(model_dir):
+        return f"No model file ({', '.join(MODEL_EXTENSIONS)}) found in '{model_dir}' directory."
+
+    def warm_up(self, image_size=640):
+        """Run one dummy inference so the first real call does not pay for lazy initialisation."""
+        import numpy as np
+        with self._lock:
+            self.backend.predict([np.zeros((image_size, image_size, 3), dtype=np.uint8)], RAW_CONFIDENCE_FLOOR)
 
     def annotate(self, image_path):
-        results = self.model(image_path)[0]
+        detections, _ = self.detect_batch([image_path])[0]
+        return self.filter_detections(detections)
+
+    def annotate_batch(self, image_paths, images=None):
+        """Annotate several images with a single forward pass.
+
+        `images` optionally holds the already decoded BGR arrays of `image_paths`.
+        Returns an (annotations, (height, width)) tuple per image.
+        """
+        return [
+            (self.filter_detections(detections), image_shape)
+            for detections, image_shape in self.detect_batch(image_paths, images)
+        ]
+
+    def detect_batch(self, image_paths, images=None):
+        """Raw (N, 6) detections and (height, width) of each image.
+
+        Detections are x1, y1, x2, y2, confidence, class id rows, not filtered by
+        `conf_threshold`. Cached results are reused; the remaining images go
+        through the model together, or tile by tile if `tiling` is set.
+        """
+        cache_key = self.model_digest
+        if self.tiling is not None and cache_key is not None:
+            cache_key += '-' + self.tiling.cache_key()
+        outputs = [None] * len(image_paths)
+        digests = [None] * len(image_paths)
+        if self.detection_cache is not None:
+            from libs.detection_cache import file_digest
+            for i, path in enumerate(image_paths):
+                try:
+                    digests[i] = file_digest(path)
+                except OSError:
+                    continue
+                outputs[i] = self.detection_cache.get(cache_key, digests[i])
+
+        misses = [i for i, output in enumerate(outputs) if output is None]
+        if misses:
+            sources = [images[i] if images is not None else image_paths[i] for i in misses]
+            # The backends only read image files, frames of videos are decoded here
+            sources = [self._read_frame(source) if is_frame_path(source) else source for source in sources]
+            if self.tiling is not None:
+                results = [self._detect_tiled(source) for source in sources]
+            else:
+                with self._lock:
+                    results = self.backend.predict(sources, RAW_CONFIDENCE_FLOOR)
+            for i, (detections, image_shape) in zip(misses, results):
+                outputs[i] = (detections, image_shape)
+                if digests[i] is not None:
+                    self.detection_cache.put(cache_key, digests[i], detections, image_shape)
+        return outputs
+
+    @staticmethod
+    def _read_frame(path):
+        frame = read_frame(path)
+        if frame is None:
+            raise ValueError(f"Failed to read video frame: {path}")
+        return frame
+
+    def _detect_tiled(self, source):
+        from libs.tiling import detect_tiled
+        if isinstance(source, (str, os.PathLike)):
+            image = imread(source)
+            if image is None:
+                raise ValueError(f"Failed to read image: {source}")
+        else:
+            image = source
+        with self._lock:
+            detections = detect_tiled(self.backend.predict, image, self.tiling, RAW_CONFIDENCE_FLOOR)
+        return detections, image.shape[:2]
+
+    def filter_detections(self, detections):
         annotations = []
-        for box in results.boxes.data.tolist():
-            x1, y1, x2, y2, conf, cls = box
-            if conf < self.conf_threshold:
-                continue
+        for x1, y1, x2, y2, conf, cls in detections[detections[:, 4] >= self.conf_threshold].tolist():
             label = self.class_list[int(cls)]
             rect = [int(x1), int(y1), int(x2), int(y2)]
             annotations.append({'label': label, 'bbox': rect, 'confidence': conf})
         return annotations
+
+
+class YOLOModelManager:
+    """Keeps one warmed-up YOLOAutoAnnotator per weights file.
+
+    The model is loaded again only if the weights file found in `model_dir`
+    changes (another path or a newer modification time) or `reload` is called.
+    Raw detections are cached on disk unless `use_cache` is False. With
+    `quantized` set, the int8 version of the model made by
+    libs.quantization is used if there is one.
+    """
+
+    def __init__(self, model_dir='yolo_model', conf_threshold=0.25, use_cache=True, tiling=None, quantized=False):
+        self.model_dir = model_dir
+        self.conf_threshold = conf_threshold
+        self.tiling = tiling
+        self.quantized = quantized
+        self.use_cache = use_cache
+        self._detection_cache = None
+        self._annotator = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def has_model(self):
+        return self.find_model() is not None
+
+    def find_model(self):
+        """Path of the original (not quantized) model file in `model_dir`, or None."""
+        if not os.path.isdir(self.model_dir):
+            return None
+        return YOLOAutoAnnotator._find_model_file(self.model_dir)
+
+    def get(self, force_reload=False):
+        """Return the shared annotator, loading and warming it up if needed.
+
+        Raises FileNotFoundError if there is no model in `model_dir`.
+        """
+        with self._lock:
+            YOLOAutoAnnotator._ensure_model_directory(self.model_dir)
+            model_path = YOLOAutoAnnotator._find_model_file(self.model_dir)
+            if not model_path:
+                self._annotator = self._key = None
+                raise FileNotFoundError(YOLOAutoAnnotator._missing_model_message(self.model_dir))
+            if self.quantized and os.path.isfile(quantized_model_path(model_path)):
+                model_path = quantized_model_path(model_path)
+            key = (model_path, os.path.getmtime(model_path))
+            if force_reload or self._annotator is None or key != self._key:
+                print(f"Loading YOLO model {model_path}")
+                annotator = YOLOAutoAnnotator(self.model_dir, conf_threshold=self.conf_threshold,
+                                              model_path=model_path, detection_cache=self._cache(),
+                                              tiling=self.tiling)
+                annotator.warm_up()
+                self._annotator, self._key = annotator, key
+            return self._annotator
+
+    def _cache(self):
+        if self.use_cache and self._detection_cache is None:
+            from libs.detection_cache import DetectionCache
+            self._detection_cache = DetectionCache()
+        return self._detection_cache
+
+    def set_conf_threshold(self, conf_threshold):
+        """Change the threshold of the current and future annotators; cached detections are re-filtered."""
+        self.conf_threshold = conf_threshold
+        if self._annotator is not None:
+            self._annotator.conf_threshold = conf_threshold
+
+    def set_tiling(self, tiling):
+        """Switch sliced inference on with a TilingConfig, or off with None."""
+        self.tiling = tiling
+        if self._annotator is not None:
+            self._annotator.tiling = tiling
+
+    def reload(self):
+        return self.get(force_reload=True)
+
+    def warm_up_async(self, force_reload=False):
+        """Load and warm up the model on a background thread."""
+
+        def run():
+            try:
+                self.get(force_reload)
+            except Exception as e:
+                print(f"YOLO model warm-up failed: {e}")
+
+        thread = threading.Thread(target=run, name='labelImg-yolo-warmup', daemon=True)
+        thread.start()
+        return thread
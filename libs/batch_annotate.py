@@ -0,0 +1,346 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+from libs.labelFile import LabelFile
+from libs.video_source import imread
+
+# Marks the end of the stream in the pipeline queues
+_END = object()
+
+
+@dataclass
+class BatchResult:
+    total: int
+    annotated: int = 0
+    empty: int = 0
+    failed: int = 0
+    cancelled: bool = False
+    elapsed: float = 0.0
+    # Class names used by the written label files, in YOLO index order
+    class_list: list = field(default_factory=list)
+    # Image path -> uncertainty of its detections, see libs.uncertainty
+    uncertainty: dict = field(default_factory=dict)
+    # Why the run stopped early, if it was not cancelled by the user
+    error: str = ''
+
+    @property
+    def processed(self):
+        return self.annotated + self.empty + self.failed
+
+    @property
+    def images_per_second(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def label_file_path(image_path, label_format, label_dir=None):
+    """Path of the label file of `image_path`, next to the image unless `label_dir` is given."""
+    file_name = os.path.splitext(os.path.basename(image_path))[0] + label_format.extension()
+    return os.path.join(label_dir or os.path.dirname(image_path), file_name)
+
+
+def annotations_to_shapes(annotations):
+    """Convert annotator output to the shape dicts understood by LabelFile."""
+    shapes = []
+    for ann in annotations:
+        x1, y1, x2, y2 = ann["bbox"]
+        if x2 <= x1 or y2 <= y1:
+            continue
+        shapes.append(dict(
+            label=ann["label"],
+            points=[(x1, y1), (x2, y1), (x2, y2), (x1, y2)],
+            difficult=False,
+        ))
+    return shapes
+
+
+def annotate_images(annotator, paths, images):
+    """Run `annotator` on one batch, returning (annotations, (height, width), candidate confidences) per image.
+
+    Candidates are the raw detections from half the confidence threshold
+    up. Weaker ones are background noise, which nearly every image has
+    around 0.5 and which would make all images look equally uncertain.
+    """
+    candidate_floor = annotator.conf_threshold / 2
+    return [
+        (annotator.filter_detections(detections), image_shape, detections[detections[:, 4] >= candidate_floor, 4])
+        for detections, image_shape in annotator.detect_batch(paths, images)
+    ]
+
+
+class BatchAnnotationEngine:
+    """Auto-annotates many images without touching the GUI.
+
+    Decoding, inference and label writing run as a three stage pipeline:
+    a decoder thread prepares batches of `batch_size` images, the calling
+    thread runs the model on whole batches and a writer thread saves the
+    results through the label format writers. Bounded queues between the
+    stages keep memory use flat.
+    """
+
+    def __init__(self, annotator, label_format, label_dir=None, class_list=None, batch_size=8):
+        self.annotator = annotator
+        self.label_format = label_format
+        self.label_dir = label_dir
+        self.class_list = list(class_list) if class_list else []
+        self.batch_size = max(1, int(batch_size))
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self, image_paths, progress=None):
+        """Annotate `image_paths`, calling `progress(done, total, images_per_second)` along the way."""
+        result = BatchResult(total=len(image_paths), class_list=self.class_list)
+        decoded = queue.Queue(maxsize=2)
+        to_write = queue.Queue(maxsize=2)
+        start = time.perf_counter()
+
+        decoder = threading.Thread(
+            target=self._decode, args=(image_paths, decoded), name='labelImg-batch-decode', daemon=True)
+        writer = threading.Thread(
+            target=self._write, args=(to_write, result, start, progress), name='labelImg-batch-write', daemon=True)
+        decoder.start()
+        writer.start()
+        batch = None
+        try:
+            while True:
+                batch = decoded.get()
+                if batch is _END:
+                    break
+                if self.cancelled():
+                    continue
+                paths, images, unreadable = batch
+                outputs = []
+                if images:
+                    try:
+                        outputs = annotate_images(self.annotator, paths, images)
+                    except Exception as e:
+                        print(f"Auto-annotation failed for a batch of {len(paths)} images: {e}")
+                        outputs = [None] * len(paths)
+                to_write.put(list(zip(paths, outputs)) + [(path, None) for path in unreadable])
+        except BaseException:
+            self.cancel()
+            raise
+        finally:
+            # Unblock the decoder if inference stopped early
+            while batch is not _END:
+                batch = decoded.get()
+            to_write.put(_END)
+            writer.join()
+            decoder.join()
+
+        result.cancelled = self.cancelled()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _decode(self, image_paths, decoded):
+        try:
+            import cv2
+        except ImportError:
+            # Let the model decode the files itself
+            cv2 = None
+
+        try:
+            for i in range(0, len(image_paths), self.batch_size):
+                if self.cancelled():
+                    break
+                paths = []
+                images = []
+                unreadable = []
+                for path in image_paths[i:i + self.batch_size]:
+                    image = imread(path) if cv2 is not None else path
+                    if image is None:
+                        print(f"Failed to read image: {path}")
+                        unreadable.append(path)
+                        continue
+                    paths.append(path)
+                    images.append(image)
+                decoded.put((paths, images, unreadable))
+        finally:
+            decoded.put(_END)
+
+    def _write(self, to_write, result, start, progress):
+        """Save the batches of `to_write` until _END.
+
+        Must not stop early: the inference side blocks on the bounded queue
+        once nobody takes batches out of it any more.
+        """
+        from libs.uncertainty import uncertainty_scores
+
+        last_report = 0.0
+        label_file = LabelFile()
+        while True:
+            batch = to_write.get()
+            if batch is _END:
+                break
+            scored = [(path, output[2]) for path, output in batch if output is not None]
+            if scored:
+                paths, confidences = zip(*scored)
+                try:
+                    result.uncertainty.update(zip(paths, uncertainty_scores(confidences).tolist()))
+                except Exception as e:
+                    print(f"Failed to score the uncertainty of a batch of {len(paths)} images: {e}")
+            for image_path, output in batch:
+                if output is None:
+                    result.failed += 1
+                    continue
+                try:
+                    annotations, (height, width), _ = output
+                    shapes = annotations_to_shapes(annotations)
+                    if not shapes:
+                        result.empty += 1
+                        continue
+                    label_file.save_with_image_shape(
+                        self.label_format,
+                        label_file_path(image_path, self.label_format, self.label_dir),
+                        shapes,
+                        image_path,
+                        [height, width, 3],
+                        self.class_list,
+                    )
+                    result.annotated += 1
+                except Exception as e:
+                    print(f"Failed to save labels of {image_path}: {e}")
+                    result.failed += 1
+
+            now = time.perf_counter()
+            if progress is not None and (now - last_report > 0.1 or result.processed == result.total):
+                last_report = now
+                try:
+                    progress(result.processed, result.total, result.processed / (now - start))
+                except Exception as e:
+                    print(f"Failed to report auto-annotation progress: {e}")
+
+
+def default_threads_per_worker(workers):
+    """Split the CPU cores evenly between `workers` processes."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# Arguments of the annotator of the current worker process, set by _init_worker
+_worker_args = None
+# Created from _worker_args by the first chunk, so loading errors reach the parent
+_worker_annotator = None
+
+
+def _init_worker(model_path, class_list, conf_threshold, num_threads, cache_dir, tiling):
+    # Must not fail: the pool replaces workers whose initializer raises, forever
+    global _worker_args
+    _worker_args = (model_path, class_list, conf_threshold, num_threads, cache_dir, tiling)
+
+
+def _load_worker_annotator():
+    global _worker_annotator
+    if _worker_annotator is None:
+        from libs.auto_annotate import YOLOAutoAnnotator
+        model_path, class_list, conf_threshold, num_threads, cache_dir, tiling = _worker_args
+        detection_cache = None
+        if cache_dir:
+            from libs.detection_cache import DetectionCache
+            detection_cache = DetectionCache(cache_dir)
+        _worker_annotator = YOLOAutoAnnotator(
+            os.path.dirname(model_path), class_list, conf_threshold, model_path, detection_cache, num_threads, tiling)
+    return _worker_annotator
+
+
+def _annotate_chunk(image_paths):
+    """Annotate one chunk of images in a worker.
+
+    Returns (path, output or None) pairs, and the error message if the
+    worker could not load the model.
+    """
+    try:
+        annotator = _load_worker_annotator()
+    except Exception as e:
+        return [(path, None) for path in image_paths], "%s: %s" % (type(e).__name__, e)
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+
+    paths = []
+    images = []
+    outputs = []
+    for path in image_paths:
+        image = imread(path) if cv2 is not None else path
+        if image is None:
+            print(f"Failed to read image: {path}")
+            outputs.append((path, None))
+            continue
+        paths.append(path)
+        images.append(image)
+    if paths:
+        try:
+            outputs.extend(zip(paths, annotate_images(annotator, paths, images)))
+        except Exception as e:
+            print(f"Auto-annotation failed for a batch of {len(paths)} images: {e}")
+            outputs.extend((path, None) for path in paths)
+    return outputs, None
+
+
+class ShardedAnnotationEngine(BatchAnnotationEngine):
+    """Runs the model in `workers` processes, each with its own copy of the model.
+
+    Meant for CPU-only machines, where one PyTorch instance running small
+    batches leaves most cores idle. The images are handed out in chunks of
+    `batch_size` as workers become free, and the inference backend of every
+    worker uses `threads_per_worker` intra-op threads. Label files are
+    written by this process only, so all of them share one class list.
+    """
+
+    def __init__(self, annotator, label_format, label_dir=None, class_list=None, batch_size=8,
+                 workers=2, threads_per_worker=None):
+        super(ShardedAnnotationEngine, self).__init__(annotator, label_format, label_dir, class_list, batch_size)
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(self.workers)
+
+    def run(self, image_paths, progress=None):
+        result = BatchResult(total=len(image_paths), class_list=self.class_list)
+        to_write = queue.Queue(maxsize=2 * self.workers)
+        start = time.perf_counter()
+
+        writer = threading.Thread(
+            target=self._write, args=(to_write, result, start, progress), name='labelImg-batch-write', daemon=True)
+        writer.start()
+        cache = self.annotator.detection_cache
+        chunks = [image_paths[i:i + self.batch_size] for i in range(0, len(image_paths), self.batch_size)]
+        # Forking a process that runs Qt and PyTorch threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        try:
+            with context.Pool(
+                min(self.workers, max(1, len(chunks))),
+                initializer=_init_worker,
+                initargs=(
+                    self.annotator.model_path,
+                    self.annotator.class_list,
+                    self.annotator.conf_threshold,
+                    self.threads_per_worker,
+                    cache.cache_dir if cache is not None else None,
+                    self.annotator.tiling,
+                ),
+            ) as pool:
+                for batch, error in pool.imap_unordered(_annotate_chunk, chunks):
+                    if error is not None:
+                        # Every chunk would fail the same way
+                        result.error = "The auto-annotation workers could not load the model:\n" + error
+                        self.cancel()
+                    if self.cancelled():
+                        break
+                    to_write.put(batch)
+        except BaseException:
+            self.cancel()
+            raise
+        finally:
+            to_write.put(_END)
+            writer.join()
+
+        result.cancelled = self.cancelled()
+        result.elapsed = time.perf_counter() - start
+        return result
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def xywh_to_xyxy(boxes):
+    """Convert (N, 4) center x, center y, width, height boxes to x1, y1, x2, y2."""
+    boxes = np.asarray(boxes, dtype=np.float32)
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def box_area(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes as an (N, M) matrix."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    # Work on (N, M) planes in place, thousands of boxes give matrices of millions of entries
+    width = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    width -= np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    np.clip(width, 0, None, out=width)
+    intersection = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection -= np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    np.clip(intersection, 0, None, out=intersection)
+    intersection *= width
+    union = width
+    np.add(box_area(boxes_a)[:, None], box_area(boxes_b)[None, :], out=union)
+    union -= intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def nms(boxes, scores, iou_threshold=0.45):
+    """Greedy non-maximum suppression, returning the indices of the kept boxes by descending score."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    areas = box_area(boxes)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        union = areas[best] + areas[rest] - intersection
+        iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold=0.45):
+    """Class-aware NMS: boxes of different classes never suppress each other."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    # Move every class to its own region so one NMS pass handles all classes
+    offsets = np.asarray(class_ids, dtype=np.float32)[:, None] * (boxes.max() + 1)
+    return nms(boxes + offsets, scores, iou_threshold)
+
+
+def match_boxes(boxes, reference, iou_threshold=0.5):
+    """Match every box to the reference box it overlaps most.
+
+    Returns the index into `reference` for each of `boxes`, -1 where no
+    reference box reaches `iou_threshold`, and the IoU of each match.
+    """
+    iou = box_iou(boxes, reference)
+    if not iou.shape[1]:
+        return np.full(len(iou), -1, dtype=np.int64), np.zeros(len(iou), dtype=np.float32)
+    best = iou.argmax(axis=1)
+    best_iou = iou[np.arange(len(iou)), best]
+    return np.where(best_iou >= iou_threshold, best, -1), best_iou
+
+
+def greedy_matching(iou, iou_threshold=0.5):
+    """One-to-one matching on an (N, M) IoU matrix, taking the pairs of highest IoU first.
+
+    Returns the row indices, column indices and IoU of the matched pairs.
+    """
+    iou = np.asarray(iou, dtype=np.float32)
+    rows, cols = np.nonzero(iou >= iou_threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    used_rows = np.zeros(iou.shape[0], dtype=bool)
+    used_cols = np.zeros(iou.shape[1], dtype=bool)
+    keep = []
+    for i in order.tolist():
+        row, col = rows[i], cols[i]
+        if not used_rows[row] and not used_cols[col]:
+            used_rows[row] = used_cols[col] = True
+            keep.append(i)
+    rows, cols = rows[keep], cols[keep]
+    return rows, cols, iou[rows, cols]
@@ -0,0 +1,384 @@
+"""COCO object detection files, written and read as a stream.
+
+A COCO file holds every image of a dataset in one JSON document, which can
+be far larger than memory. CocoWriter writes each image as it is added and
+parks the annotations in a temporary file until the end, and iter_coco
+yields the records of a file one at a time.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+
+from libs.batch_annotate import label_file_path
+from libs.labelFile import LabelFile, LabelFileFormat
+
+COCO_EXT = '.json'
+# Characters read from a COCO file at once
+READ_CHUNK_SIZE = 1 << 20
+# Images are split by id into this many shards per worker on import
+SHARDS_PER_WORKER = 4
+
+
+class CocoWriter:
+    """Write a COCO file image by image.
+
+    Category ids follow `class_list`, starting at 1; labels that are not in
+    it get the next free ids as they show up.
+    """
+
+    def __init__(self, path, class_list=None):
+        self.path = path
+        self.categories = {}
+        for name in class_list or []:
+            self.category_id(name)
+        self.image_count = 0
+        self.annotation_count = 0
+        self._out = open(path, 'w', encoding='utf-8')
+        self._out.write('{"info": {"description": "Exported by labelImg"}, "licenses": [], "images": [')
+        self._annotations = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def category_id(self, name):
+        if name not in self.categories:
+            self.categories[name] = len(self.categories) + 1
+        return self.categories[name]
+
+    def add_image(self, file_name, image_shape, shapes):
+        """Add an image of [height, width, ...] `image_shape` with its shape dicts, returning its id."""
+        self.image_count += 1
+        image_id = self.image_count
+        height, width = image_shape[:2]
+        if image_id > 1:
+            self._out.write(', ')
+        json.dump({'id': image_id, 'file_name': file_name, 'width': width, 'height': height}, self._out)
+
+        for shape in shapes:
+            xs = [p[0] for p in shape['points']]
+            ys = [p[1] for p in shape['points']]
+            x_min, y_min = min(xs), min(ys)
+            w, h = max(xs) - x_min, max(ys) - y_min
+            self.annotation_count += 1
+            if self.annotation_count > 1:
+                self._annotations.write(', ')
+            json.dump({
+                'id': self.annotation_count,
+                'image_id': image_id,
+                'category_id': self.category_id(shape['label']),
+                'bbox': [x_min, y_min, w, h],
+                'area': w * h,
+                'iscrowd': 0,
+            }, self._annotations)
+        return image_id
+
+    def close(self):
+        self._out.write('], "annotations": [')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._out)
+        self._annotations.close()
+        self._out.write('], "categories": ')
+        json.dump([{'id': category_id, 'name': name, 'supercategory': 'none'}
+                   for name, category_id in self.categories.items()], self._out)
+        self._out.write('}\n')
+        self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Do not leave a truncated file behind
+        self._annotations.close()
+        self._out.close()
+        os.remove(self.path)
+
+
+class _StreamReader:
+    """Pulls JSON values out of a text file without reading all of it."""
+
+    def __init__(self, file, chunk_size=READ_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self, skip=' \t\r\n'):
+        """The next character that is not in `skip`."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of the COCO file")
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in the COCO file, found {self.buffer[self.pos]!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number at the end of the buffer may go on in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_coco(path):
+    """Yield (key, record) for every element of the top level arrays of a COCO file.
+
+    Top level values that are not arrays, such as "info", are yielded whole.
+    """
+    with open(path, encoding='utf-8') as f:
+        reader = _StreamReader(f)
+        reader.expect('{')
+        while reader.peek(' \t\r\n,') != '}':
+            key = reader.value()
+            reader.expect(':')
+            if reader.peek() != '[':
+                yield key, reader.value()
+                continue
+            reader.pos += 1
+            while reader.peek(' \t\r\n,') != ']':
+                yield key, reader.value()
+            reader.pos += 1
+
+
+def export_coco(items, output_path, image_root, class_list=None):
+    """Write (image path, image shape, shape dicts) items to a COCO file.
+
+    File names are stored relative to `image_root`. Returns the number of
+    images and annotations written.
+    """
+    with CocoWriter(output_path, class_list) as writer:
+        for image_path, image_shape, shapes in items:
+            writer.add_image(os.path.relpath(image_path, image_root).replace(os.sep, '/'), image_shape, shapes)
+    return writer.image_count, writer.annotation_count
+
+
+@dataclass
+class CocoImportResult:
+    images: int = 0
+    annotations: int = 0
+    # Label files written
+    written: list = field(default_factory=list)
+    # Annotated images left alone because they already had a label file
+    skipped: int = 0
+    failed: int = 0
+    # Class names in YOLO index order: the given class list, then new categories
+    class_list: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+def _shard_of(image_id, shards):
+    return image_id % shards if isinstance(image_id, int) else hash(str(image_id)) % shards
+
+
+def existing_label_paths(image_path, label_format, output_dir=None):
+    """Label files of any format that already hold annotations of `image_path`.
+
+    The file written in `label_format` replaces them in effect: it is read
+    first, or it is the same file.
+    """
+    base_dirs = [os.path.dirname(label_file_path(image_path, label_format, output_dir)), os.path.dirname(image_path)]
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return [path for base_dir in dict.fromkeys(base_dirs) for path in
+            (os.path.join(base_dir, stem + ext.extension()) for ext in LabelFileFormat) if os.path.isfile(path)]
+
+
+def _read_shard(images_path, annotations_path, categories):
+    """(images by id, shape dicts by image id, errors) of one shard."""
+    images = {}
+    with open(images_path, encoding='utf-8') as f:
+        for line in f:
+            image_id, file_name, width, height = json.loads(line)
+            images[image_id] = (file_name, width, height)
+    shapes = {}
+    errors = []
+    with open(annotations_path, encoding='utf-8') as f:
+        for line in f:
+            image_id, category_id, x, y, w, h = json.loads(line)
+            if category_id not in categories:
+                errors.append(f"Annotation of image id {image_id} has unknown category id {category_id}")
+                continue
+            shapes.setdefault(image_id, []).append(dict(
+                label=categories[category_id],
+                points=[(x, y), (x + w, y), (x + w, y + h), (x, y + h)],
+                difficult=False,
+            ))
+    return images, shapes, errors
+
+
+def _count_existing_shard(args):
+    """Number of annotated images of one shard that already have a label file."""
+    images_path, annotations_path, image_dir, label_format, output_dir, categories = args[:6]
+    images, shapes, _errors = _read_shard(images_path, annotations_path, categories)
+    return sum(
+        1 for image_id in shapes if image_id in images and existing_label_paths(
+            os.path.join(image_dir, *images[image_id][0].split('/')), label_format, output_dir))
+
+
+def _import_shard(args):
+    """Write the label files of the images of one shard. Returns (written paths, skipped count, errors)."""
+    images_path, annotations_path, image_dir, label_format, output_dir, categories, class_list, skip_existing = args
+    images, shapes, errors = _read_shard(images_path, annotations_path, categories)
+    label_file = LabelFile()
+    written = []
+    skipped = 0
+    for image_id, image_shapes in shapes.items():
+        if image_id not in images:
+            errors.append(f"Annotations of unknown image id {image_id}")
+            continue
+        file_name, width, height = images[image_id]
+        image_path = os.path.join(image_dir, *file_name.split('/'))
+        if skip_existing and existing_label_paths(image_path, label_format, output_dir):
+            skipped += 1
+            continue
+        target = label_file_path(image_path, label_format, output_dir)
+        try:
+            label_file.save_with_image_shape(label_format, target, image_shapes, image_path, [height, width, 3],
+                                             class_list, write_class_file=False)
+        except (OSError, ValueError) as e:
+            errors.append(f"{file_name}: {e}")
+            continue
+        written.append(target)
+    return written, skipped, errors
+
+
+class CocoImport:
+    """A COCO file read and spread by image over shard files, before any label file is written.
+
+    The file is read once as a stream and its records go to shard files in
+    a temporary directory, so neither the file nor its annotations have to
+    fit in memory. `count_existing` and `write` then hand the shards to
+    worker processes. Image paths are `file_name` relative to `image_dir`;
+    label files go next to the images unless `output_dir` is given. Category
+    names missing from `class_list` are appended to it in category id order.
+    """
+
+    def __init__(self, json_path, image_dir, label_format, output_dir=None, class_list=None, workers=None):
+        self.image_dir = image_dir
+        self.label_format = label_format
+        self.output_dir = output_dir
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.result = CocoImportResult()
+        self.categories = {}
+        self._spill_dir = tempfile.TemporaryDirectory(prefix='labelImg-coco-')
+        try:
+            self._shard_paths = self._spill(json_path)
+        except BaseException:
+            self.close()
+            raise
+        class_list = list(class_list or [])
+        for category_id in sorted(self.categories):
+            if self.categories[category_id] not in class_list:
+                class_list.append(self.categories[category_id])
+        self.result.class_list = class_list
+
+    def _spill(self, json_path):
+        shards = self.workers * SHARDS_PER_WORKER
+        spill_dir = self._spill_dir.name
+        image_files = [open(os.path.join(spill_dir, f'images{i}.jsonl'), 'w', encoding='utf-8')
+                       for i in range(shards)]
+        annotation_files = [open(os.path.join(spill_dir, f'annotations{i}.jsonl'), 'w', encoding='utf-8')
+                            for i in range(shards)]
+        try:
+            for key, record in iter_coco(json_path):
+                if key == 'images':
+                    self.result.images += 1
+                    image_id = record['id']
+                    image_files[_shard_of(image_id, shards)].write(json.dumps(
+                        [image_id, record['file_name'], record['width'], record['height']]) + '\n')
+                elif key == 'annotations':
+                    if 'bbox' not in record:
+                        continue
+                    self.result.annotations += 1
+                    image_id = record['image_id']
+                    annotation_files[_shard_of(image_id, shards)].write(json.dumps(
+                        [image_id, record['category_id']] + list(record['bbox'])) + '\n')
+                elif key == 'categories':
+                    self.categories[record['id']] = record['name']
+        finally:
+            for f in image_files + annotation_files:
+                f.close()
+        return [(image_files[i].name, annotation_files[i].name) for i in range(shards)]
+
+    def _jobs(self, skip_existing=False):
+        return [(images_path, annotations_path, self.image_dir, self.label_format, self.output_dir, self.categories,
+                 self.result.class_list, skip_existing) for images_path, annotations_path in self._shard_paths]
+
+    def _map(self, function, jobs):
+        if self.workers > 1:
+            # Spawned like the other worker pools, a forked Qt process is not safe
+            with multiprocessing.get_context('spawn').Pool(self.workers) as pool:
+                return list(pool.imap_unordered(function, jobs))
+        return list(map(function, jobs))
+
+    def count_existing(self):
+        """Number of annotated images that already have a label file the import would replace."""
+        return sum(self._map(_count_existing_shard, self._jobs()))
+
+    def write(self, skip_existing=False):
+        """Write the label files, leaving out the images that have one already if `skip_existing`.
+
+        Returns the CocoImportResult.
+        """
+        result = self.result
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        for written, skipped, errors in self._map(_import_shard, self._jobs(skip_existing)):
+            result.written.extend(written)
+            result.skipped += skipped
+            result.errors.extend(errors)
+        if self.label_format == LabelFileFormat.YOLO:
+            class_dir = self.output_dir or self.image_dir
+            os.makedirs(class_dir, exist_ok=True)
+            with open(os.path.join(class_dir, 'labels.txt'), 'w') as out_class_file:
+                for c in result.class_list:
+                    out_class_file.write(c + '\n')
+        result.failed = len(result.errors)
+        return result
+
+    def close(self):
+        self._spill_dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def import_coco(json_path, image_dir, label_format, output_dir=None, class_list=None, workers=None,
+                skip_existing=False):
+    """Write a label file of `label_format` for every annotated image of a COCO file.
+
+    See CocoImport. Existing label files are replaced unless `skip_existing`.
+    """
+    with CocoImport(json_path, image_dir, label_format, output_dir, class_list, workers) as coco:
+        return coco.write(skip_existing)
@@ -14,4 +14,18 @@ SETTING_AUTO_SAVE = 'autosave'
 SETTING_SINGLE_CLASS = 'singleclass'
 SETTING_DRAW_SQUARE = 'draw/square'
 SETTING_LABEL_FILE_FORMAT= 'labelFileFormat'
+SETTING_DELETE_TO_TRASH = 'deleteToTrash'
+SETTING_AUTO_ANNOTATE_BATCH_SIZE = 'autoAnnotate/batchSize'
+SETTING_AUTO_ANNOTATE_CONF = 'autoAnnotate/confThreshold'
+SETTING_AUTO_ANNOTATE_WORKERS = 'autoAnnotate/workers'
+SETTING_AUTO_ANNOTATE_TILING = 'autoAnnotate/tiling'
+SETTING_AUTO_ANNOTATE_TILE_SIZE = 'autoAnnotate/tileSize'
+SETTING_AUTO_ANNOTATE_TILE_OVERLAP = 'autoAnnotate/tileOverlap'
+SETTING_AUTO_ANNOTATE_TILE_MERGE = 'autoAnnotate/tileMerge'
+SETTING_AUTO_ANNOTATE_PREFETCH = 'autoAnnotate/preAnnotate'
+SETTING_AUTO_ANNOTATE_LOOKAHEAD = 'autoAnnotate/lookahead'
+SETTING_AUTO_ANNOTATE_MERGE = 'autoAnnotate/merge'
+SETTING_AUTO_ANNOTATE_FLAG_DISAGREEMENTS = 'autoAnnotate/flagDisagreements'
+SETTING_REVIEW_BY_UNCERTAINTY = 'reviewByUncertainty'
+SETTING_AUTO_ANNOTATE_INT8 = 'autoAnnotate/int8'
 DEFAULT_ENCODING = 'utf-8'
@@ -0,0 +1,412 @@
+"""Convert whole directories of label files between Pascal VOC, YOLO, CreateML and COCO.
+
+Runs without the GUI: image sizes come from the image headers, the class
+list is settled once before any file is written, and the label files are
+converted in parallel worker processes.
+
+    labelimg-convert labels/ -f voc -t yolo -i images/ -o yolo_labels/
+    labelimg-convert labels/ -f voc -t coco -i images/ -o annotations.json
+    labelimg-convert annotations.json -f coco -t voc -i images/
+    labelimg-convert labels/ -f yolo -t snapshot -i images/ -o dataset.npz
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+from libs.batch_annotate import label_file_path
+from libs.create_ml_io import read_create_ml_images
+from libs.image_size import image_shape, is_image_file
+from libs.labelFile import LabelFile, LabelFileFormat
+from libs.pascal_voc_io import PascalVocReader
+from libs.yolo_io import YoloReader
+
+FORMATS = {
+    'voc': LabelFileFormat.PASCAL_VOC,
+    'yolo': LabelFileFormat.YOLO,
+    'createml': LabelFileFormat.CREATE_ML,
+}
+# Name of the COCO format on the command line, one file for the whole dataset
+COCO = 'coco'
+# Name of the snapshot format on the command line, see libs.snapshot
+SNAPSHOT = 'snapshot'
+# Class lists kept next to YOLO label files
+CLASS_LIST_FILES = ('classes.txt', 'labels.txt')
+# Label files handed to a worker at once
+CHUNK_SIZE = 256
+
+
+@dataclass
+class ConversionResult:
+    # Label files found in the source directory
+    total: int
+    converted: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    # Class names of the written YOLO files, in index order
+    class_list: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+    @property
+    def files_per_second(self):
+        return (self.converted + self.failed) / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def read_class_list(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def find_label_files(label_dir, label_format):
+    extension = label_format.extension()
+    return sorted(
+        os.path.join(label_dir, name) for name in os.listdir(label_dir)
+        if name.lower().endswith(extension) and name not in CLASS_LIST_FILES
+    )
+
+
+def find_images(image_dir):
+    """Image name without extension -> image path."""
+    images = {}
+    for name in sorted(os.listdir(image_dir)):
+        if is_image_file(name):
+            images.setdefault(os.path.splitext(name)[0], os.path.join(image_dir, name))
+    return images
+
+
+def read_labels(label_path, source_format, image_dir, images, classes):
+    """Yield (image path, shape dicts, verified) of every image a label file describes.
+
+    The image path is None when the image cannot be found.
+    """
+    if source_format == LabelFileFormat.CREATE_ML:
+        for image_name, shapes, verified in read_create_ml_images(label_path):
+            image_path = os.path.join(image_dir, image_name)
+            # CreateML has no difficult flag
+            yield (image_path if os.path.isfile(image_path) else None,
+                   [dict(label=label, points=points, difficult=False) for label, points in shapes], verified)
+        return
+
+    image_path = images.get(os.path.splitext(os.path.basename(label_path))[0])
+    if source_format == LabelFileFormat.PASCAL_VOC:
+        reader = PascalVocReader(label_path)
+    elif image_path is None:
+        # YOLO boxes are relative to the image size
+        yield None, [], False
+        return
+    else:
+        reader = YoloReader(label_path, image_shape(image_path), classes=classes)
+    shapes = [dict(label=label, points=points, difficult=difficult)
+              for label, points, _line_color, _fill_color, difficult in reader.get_shapes()]
+    yield image_path, shapes, reader.verified
+
+
+# (source format, target format, image dir, output dir, class list) of the current worker, set by _init_worker
+_worker_args = None
+# Image name without extension -> path, listed by the first chunk of the worker
+_worker_images = None
+
+
+def _init_worker(source_format, target_format, image_dir, output_dir, class_list):
+    # Must not fail: the pool replaces workers whose initializer raises, forever
+    global _worker_args
+    _worker_args = (source_format, target_format, image_dir, output_dir, class_list)
+
+
+def _load_worker_images():
+    global _worker_images
+    if _worker_images is None:
+        _worker_images = find_images(_worker_args[2])
+    return _worker_images
+
+
+def _collect_chunk_labels(label_paths):
+    """The labels used by a chunk of label files, and the error messages."""
+    source_format, _target_format, image_dir, _output_dir, class_list = _worker_args
+    labels = set()
+    errors = []
+    for label_path in label_paths:
+        try:
+            for _image_path, shapes, _verified in read_labels(
+                    label_path, source_format, image_dir, _load_worker_images(), class_list):
+                labels.update(shape['label'] for shape in shapes)
+        except Exception as e:
+            errors.append(f"{label_path}: {e}")
+    return labels, errors
+
+
+def _convert_chunk(label_paths):
+    """Convert a chunk of label files in a worker.
+
+    Returns the number of images converted and the error messages of the
+    ones that failed.
+    """
+    source_format, target_format, image_dir, output_dir, class_list = _worker_args
+    known = set(class_list)
+    label_file = LabelFile()
+    converted = 0
+    errors = []
+    for label_path in label_paths:
+        try:
+            for image_path, shapes, verified in read_labels(
+                    label_path, source_format, image_dir, _load_worker_images(), class_list):
+                if image_path is None:
+                    errors.append(f"{label_path}: image not found in {image_dir}")
+                    continue
+                if target_format == LabelFileFormat.YOLO:
+                    unknown = {shape['label'] for shape in shapes} - known
+                    if unknown:
+                        # Adding them here would give each worker its own indices
+                        errors.append(f"{label_path}: labels not in the class list: {', '.join(sorted(unknown))}")
+                        continue
+                label_file.verified = verified
+                label_file.save_with_image_shape(
+                    target_format, label_file_path(image_path, target_format, output_dir), shapes, image_path,
+                    image_shape(image_path), class_list, write_class_file=False)
+                converted += 1
+        except Exception as e:
+            errors.append(f"{label_path}: {e}")
+    return converted, errors
+
+
+def _read_chunk(label_paths):
+    """(image path, image shape, shape dicts, verified) of a chunk of label files, and the error messages."""
+    source_format, _target_format, image_dir, _output_dir, class_list = _worker_args
+    items = []
+    errors = []
+    for label_path in label_paths:
+        try:
+            for image_path, shapes, verified in read_labels(
+                    label_path, source_format, image_dir, _load_worker_images(), class_list):
+                if image_path is None:
+                    errors.append(f"{label_path}: image not found in {image_dir}")
+                    continue
+                items.append((image_path, image_shape(image_path), shapes, verified))
+        except Exception as e:
+            errors.append(f"{label_path}: {e}")
+    return items, errors
+
+
+def _start_pool(workers, chunks, init_args):
+    """A pool of spawned workers, or None when the work is done in this process."""
+    if workers > 1 and len(chunks) > 1:
+        # Spawned like the auto-annotation workers, a forked Qt process is not safe
+        return multiprocessing.get_context('spawn').Pool(min(workers, len(chunks)), _init_worker, init_args)
+    _init_worker(*init_args)
+    return None
+
+
+def _run(pool, function, chunks, ordered=False):
+    if pool is None:
+        return map(function, chunks)
+    return pool.imap(function, chunks) if ordered else pool.imap_unordered(function, chunks)
+
+
+def _source_class_list(label_dir, source_format, class_list):
+    if class_list is None and source_format == LabelFileFormat.YOLO:
+        class_file = next((os.path.join(label_dir, name) for name in CLASS_LIST_FILES
+                           if os.path.isfile(os.path.join(label_dir, name))), None)
+        if class_file is None:
+            raise ValueError(f"No class list for the YOLO files in {label_dir}, pass one with --classes")
+        class_list = read_class_list(class_file)
+    return list(class_list or [])
+
+
+def convert(label_dir, source_format, target_format, image_dir=None, output_dir=None, class_list=None,
+            workers=None, progress=None):
+    """Convert every label file of `source_format` in `label_dir` to `target_format`.
+
+    Images are looked up by name in `image_dir` (default: `label_dir`) and the
+    new label files go to `output_dir` (default: `label_dir`). `class_list` maps
+    YOLO indices to labels; without it YOLO sources use their `labels.txt` and
+    YOLO targets get the sorted labels of all source files, collected in a
+    first pass. `progress(done, total, files_per_second)` is called as chunks
+    finish.
+    """
+    image_dir = image_dir or label_dir
+    output_dir = output_dir or label_dir
+    workers = workers or os.cpu_count() or 1
+    label_paths = find_label_files(label_dir, source_format)
+    result = ConversionResult(total=len(label_paths))
+    class_list = _source_class_list(label_dir, source_format, class_list)
+
+    chunks = [label_paths[i:i + CHUNK_SIZE] for i in range(0, len(label_paths), CHUNK_SIZE)]
+    init_args = (source_format, target_format, image_dir, output_dir, class_list)
+    start = time.perf_counter()
+    pool = _start_pool(workers, chunks, init_args)
+    try:
+        if target_format == LabelFileFormat.YOLO and not class_list:
+            labels = set()
+            # Unreadable files are reported by the conversion itself
+            for chunk_labels, _errors in _run(pool, _collect_chunk_labels, chunks):
+                labels.update(chunk_labels)
+            class_list = sorted(labels)
+            init_args = (source_format, target_format, image_dir, output_dir, class_list)
+            if pool is not None:
+                # Workers hold the class list from their initializer
+                pool.close()
+                pool.join()
+            pool = _start_pool(workers, chunks, init_args)
+
+        os.makedirs(output_dir, exist_ok=True)
+        done = 0
+        for converted, errors in _run(pool, _convert_chunk, chunks):
+            result.converted += converted
+            result.failed += len(errors)
+            result.errors.extend(errors)
+            done += 1
+            result.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(min(done * CHUNK_SIZE, result.total), result.total, result.files_per_second)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if target_format == LabelFileFormat.YOLO:
+        with open(os.path.join(output_dir, 'labels.txt'), 'w') as out_class_file:
+            for c in class_list:
+                out_class_file.write(c + '\n')
+    result.class_list = class_list
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def read_dataset(label_dir, source_format, result, image_dir=None, class_list=None, workers=None, progress=None):
+    """Yield (image path, image shape, shape dicts, verified) of every label file, in file name order.
+
+    The label files are read in worker processes. Counts and errors go to
+    the ConversionResult `result`.
+    """
+    image_dir = image_dir or label_dir
+    workers = workers or os.cpu_count() or 1
+    label_paths = find_label_files(label_dir, source_format)
+    result.total = len(label_paths)
+    class_list = _source_class_list(label_dir, source_format, class_list)
+    chunks = [label_paths[i:i + CHUNK_SIZE] for i in range(0, len(label_paths), CHUNK_SIZE)]
+    start = time.perf_counter()
+    pool = _start_pool(workers, chunks, (source_format, None, image_dir, None, class_list))
+    try:
+        done = 0
+        for items, errors in _run(pool, _read_chunk, chunks, ordered=True):
+            yield from items
+            result.converted += len(items)
+            result.failed += len(errors)
+            result.errors.extend(errors)
+            done += 1
+            result.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(min(done * CHUNK_SIZE, result.total), result.total, result.files_per_second)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def export_to_coco(label_dir, source_format, output_path, image_dir=None, class_list=None, workers=None,
+                   progress=None):
+    """Write every label file of `source_format` in `label_dir` to one COCO file.
+
+    Category ids follow `class_list`, then the other labels in order of appearance.
+    """
+    from libs.coco_io import CocoWriter
+
+    image_dir = image_dir or label_dir
+    result = ConversionResult(total=0)
+    start = time.perf_counter()
+    with CocoWriter(output_path, _source_class_list(label_dir, source_format, class_list)) as writer:
+        for image_path, shape, shapes, _verified in read_dataset(
+                label_dir, source_format, result, image_dir, class_list, workers, progress):
+            writer.add_image(os.path.relpath(image_path, image_dir).replace(os.sep, '/'), shape, shapes)
+    result.class_list = list(writer.categories)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def export_to_snapshot(label_dir, source_format, output_path, image_dir=None, class_list=None, workers=None,
+                       progress=None):
+    """Compile every label file of `source_format` in `label_dir` into one snapshot, see libs.snapshot."""
+    from libs.snapshot import SnapshotBuilder
+
+    image_dir = image_dir or label_dir
+    result = ConversionResult(total=0)
+    start = time.perf_counter()
+    builder = SnapshotBuilder(image_dir, _source_class_list(label_dir, source_format, class_list))
+    for image_path, shape, shapes, verified in read_dataset(
+            label_dir, source_format, result, image_dir, class_list, workers, progress):
+        builder.add_image(image_path, shape, shapes, verified)
+    builder.save(output_path)
+    result.class_list = list(builder.classes)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _print_progress(done, total, files_per_second):
+    print(f"\r{done}/{total} label files, {files_per_second:.0f} files/s", end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='labelimg-convert', description=__doc__.split('\n\n')[0])
+    parser.add_argument("label_dir", help="Directory with the label files to convert, or the COCO file to import")
+    parser.add_argument("-f", "--from", dest="source", required=True, choices=list(FORMATS) + [COCO],
+                        help="Format of the label files")
+    parser.add_argument("-t", "--to", dest="target", required=True, choices=list(FORMATS) + [COCO, SNAPSHOT],
+                        help="Format to convert to")
+    parser.add_argument("-i", "--image-dir",
+                        help="Directory with the images (default: label_dir, or the directory of the COCO file)")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for the converted files (default: label_dir, or next to the images of a "
+                             "COCO file), or the COCO or snapshot file to write (default: label_dir/annotations.json "
+                             "or label_dir/snapshot.npz, a .parquet snapshot needs pyarrow)")
+    parser.add_argument("-c", "--classes",
+                        help="Class list, one name per line, used for YOLO indices and COCO category ids "
+                             "(default: labels.txt of YOLO sources, or all labels found, sorted)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="When importing a COCO file, keep the label files images already have instead of "
+                             "replacing them")
+    args = parser.parse_args(argv)
+    if args.source == COCO and args.target not in FORMATS:
+        parser.error("COCO files can only be converted to per-image label files")
+
+    try:
+        class_list = read_class_list(args.classes) if args.classes else None
+        if args.source == COCO:
+            from libs.coco_io import import_coco
+            start = time.perf_counter()
+            coco = import_coco(args.label_dir, args.image_dir or os.path.dirname(os.path.abspath(args.label_dir)),
+                               FORMATS[args.target], args.output_dir, class_list, args.jobs, args.skip_existing)
+            elapsed = time.perf_counter() - start
+            for error in coco.errors:
+                print(error, file=sys.stderr)
+            print(f"Wrote {len(coco.written)} label files for {coco.images} images and {coco.annotations} "
+                  f"annotations in {elapsed:.2f} s ({len(coco.written) / max(elapsed, 1e-9):.0f} files/s), "
+                  f"{coco.skipped} skipped as they had label files, {coco.failed} failed")
+            return 1 if coco.failed else 0
+        if args.target == COCO:
+            output_path = args.output_dir or os.path.join(args.label_dir, 'annotations.json')
+            result = export_to_coco(args.label_dir, FORMATS[args.source], output_path, args.image_dir, class_list,
+                                    args.jobs, _print_progress)
+        elif args.target == SNAPSHOT:
+            output_path = args.output_dir or os.path.join(args.label_dir, 'snapshot.npz')
+            result = export_to_snapshot(args.label_dir, FORMATS[args.source], output_path, args.image_dir,
+                                        class_list, args.jobs, _print_progress)
+        else:
+            result = convert(args.label_dir, FORMATS[args.source], FORMATS[args.target], args.image_dir,
+                             args.output_dir, class_list, args.jobs, _print_progress)
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(f"labelimg-convert: {e}")
+    print(file=sys.stderr)
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    print(f"Converted {result.converted} images from {result.total} label files in {result.elapsed:.2f} s "
+          f"({result.files_per_second:.0f} files/s), {result.failed} failed")
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -120,14 +120,28 @@ class CreateMLReader:
                     self.add_shape(shape["label"], shape["coordinates"])
 
     def add_shape(self, label, bnd_box):
+        points = CreateMLReader.coordinates_to_points(bnd_box)
+        self.shapes.append((label, points, None, None, True))
+
+    @staticmethod
+    def coordinates_to_points(bnd_box):
         x_min = bnd_box["x"] - (bnd_box["width"] / 2)
         y_min = bnd_box["y"] - (bnd_box["height"] / 2)
 
         x_max = bnd_box["x"] + (bnd_box["width"] / 2)
         y_max = bnd_box["y"] + (bnd_box["height"] / 2)
 
-        points = [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
-        self.shapes.append((label, points, None, None, True))
+        return [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
 
     def get_shapes(self):
         return self.shapes
+
+
+def read_create_ml_images(json_path):
+    """(image name, [(label, points)], verified) of every image in a CreateML file, parsing it once."""
+    with open(json_path, "r") as file:
+        output_list = json.loads(file.read())
+    for image in output_list:
+        shapes = [(shape["label"], CreateMLReader.coordinates_to_points(shape["coordinates"]))
+                  for shape in image["annotations"]]
+        yield image["image"], shapes, image.get("verified", False)
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS uncertainty (
+    path TEXT PRIMARY KEY,
+    score REAL NOT NULL,
+    model TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interpolated (
+    path TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_hash (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash INTEGER NOT NULL
+);
+'''
+# SQLite integers are signed 64 bit
+_HASH_OFFSET = 1 << 64
+
+
+def default_index_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'labelImg', 'index')
+
+
+class DatasetIndex:
+    """Per-dataset SQLite database of data computed from the images.
+
+    The database lives in the user cache directory, named after the dataset
+    directory, so datasets on read-only or shared storage are not touched and
+    the file watcher does not see the writes. Paths are stored relative to
+    the dataset directory.
+    """
+
+    def __init__(self, dataset_dir, index_dir=None):
+        self.dataset_dir = os.path.abspath(dataset_dir)
+        index_dir = index_dir or default_index_dir()
+        os.makedirs(index_dir, exist_ok=True)
+        name = hashlib.blake2b(self.dataset_dir.encode('utf-8'), digest_size=10).hexdigest()
+        self.path = os.path.join(index_dir, name + '.sqlite')
+        # Written from background threads as well
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.dataset_dir)
+
+    def _absolute(self, path):
+        return os.path.join(self.dataset_dir, path)
+
+    def set_uncertainty(self, scores, model=None):
+        """Store `scores`, a dict of image path to uncertainty, in one transaction."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO uncertainty (path, score, model, updated) VALUES (?, ?, ?, ?)',
+                [(self._relative(path), float(score), model, now) for path, score in scores.items()],
+            )
+
+    def uncertainty(self):
+        """Dict of image path to the last stored uncertainty score."""
+        with self._lock:
+            rows = self._connection.execute('SELECT path, score FROM uncertainty').fetchall()
+        return {self._absolute(path): score for path, score in rows}
+
+    def set_interpolated(self, paths):
+        """Record that the labels of `paths` were interpolated rather than drawn."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO interpolated (path, updated) VALUES (?, ?)',
+                [(self._relative(path), now) for path in paths],
+            )
+
+    def clear_interpolated(self, paths):
+        """Forget the interpolation of `paths`, e.g. after they were edited by hand."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM interpolated WHERE path = ?', [(self._relative(path),) for path in paths]
+            )
+
+    def interpolated(self):
+        """Set of image paths whose labels were interpolated."""
+        with self._lock:
+            rows = self._connection.execute('SELECT path FROM interpolated').fetchall()
+        return {self._absolute(path) for path, in rows}
+
+    def set_image_hashes(self, hashes):
+        """Store `hashes`, a dict of image path to ((mtime in ns, size), 64 bit perceptual hash)."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO image_hash (path, mtime_ns, size, hash) VALUES (?, ?, ?, ?)',
+                [(self._relative(path), mtime_ns, size, value - _HASH_OFFSET if value >= 1 << 63 else value)
+                 for path, ((mtime_ns, size), value) in hashes.items()],
+            )
+
+    def image_hashes(self):
+        """Dict of image path to ((mtime in ns, size), perceptual hash) of the image when it was hashed."""
+        with self._lock:
+            rows = self._connection.execute('SELECT path, mtime_ns, size, hash FROM image_hash').fetchall()
+        return {self._absolute(path): ((mtime_ns, size), value % _HASH_OFFSET) for path, mtime_ns, size, value in rows}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
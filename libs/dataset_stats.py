@@ -0,0 +1,155 @@
+"""Class balance and box size statistics of a dataset.
+
+All statistics are counts: boxes and images per class, and histograms over
+fixed bins of the box area relative to the image, the box aspect ratio and
+the number of boxes per image. They are computed with a few NumPy passes
+over a box table like the one SnapshotBuilder.arrays() returns, and an image
+whose labels changed is updated by subtracting its old counts and adding the
+new ones.
+"""
+
+import html
+
+import numpy as np
+
+# Bin edges of the box area as a fraction of the image area
+AREA_BINS = np.geomspace(1e-4, 1.0, 9)
+# Bin edges of the box width / height
+ASPECT_BINS = 2.0 ** np.arange(-3.0, 3.5, 0.5)
+# Images with at least this many boxes share the last bin
+MAX_BOXES_PER_IMAGE = 20
+
+
+def _bins(values, edges):
+    """Bin index of every value; values outside the edges go to the first or last bin."""
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+
+
+def _counts(image_id, class_id, boxes, widths, heights, image_count, class_count):
+    """(boxes per class, images per class, area histogram, aspect histogram, boxes per image histogram)."""
+    box_counts = np.bincount(class_id, minlength=class_count)
+    pairs = np.unique(image_id.astype(np.int64) * class_count + class_id)
+    image_counts = np.bincount(pairs % class_count, minlength=class_count) if class_count else box_counts
+    per_image = np.bincount(image_id, minlength=image_count)
+    boxes_per_image = np.bincount(np.minimum(per_image, MAX_BOXES_PER_IMAGE), minlength=MAX_BOXES_PER_IMAGE + 1)
+
+    box_widths = boxes[:, 2] - boxes[:, 0]
+    box_heights = boxes[:, 3] - boxes[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        area = box_widths * box_heights / (widths[image_id].astype(np.float64) * heights[image_id])
+        aspect = box_widths / box_heights
+    area_hist = np.bincount(_bins(area, AREA_BINS), minlength=len(AREA_BINS) - 1)
+    aspect_hist = np.bincount(_bins(aspect, ASPECT_BINS), minlength=len(ASPECT_BINS) - 1)
+    return box_counts, image_counts, area_hist, aspect_hist, boxes_per_image
+
+
+class DatasetStats:
+    """Statistics of the images `paths` and their box table `arrays`.
+
+    `arrays` has the keys of SnapshotBuilder.arrays(), with the images in the
+    order of `paths`.
+    """
+
+    def __init__(self, paths, arrays):
+        self.classes = [str(name) for name in arrays['classes']]
+        self._class_ids = {name: i for i, name in enumerate(self.classes)}
+        self._index = {path: i for i, path in enumerate(paths)}
+        self.image_count = len(paths)
+        self.box_count = len(arrays['image_id'])
+        image_id = np.asarray(arrays['image_id'], dtype=np.int64)
+        (self.box_counts, self.image_counts, self.area_hist, self.aspect_hist,
+         self.boxes_per_image) = _counts(
+            image_id, np.asarray(arrays['class_id'], dtype=np.int64), np.asarray(arrays['boxes'], dtype=np.float64),
+            np.asarray(arrays['widths']), np.asarray(arrays['heights']), self.image_count, len(self.classes))
+
+        # Rows of every image, to take its counts back out when it changes
+        order = np.argsort(image_id, kind='stable')
+        self._offsets = np.searchsorted(image_id[order], np.arange(self.image_count + 1))
+        self._order = order
+        self._table = arrays
+        # Image index -> (class ids, boxes, width, height) of images updated since
+        self._replaced = {}
+
+    @property
+    def labelled_images(self):
+        return self.image_count - int(self.boxes_per_image[0])
+
+    def _class_id(self, name):
+        if name not in self._class_ids:
+            self._class_ids[name] = len(self.classes)
+            self.classes.append(name)
+            self.box_counts = np.append(self.box_counts, 0)
+            self.image_counts = np.append(self.image_counts, 0)
+        return self._class_ids[name]
+
+    def _image_rows(self, index):
+        if index in self._replaced:
+            return self._replaced[index]
+        rows = self._order[self._offsets[index]:self._offsets[index + 1]]
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 4)), 0, 0
+        return (np.asarray(self._table['class_id'])[rows].astype(np.int64),
+                np.asarray(self._table['boxes'])[rows].astype(np.float64),
+                int(self._table['widths'][index]), int(self._table['heights'][index]))
+
+    def _add(self, rows, sign):
+        class_id, boxes, width, height = rows
+        counts = _counts(np.zeros(len(class_id), dtype=np.int64), class_id, boxes, np.asarray([width]),
+                         np.asarray([height]), 1, len(self.classes))
+        self.box_counts += sign * counts[0]
+        self.image_counts += sign * counts[1]
+        self.area_hist += sign * counts[2]
+        self.aspect_hist += sign * counts[3]
+        self.boxes_per_image += sign * counts[4]
+        self.box_count += sign * len(class_id)
+
+    def replace_image(self, path, labels, boxes, image_shape):
+        """Count the (N, 4) `boxes` named `labels` as the boxes of `path` from now on.
+
+        Images that are not part of the statistics yet are added.
+        """
+        index = self._index.get(path)
+        if index is None:
+            index = self._index[path] = self.image_count
+            self.image_count += 1
+            self.boxes_per_image[0] += 1
+            self._replaced[index] = (np.zeros(0, dtype=np.int64), np.zeros((0, 4)), 0, 0)
+        self._add(self._image_rows(index), -1)
+        rows = (np.asarray([self._class_id(name) for name in labels], dtype=np.int64),
+                np.asarray(boxes, dtype=np.float64).reshape(-1, 4), int(image_shape[1]), int(image_shape[0]))
+        self._replaced[index] = rows
+        self._add(rows, 1)
+
+
+def _bar_rows(names, counts):
+    total = max(1, int(counts.sum()))
+    peak = max(1, int(counts.max())) if len(counts) else 1
+    return ''.join(
+        f'<tr><td>{html.escape(name)}</td><td align="right">{count}</td>'
+        f'<td align="right">{100.0 * count / total:.1f}%</td><td>{"&#9608;" * round(20 * count / peak)}</td></tr>'
+        for name, count in zip(names, counts.tolist())
+    )
+
+
+def stats_html(stats):
+    """The statistics as an HTML report."""
+    order = np.lexsort((np.arange(len(stats.classes)), -stats.box_counts))
+    classes = ''.join(
+        f'<tr><td>{html.escape(stats.classes[i])}</td><td align="right">{int(stats.box_counts[i])}</td>'
+        f'<td align="right">{int(stats.image_counts[i])}</td></tr>'
+        for i in order if stats.box_counts[i] or stats.image_counts[i]
+    )
+    area_names = [f'{100 * low:.2g}\u2013{100 * high:.2g}%' for low, high in zip(AREA_BINS[:-1], AREA_BINS[1:])]
+    aspect_names = [f'{low:.2g}\u2013{high:.2g}' for low, high in zip(ASPECT_BINS[:-1], ASPECT_BINS[1:])]
+    per_image_names = [str(i) for i in range(MAX_BOXES_PER_IMAGE)] + [f'{MAX_BOXES_PER_IMAGE}+']
+    # Zero counts of boxes per image past the largest one are noise
+    used = np.flatnonzero(stats.boxes_per_image)
+    per_image_end = int(used[-1]) + 1 if len(used) else 1
+    return (
+        f'<p>{stats.image_count} images, {stats.labelled_images} with boxes, {stats.box_count} boxes</p>'
+        f'<h4>Classes</h4><table><tr><th align="left">Class</th><th>Boxes</th><th>Images</th></tr>{classes}</table>'
+        f'<h4>Box area (of the image)</h4><table>{_bar_rows(area_names, stats.area_hist)}</table>'
+        f'<h4>Box aspect ratio (width / height)</h4><table>{_bar_rows(aspect_names, stats.aspect_hist)}</table>'
+        f'<h4>Boxes per image</h4><table>'
+        f'{_bar_rows(per_image_names[:per_image_end], stats.boxes_per_image[:per_image_end])}</table>'
+    )
@@ -0,0 +1,290 @@
+"""Find near-duplicate images with perceptual hashes.
+
+Every image is decoded straight to 32x32 grayscale (JPEGs are scaled down
+while decoding, the full image is never built) and reduced to a 64 bit
+perceptual hash: the signs of the 8x8 lowest frequencies of its DCT against
+their median. Images whose hashes differ in few bits look alike. The hashes
+are computed in parallel worker processes and kept in the DatasetIndex, so
+only new or changed images are decoded again. Groups are found by
+multi-index hashing, which only compares hashes sharing a part of their
+bits, instead of comparing all pairs:
+
+    labelimg-dedup images/
+    labelimg-dedup images/ -d 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from libs.convert import CHUNK_SIZE
+from libs.image_size import is_image_file
+from libs.trash import TRASH_DIR_NAME
+
+HASH_SIZE = 8
+DECODE_SIZE = 32
+# Largest Hamming distance of two hashes of the same picture, recompressed or resized
+MAX_DISTANCE = 6
+
+
+def _dct_matrix(size):
+    n = np.arange(size)
+    return np.cos(np.pi * np.outer(n, 2 * n + 1) / (2 * size))
+
+
+_DCT = _dct_matrix(DECODE_SIZE)[:HASH_SIZE]
+# Set bits of every byte value, for NumPy before 2.0
+_BIT_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _decode_small(path):
+    """The image at `path` as a DECODE_SIZE x DECODE_SIZE grayscale array, None if it cannot be read."""
+    from PyQt5.QtCore import QSize
+    from PyQt5.QtGui import QImage, QImageReader
+
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    reader.setScaledSize(QSize(DECODE_SIZE, DECODE_SIZE))
+    image = reader.read()
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = image.constBits()
+    bits.setsize(image.bytesPerLine() * DECODE_SIZE)
+    return np.frombuffer(bits, dtype=np.uint8).reshape(DECODE_SIZE, -1)[:, :DECODE_SIZE].astype(np.float64)
+
+
+def hash_pixels(pixels):
+    """64 bit perceptual hashes of a (N, DECODE_SIZE, DECODE_SIZE) stack of grayscale images."""
+    low = (_DCT @ pixels @ _DCT.T).reshape(len(pixels), -1)
+    # The DC term is the mean brightness, it would dominate the median
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return [int.from_bytes(row.tobytes(), 'big') for row in np.packbits(bits, axis=1)]
+
+
+def image_hash(path):
+    """Perceptual hash of the image at `path`, None if it cannot be read."""
+    pixels = _decode_small(path)
+    return None if pixels is None else hash_pixels(pixels[np.newaxis])[0]
+
+
+def _hash_chunk(paths):
+    """[(path, (mtime in ns, size), hash or None)] of the images `paths`."""
+    stamps = []
+    pixels = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stamps.append((path, (stat.st_mtime_ns, stat.st_size), _decode_small(path)))
+        if stamps[-1][2] is not None:
+            pixels.append(stamps[-1][2])
+    hashes = iter(hash_pixels(np.stack(pixels)) if pixels else [])
+    return [(path, stamp, None if image is None else next(hashes)) for path, stamp, image in stamps]
+
+
+def hamming(a, b):
+    """Number of differing bits of the uint64 arrays `a` and `b`, element-wise."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(a ^ b)
+    return _BIT_COUNTS[np.ascontiguousarray(a ^ b).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _near_pairs(values, max_distance):
+    """(left, right) indices of the pairs of `values` within `max_distance` bits.
+
+    Multi-index hashing: the 64 bits are cut into max_distance + 1 parts, and
+    two hashes within max_distance differ in at most max_distance of them, so
+    they are equal in at least one. Only the pairs sharing a part are compared.
+    """
+    left = []
+    right = []
+    bounds = [64 * i // (max_distance + 1) for i in range(max_distance + 2)]
+    positions = np.arange(len(values))
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        part = (values >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+        order = np.argsort(part, kind='stable')
+        part = part[order]
+        ordered = values[order]
+        starts = np.flatnonzero(np.concatenate([[True], part[1:] != part[:-1]]))
+        sizes = np.diff(np.append(starts, len(part)))
+        # End of the run of equal parts every sorted position belongs to
+        run_ends = np.repeat(starts + sizes, sizes)
+        # Compare every position with the one `step` places further in its run
+        step = 1
+        active = positions[run_ends - positions > step]
+        while len(active):
+            near = active[hamming(ordered[active], ordered[active + step]) <= max_distance]
+            left.append(order[near])
+            right.append(order[near + step])
+            step += 1
+            active = active[run_ends[active] - active > step]
+    if not left:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def group_hashes(hashes, max_distance=MAX_DISTANCE):
+    """Groups of the keys of `hashes` whose hashes are chained within `max_distance` bits of each other.
+
+    Only groups of at least two keys are returned.
+    """
+    keys = list(hashes)
+    values, inverse = np.unique(np.fromiter(hashes.values(), dtype=np.uint64, count=len(keys)), return_inverse=True)
+    left, right = _near_pairs(values, max_distance)
+
+    # Union-find over the distinct hashes
+    parents = list(range(len(values)))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        parents[root(a)] = root(b)
+
+    groups = {}
+    for key, i in zip(keys, inverse.ravel().tolist()):
+        groups.setdefault(root(i), []).append(key)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+@dataclass
+class DuplicateReport:
+    # Paths of each group, the largest file first
+    groups: list = field(default_factory=list)
+    images: int = 0
+    hashed: int = 0
+    failed: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def duplicates(self):
+        """Images of the groups beyond the first one of each."""
+        return sum(len(group) - 1 for group in self.groups)
+
+    def summary(self):
+        text = "%d near-duplicate groups with %d images to remove among %d images (%d hashed in %.2f s)" % (
+            len(self.groups), self.duplicates, self.images, self.hashed, self.elapsed)
+        if self.failed:
+            text += ", %d unreadable" % len(self.failed)
+        return text
+
+
+def find_duplicates(image_paths, max_distance=MAX_DISTANCE, index=None, workers=None, progress=None):
+    """Group the near-duplicates among `image_paths`.
+
+    Hashes stored in the DatasetIndex `index` are used while the image keeps
+    its modification time and size; the others are computed in `workers`
+    processes and stored. `progress(done, total)` is called as chunks of
+    images are hashed. Returns a DuplicateReport.
+    """
+    start = time.perf_counter()
+    report = DuplicateReport(images=len(image_paths))
+    cached = index.image_hashes() if index is not None else {}
+    hashes = {}
+    sizes = {}
+    missing = []
+    for path in image_paths:
+        entry = cached.get(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        sizes[path] = stat.st_size
+        if entry is not None and entry[0] == (stat.st_mtime_ns, stat.st_size):
+            hashes[path] = entry[1]
+        else:
+            missing.append(path)
+
+    chunks = [missing[i:i + CHUNK_SIZE] for i in range(0, len(missing), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(chunks) > 1:
+        # Spawned like the other dataset workers, a forked Qt process is not safe
+        pool = multiprocessing.get_context('spawn').Pool(min(workers, len(chunks)))
+        results = pool.imap_unordered(_hash_chunk, chunks)
+    else:
+        pool = None
+        results = map(_hash_chunk, chunks)
+    try:
+        done = 0
+        for rows in results:
+            computed = {}
+            for path, stamp, value in rows:
+                if value is None:
+                    report.failed.append(path)
+                else:
+                    hashes[path] = value
+                    computed[path] = (stamp, value)
+            if index is not None and computed:
+                index.set_image_hashes(computed)
+            report.hashed += len(rows)
+            done += 1
+            if progress is not None:
+                progress(min(done * CHUNK_SIZE, len(missing)), len(missing))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    report.groups = sorted(
+        (sorted(group, key=lambda path: (-sizes[path], path)) for group in group_hashes(hashes, max_distance)),
+        key=lambda group: group[0])
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def find_images(image_dir):
+    """Sorted paths of all images below `image_dir`, leaving out the labelImg trash."""
+    paths = []
+    for root, dirs, files in os.walk(image_dir):
+        if TRASH_DIR_NAME in dirs:
+            dirs.remove(TRASH_DIR_NAME)
+        paths.extend(os.path.abspath(os.path.join(root, name)) for name in files if is_image_file(name))
+    paths.sort()
+    return paths
+
+
+def _print_progress(done, total):
+    print(f"\r{done}/{total} images hashed", end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    from libs.dataset_index import DatasetIndex
+
+    parser = argparse.ArgumentParser(prog='labelimg-dedup', description=__doc__.split('\n\n')[0])
+    parser.add_argument("image_dir", help="Directory with the images, searched recursively")
+    parser.add_argument("-d", "--distance", type=int, default=MAX_DISTANCE,
+                        help=f"Largest number of differing hash bits of near-duplicates (default: {MAX_DISTANCE})")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    try:
+        index = DatasetIndex(args.image_dir)
+        try:
+            report = find_duplicates(find_images(args.image_dir), args.distance, index, args.jobs, _print_progress)
+        finally:
+            index.close()
+    except OSError as e:
+        sys.exit(f"labelimg-dedup: {e}")
+    print(file=sys.stderr)
+    for path in report.failed:
+        print(f"{path}: cannot be read", file=sys.stderr)
+    # The first image of each group is the one to keep
+    for group in report.groups:
+        print('\n'.join(group) + '\n')
+    print(report.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
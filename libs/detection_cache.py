@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+import zipfile
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'labelImg', 'detections')
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Content hash of a file, used as cache key for model weights and images."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """Persistent cache of raw model detections.
+
+    Each entry holds an (N, 6) float32 array of x1, y1, x2, y2, confidence,
+    class id stored before any confidence filtering, and the (height, width)
+    of the image. Entries are keyed by the content hashes of the model weights
+    and of the image. When the cache grows past `max_bytes` the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _entry_path(self, model_digest, image_digest):
+        return os.path.join(self.cache_dir, model_digest, image_digest[:2], image_digest + '.npz')
+
+    def get(self, model_digest, image_digest):
+        """Return the cached (detections, (height, width)) or None."""
+        path = self._entry_path(model_digest, image_digest)
+        try:
+            with np.load(path) as entry:
+                detections = entry['detections']
+                height, width = entry['image_shape'].tolist()
+            # Refresh the access time used for LRU eviction
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        return detections, (height, width)
+
+    def put(self, model_digest, image_digest, detections, image_shape):
+        path = self._entry_path(model_digest, image_digest)
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, detections=detections, image_shape=np.asarray(image_shape[:2], dtype=np.int64))
+            if self._size is not None:
+                # An overwritten entry no longer counts
+                try:
+                    self._size -= os.path.getsize(path)
+                except OSError:
+                    pass
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.npz'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Shrink well below the limit so eviction does not run on every put
+        target = self.max_bytes * 0.8
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
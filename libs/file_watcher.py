@@ -0,0 +1,209 @@
+import os
+import time
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+from libs.create_ml_io import JSON_EXT
+from libs.pascal_voc_io import XML_EXT
+from libs.trash import TRASH_DIR_NAME
+from libs.yolo_io import TXT_EXT
+
+LABEL_EXTENSIONS = (XML_EXT, TXT_EXT, JSON_EXT)
+
+
+class DatasetWatcher(QObject):
+    """Watches the opened image directory tree and the label directory.
+
+    File system notifications are collected and debounced: one batch of
+    changes is reported after `debounce_ms` of quiet, or at the latest after
+    `max_latency_ms`, so bursts of thousands of files result in a single
+    update of the GUI.
+
+    Qt only reports additions, removals and renames for watched directories,
+    so in-place modifications are detected for explicitly watched label files
+    (see `watch_files`) only.
+    """
+    # added image paths, removed image paths
+    imagesChanged = pyqtSignal(list, list)
+    # label files that were added, removed or modified
+    labelsChanged = pyqtSignal(list)
+
+    def __init__(self, image_extensions, parent=None, debounce_ms=300, max_latency_ms=2000):
+        super(DatasetWatcher, self).__init__(parent)
+        self.image_extensions = tuple(image_extensions)
+        self.max_latency = max_latency_ms / 1000.0
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._flush)
+        self._listings = {}
+        self._pending_dirs = set()
+        self._pending_files = set()
+        self._pending_since = None
+        self._acknowledged = {}
+        self.image_dir = None
+        self.label_dir = None
+
+    def watch(self, image_dir, label_dir=None, listings=None):
+        """Start watching `image_dir` recursively and `label_dir`, dropping previous watches.
+
+        `listings` maps every directory of the tree to the names in it; the
+        tree is walked when it is not given. The caller must not modify it
+        afterwards.
+        """
+        self.stop()
+        self.image_dir = image_dir
+        if listings is None:
+            listings = {}
+            for root, dirs, files in os.walk(image_dir):
+                listings[root] = set(files).union(dirs)
+                if TRASH_DIR_NAME in dirs:
+                    dirs.remove(TRASH_DIR_NAME)
+        self._listings.update(listings)
+        self.set_label_dir(label_dir)
+        self._add_paths(list(self._listings))
+
+    def set_label_dir(self, label_dir):
+        if self.label_dir and self.label_dir != label_dir and not self._is_image_dir(self.label_dir):
+            self._watcher.removePath(self.label_dir)
+            self._listings.pop(self.label_dir, None)
+        self.label_dir = label_dir
+        if label_dir and os.path.isdir(label_dir) and label_dir not in self._listings:
+            self._listings[label_dir] = set(os.listdir(label_dir))
+            self._add_paths([label_dir])
+
+    def watch_files(self, paths):
+        """Watch the given files for in-place modifications, replacing the previously watched ones."""
+        files = self._watcher.files()
+        if files:
+            self._watcher.removePaths(files)
+        paths = [p for p in paths if os.path.isfile(p)]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def acknowledge(self, path):
+        """Record a change made by labelImg itself so it is not reported back."""
+        self._acknowledged[path] = self._mtime(path)
+        directory, name = os.path.split(path)
+        listing = self._listings.get(directory)
+        if listing is None:
+            return
+        if os.path.exists(path):
+            listing.add(name)
+        else:
+            listing.discard(name)
+
+    def stop(self):
+        self._timer.stop()
+        for paths in (self._watcher.directories(), self._watcher.files()):
+            if paths:
+                self._watcher.removePaths(paths)
+        self._listings.clear()
+        self._pending_dirs.clear()
+        self._pending_files.clear()
+        self._pending_since = None
+        self._acknowledged.clear()
+        self.image_dir = None
+        self.label_dir = None
+
+    def _is_image_dir(self, path):
+        return self.image_dir is not None and (
+            path == self.image_dir or path.startswith(os.path.join(self.image_dir, ''))
+        )
+
+    def _add_paths(self, paths):
+        if not paths:
+            return
+        failed = self._watcher.addPaths(paths)
+        if failed:
+            print(f"Warning: Unable to watch {len(failed)} directories for changes")
+
+    def _schedule(self):
+        now = time.monotonic()
+        if self._pending_since is None:
+            self._pending_since = now
+        if now - self._pending_since >= self.max_latency:
+            self._flush()
+        else:
+            self._timer.start()
+
+    def _on_directory_changed(self, path):
+        self._pending_dirs.add(path)
+        self._schedule()
+
+    def _on_file_changed(self, path):
+        self._pending_files.add(path)
+        # Editors that save by replacing the file drop the watch, so re-add it.
+        if os.path.isfile(path) and path not in self._watcher.files():
+            self._watcher.addPath(path)
+        self._schedule()
+
+    def _flush(self):
+        self._timer.stop()
+        self._pending_since = None
+        pending_dirs, self._pending_dirs = self._pending_dirs, set()
+        changed_labels, self._pending_files = set(self._pending_files), set()
+        added_images = []
+        removed_images = []
+
+        while pending_dirs:
+            directory = pending_dirs.pop()
+            old_names = self._listings.get(directory)
+            if old_names is None:
+                continue
+            try:
+                new_names = set(os.listdir(directory))
+            except OSError:
+                # The directory itself was removed.
+                new_names = set()
+                del self._listings[directory]
+            else:
+                self._listings[directory] = new_names
+
+            for name in new_names - old_names:
+                path = os.path.join(directory, name)
+                if self._is_image_dir(directory) and os.path.isdir(path):
+                    if name != TRASH_DIR_NAME:
+                        # Report the content of new subdirectories as added.
+                        self._listings[path] = set()
+                        self._add_paths([path])
+                        pending_dirs.add(path)
+                    continue
+                self._classify(path, added_images, changed_labels)
+            for name in old_names - new_names:
+                path = os.path.join(directory, name)
+                if path in self._listings:
+                    for sub_dir in [d for d in self._listings if d == path or d.startswith(os.path.join(path, ''))]:
+                        for sub_name in self._listings.pop(sub_dir):
+                            self._classify(os.path.join(sub_dir, sub_name), removed_images, changed_labels)
+                    continue
+                self._classify(path, removed_images, changed_labels)
+
+        # Drop notifications about changes labelImg made itself.
+        changed_labels = {
+            p for p in changed_labels
+            if p not in self._acknowledged or self._acknowledged[p] != self._mtime(p)
+        }
+
+        if added_images or removed_images:
+            self.imagesChanged.emit(sorted(added_images), sorted(removed_images))
+        if changed_labels:
+            self.labelsChanged.emit(sorted(changed_labels))
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _classify(self, path, images, labels):
+        lower = path.lower()
+        if lower.endswith(self.image_extensions):
+            if self._is_image_dir(os.path.dirname(path)):
+                images.append(os.path.abspath(path))
+        elif lower.endswith(LABEL_EXTENSIONS):
+            labels.add(path)
@@ -0,0 +1,145 @@
+import os
+import struct
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+
+# JPEG start of frame markers, the ones that carry the image size
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without a length field
+_JPEG_STANDALONE = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def is_image_file(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def image_shape(path):
+    """[height, width, depth] of an image, read from its header without decoding it.
+
+    Depth is 1 for grayscale images and 3 otherwise, as in LabelFile.image_shape.
+    Understands PNG, JPEG, GIF, BMP, WebP and TIFF, and the frames of videos.
+    Raises ValueError for anything else.
+    """
+    from libs.video_source import parse_frame_path
+    frame = parse_frame_path(path)
+    if frame is not None:
+        from libs.video_source import open_video
+        source = open_video(frame[0])
+        return [source.height, source.width, 3]
+
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', head[16:24])
+            # Color type 0 is grayscale
+            return [height, width, 1 if head[25] == 0 else 3]
+        if head.startswith(b'\xff\xd8'):
+            return _jpeg_shape(f)
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack('<HH', head[6:10])
+            return [height, width, 3]
+        if head.startswith(b'BM'):
+            width, height = struct.unpack('<ii', head[18:26])
+            # Negative heights mark top-down bitmaps
+            return [abs(height), width, _bmp_depth(f)]
+        if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+            return _webp_shape(head)
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            return _tiff_shape(f, '<' if head[:2] == b'II' else '>')
+    raise ValueError(f"Unknown image format: {path}")
+
+
+def _jpeg_shape(f):
+    f.seek(2)
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        if not byte:
+            break
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        # Fill bytes before the marker
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            break
+        marker = marker[0]
+        if marker in _JPEG_STANDALONE:
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            break
+        length = struct.unpack('>H', length)[0]
+        if marker in _JPEG_SOF:
+            _precision, height, width, components = struct.unpack('>BHHB', f.read(6))
+            # Shown rotated by a quarter turn, like the GUI does
+            if orientation in (5, 6, 7, 8):
+                height, width = width, height
+            return [height, width, 1 if components == 1 else 3]
+        if marker == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b'Exif\x00\x00'):
+                orientation = _exif_orientation(data[6:])
+            continue
+        f.seek(length - 2, os.SEEK_CUR)
+    raise ValueError(f"No frame header in JPEG file {f.name}")
+
+
+def _exif_orientation(tiff):
+    """The orientation tag of the EXIF data of a JPEG, 1 (upright) if there is none."""
+    order = '<' if tiff[:2] == b'II' else '>'
+    try:
+        offset = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+        for i in range(count):
+            entry = tiff[offset + 2 + 12 * i:offset + 14 + 12 * i]
+            if struct.unpack(order + 'H', entry[:2])[0] == 0x0112:
+                return struct.unpack(order + 'H', entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _bmp_depth(f):
+    f.seek(14)
+    header = f.read(40)
+    header_size, = struct.unpack('<I', header[:4])
+    bits, = struct.unpack('<H', header[14:16])
+    if bits > 8:
+        return 3
+    # Palette images are grayscale when every palette entry is a gray
+    colors = struct.unpack('<I', header[32:36])[0] or 1 << bits
+    f.seek(14 + header_size)
+    palette = f.read(4 * colors)
+    gray = all(palette[i] == palette[i + 1] == palette[i + 2] for i in range(0, len(palette) - 3, 4))
+    return 1 if gray else 3
+
+
+def _webp_shape(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return [height & 0x3fff, width & 0x3fff, 3]
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return [((bits >> 14) & 0x3fff) + 1, (bits & 0x3fff) + 1, 3]
+    if chunk == b'VP8X':
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return [height, width, 3]
+    raise ValueError(f"Unknown WebP chunk {chunk!r}")
+
+
+def _tiff_shape(f, order):
+    f.seek(4)
+    f.seek(struct.unpack(order + 'I', f.read(4))[0])
+    count = struct.unpack(order + 'H', f.read(2))[0]
+    tags = {}
+    for _ in range(count):
+        tag, kind, _count, value = struct.unpack(order + 'HHI4s', f.read(12))
+        # SHORT values sit in the first two bytes of the value field
+        tags[tag] = struct.unpack(order + ('H' if kind == 3 else 'I'), value[:2 if kind == 3 else 4])[0]
+    if 256 not in tags or 257 not in tags:
+        raise ValueError(f"No image size in TIFF file {f.name}")
+    return [tags[257], tags[256], 1 if tags.get(277, 1) == 1 else 3]
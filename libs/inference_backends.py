@@ -0,0 +1,186 @@
+import ast
+import os
+from abc import ABC, abstractmethod
+
+# numpy, cv2 and the inference libraries are imported on first use to keep
+# them out of the GUI startup.
+
+# Matches the defaults of ultralytics, so both backends give the same boxes
+DEFAULT_IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS_CANDIDATES = 30000
+DEFAULT_INPUT_SIZE = 640
+
+
+class InferenceBackend(ABC):
+    """Runs a detection model on a list of images.
+
+    `names` maps class ids to class names. `predict` takes image paths or
+    decoded BGR arrays and returns, per image, an (N, 6) float32 array of
+    x1, y1, x2, y2, confidence, class id rows in original image coordinates,
+    and the (height, width) of the image.
+    """
+    names = {}
+
+    @abstractmethod
+    def predict(self, sources, conf_threshold):
+        pass
+
+
+class TorchBackend(InferenceBackend):
+    """PyTorch `.pt` weights run through ultralytics."""
+
+    def __init__(self, model_path, num_threads=None):
+        # Imported on first use: torch and ultralytics take seconds to load
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+
+    def predict(self, sources, conf_threshold):
+        import numpy as np
+        results = self.model(sources, conf=conf_threshold, verbose=False)
+        return [
+            (np.asarray(r.boxes.data.tolist(), dtype=np.float32).reshape(-1, 6), tuple(r.orig_shape[:2]))
+            for r in results
+        ]
+
+
+def letterbox(image, new_shape, color=114):
+    """Resize `image` keeping its aspect ratio and pad it to `new_shape` (height, width).
+
+    Returns the padded image, the scale factor and the (left, top) padding.
+    """
+    import cv2
+    import numpy as np
+    height, width = image.shape[:2]
+    ratio = min(new_shape[0] / height, new_shape[1] / width)
+    new_height, new_width = round(height * ratio), round(width * ratio)
+    if (new_height, new_width) != (height, width):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top = (new_shape[0] - new_height) // 2
+    left = (new_shape[1] - new_width) // 2
+    padded = np.full((new_shape[0], new_shape[1], 3), color, dtype=np.uint8)
+    padded[top:top + new_height, left:left + new_width] = image
+    return padded, ratio, (left, top)
+
+
+def preprocess(image, input_size):
+    """Letterbox a BGR image into a (3, height, width) RGB float array in [0, 1].
+
+    Returns the array, the scale factor and the (left, top) padding.
+    """
+    padded, ratio, pad = letterbox(image, input_size)
+    return padded[:, :, ::-1].transpose(2, 0, 1) / 255.0, ratio, pad
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """YOLOv8-style models exported to ONNX, run on the CPU with ONNX Runtime.
+
+    Needs neither torch nor ultralytics. The model is expected to output
+    (batch, 4 + classes, anchors) center x, center y, width, height boxes
+    followed by per-class scores, as `yolo export format=onnx` produces.
+    """
+
+    def __init__(self, model_path, num_threads=None, iou_threshold=DEFAULT_IOU_THRESHOLD):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.iou_threshold = iou_threshold
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        if isinstance(height, int) and isinstance(width, int):
+            self.input_size = (height, width)
+        else:
+            self.input_size = (DEFAULT_INPUT_SIZE, DEFAULT_INPUT_SIZE)
+        # Models exported without dynamic axes only accept their fixed batch size
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.names = self._read_names()
+
+    def _read_names(self):
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            try:
+                return ast.literal_eval(metadata['names'])
+            except (ValueError, SyntaxError):
+                pass
+        output_shape = self.session.get_outputs()[0].shape
+        num_classes = output_shape[1] - 4 if isinstance(output_shape[1], int) else 0
+        return {i: str(i) for i in range(num_classes)}
+
+    def predict(self, sources, conf_threshold):
+        import cv2
+        import numpy as np
+        images = []
+        for source in sources:
+            if isinstance(source, (str, os.PathLike)):
+                image = cv2.imread(os.fspath(source))
+                if image is None:
+                    raise ValueError(f"Failed to read image: {source}")
+                source = image
+            images.append(source)
+
+        step = self.batch_size or len(images)
+        outputs = []
+        for i in range(0, len(images), step):
+            chunk = images[i:i + step]
+            blob = np.empty((len(chunk), 3) + self.input_size, dtype=np.float32)
+            transforms = []
+            for j, image in enumerate(chunk):
+                blob[j], ratio, pad = preprocess(image, self.input_size)
+                transforms.append((ratio, pad, image.shape[:2]))
+            predictions = self.session.run(None, {self.input_name: blob})[0]
+            for prediction, (ratio, pad, image_shape) in zip(predictions, transforms):
+                outputs.append((self._postprocess(prediction, conf_threshold, ratio, pad, image_shape), image_shape))
+        return outputs
+
+    def _postprocess(self, prediction, conf_threshold, ratio, pad, image_shape):
+        import numpy as np
+        from libs.box_ops import batched_nms, xywh_to_xyxy
+        if self.names:
+            channels_first = prediction.shape[0] == 4 + len(self.names)
+        else:
+            # There are many more anchors than classes
+            channels_first = prediction.shape[0] < prediction.shape[1]
+        if channels_first:
+            # (4 + classes, anchors) -> (anchors, 4 + classes)
+            prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+        candidates = np.flatnonzero(scores >= conf_threshold)
+        if len(candidates) > MAX_NMS_CANDIDATES:
+            candidates = candidates[np.argsort(-scores[candidates])[:MAX_NMS_CANDIDATES]]
+        boxes = xywh_to_xyxy(prediction[candidates, :4])
+        scores = scores[candidates]
+        class_ids = class_ids[candidates]
+
+        keep = batched_nms(boxes, scores, class_ids, self.iou_threshold)[:MAX_DETECTIONS]
+        left, top = pad
+        height, width = image_shape
+        boxes = (boxes[keep] - [left, top, left, top]) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return np.concatenate([boxes, scores[keep, None], class_ids[keep, None]], axis=1).astype(np.float32)
+
+
+# Model file extensions by preference: ONNX loads faster and runs faster on the CPU
+BACKENDS = {
+    '.onnx': OnnxRuntimeBackend,
+    '.pt': TorchBackend,
+}
+MODEL_EXTENSIONS = tuple(BACKENDS)
+
+
+def create_backend(model_path, num_threads=None):
+    """Create the backend matching the extension of `model_path`."""
+    extension = os.path.splitext(model_path)[1].lower()
+    if extension not in BACKENDS:
+        raise ValueError(f"Unsupported model file '{model_path}', expected one of {', '.join(MODEL_EXTENSIONS)}")
+    return BACKENDS[extension](model_path, num_threads)
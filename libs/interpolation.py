@@ -0,0 +1,121 @@
+import numpy as np
+
+from libs.box_ops import box_iou
+
+
+def shapes_to_boxes(shapes):
+    """Split shape dicts into (N, 4) x1, y1, x2, y2 boxes, labels and difficult flags."""
+    boxes = np.zeros((len(shapes), 4), dtype=np.float32)
+    for i, shape in enumerate(shapes):
+        points = np.asarray(shape['points'], dtype=np.float32)
+        boxes[i, :2] = points.min(axis=0)
+        boxes[i, 2:] = points.max(axis=0)
+    return boxes, [shape['label'] for shape in shapes], [bool(shape.get('difficult', False)) for shape in shapes]
+
+
+def match_shapes(boxes_a, labels_a, boxes_b, labels_b, max_shift=4.0):
+    """Pair the shapes of two keyframes that show the same object.
+
+    Only shapes with the same label are paired. Overlapping pairs are
+    preferred by IoU; an object that moved clear of its old position is
+    still paired with the nearest shape of its label as long as the centers
+    are at most `max_shift` box diagonals apart. Pairs are taken greedily,
+    best first. Returns two index arrays into the first and second keyframe.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes_a) or not len(boxes_b):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    centers_a = (boxes_a[:, :2] + boxes_a[:, 2:]) / 2
+    centers_b = (boxes_b[:, :2] + boxes_b[:, 2:]) / 2
+    distance = np.linalg.norm(centers_a[:, None] - centers_b[None], axis=2)
+    diagonal_a = np.linalg.norm(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    diagonal_b = np.linalg.norm(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    shift = distance / np.maximum((diagonal_a[:, None] + diagonal_b[None]) / 2, 1e-6)
+
+    # Overlapping pairs score (0, 1], disjoint ones below zero by how far they moved
+    iou = box_iou(boxes_a, boxes_b)
+    score = np.where(iou > 0, iou, -shift)
+    same_label = np.asarray(labels_a, dtype=str)[:, None] == np.asarray(labels_b, dtype=str)[None, :]
+    valid = same_label & ((iou > 0) | (shift <= max_shift))
+
+    rows, cols = np.nonzero(valid)
+    order = np.argsort(-score[rows, cols], kind='stable')
+    used_a = np.zeros(len(boxes_a), dtype=bool)
+    used_b = np.zeros(len(boxes_b), dtype=bool)
+    first, second = [], []
+    for row, col in zip(rows[order], cols[order]):
+        if not used_a[row] and not used_b[col]:
+            used_a[row] = used_b[col] = True
+            first.append(row)
+            second.append(col)
+    return np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+
+
+def interpolate_boxes(boxes_a, boxes_b, frames):
+    """Linearly interpolate matched (K, 4) boxes over `frames` frames strictly between the keyframes.
+
+    Returns a (frames, K, 4) array.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    alpha = (np.arange(1, frames + 1, dtype=np.float32) / (frames + 1))[:, None, None]
+    return boxes_a[None] + alpha * (boxes_b - boxes_a)[None]
+
+
+def interpolate_keyframes(first, last, frames, image_shape=None, max_shift=4.0):
+    """Shape dicts for each of the `frames` frames between two keyframes.
+
+    `first` and `last` are the shape dicts of the keyframes. Shapes without
+    a partner in the other keyframe are not carried over, so objects that
+    enter or leave the scene only appear on the keyframes. Boxes are clipped
+    to `image_shape` (height, width, ...) when given.
+    """
+    boxes_a, labels_a, difficult_a = shapes_to_boxes(first)
+    boxes_b, labels_b, difficult_b = shapes_to_boxes(last)
+    index_a, index_b = match_shapes(boxes_a, labels_a, boxes_b, labels_b, max_shift)
+    boxes = interpolate_boxes(boxes_a[index_a], boxes_b[index_b], frames)
+    if image_shape is not None:
+        height, width = image_shape[:2]
+        np.clip(boxes[..., 0::2], 0, width, out=boxes[..., 0::2])
+        np.clip(boxes[..., 1::2], 0, height, out=boxes[..., 1::2])
+    # At least a pixel wide and high, smaller boxes vanish when the writers round them
+    valid = (boxes[..., 2] - boxes[..., 0] >= 1) & (boxes[..., 3] - boxes[..., 1] >= 1)
+
+    labels = [labels_a[i] for i in index_a]
+    difficult = [difficult_a[i] or difficult_b[j] for i, j in zip(index_a, index_b)]
+    result = []
+    for frame_boxes, frame_valid in zip(boxes.tolist(), valid):
+        shapes = []
+        for k in np.flatnonzero(frame_valid):
+            x1, y1, x2, y2 = frame_boxes[k]
+            shapes.append(dict(
+                label=labels[k],
+                points=[(x1, y1), (x2, y1), (x2, y2), (x1, y2)],
+                difficult=difficult[k],
+            ))
+        result.append(shapes)
+    return result
+
+
+def interpolate_sequence(frame_paths, keyframes, image_shapes=None, max_shift=4.0):
+    """Interpolate every gap between consecutive keyframes of a frame sequence.
+
+    `keyframes` maps indices into `frame_paths` to their shape dicts and
+    `image_shapes` optionally maps the same indices to the image shape of
+    the keyframe, which is assumed for the frames that follow it. Returns a
+    dict of frame path to (shape dicts, image shape) for all frames between
+    two keyframes.
+    """
+    image_shapes = image_shapes or {}
+    indices = sorted(keyframes)
+    result = {}
+    for start, end in zip(indices, indices[1:]):
+        if end - start < 2:
+            continue
+        image_shape = image_shapes.get(start)
+        shapes = interpolate_keyframes(keyframes[start], keyframes[end], end - start - 1, image_shape, max_shift)
+        result.update((path, (frame_shapes, image_shape))
+                      for path, frame_shapes in zip(frame_paths[start + 1:end], shapes))
+    return result
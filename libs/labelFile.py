@@ -1,12 +1,14 @@
 # Copyright (c) 2016 Tzutalin
 # Create by TzuTaLin <tzu.ta.lin@gmail.com>
 
-from PyQt5.QtGui import QImage
+# No Qt in here: headless tools and worker processes read and write labels
+# through this module and the format modules it imports.
 
 import os.path
 from enum import Enum
 
 from libs.create_ml_io import CreateMLWriter, JSON_EXT
+from libs.image_size import image_shape as read_image_shape
 from libs.pascal_voc_io import PascalVocWriter, XML_EXT
 from libs.yolo_io import YOLOWriter, TXT_EXT
 
@@ -54,67 +56,42 @@ class LabelFile(object):
         self.verified = False
 
     def save_create_ml_format(self, filename, shapes, image_path, image_data, class_list, line_color=None, fill_color=None, database_src=None):
-        img_folder_name = os.path.basename(os.path.dirname(image_path))
-        img_file_name = os.path.basename(image_path)
-
-        image = QImage()
-        image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
-        writer = CreateMLWriter(img_folder_name, img_file_name,
-                                image_shape, shapes, filename, local_img_path=image_path)
-        writer.verified = self.verified
-        writer.write()
-        return
-
+        self.save_with_image_shape(LabelFileFormat.CREATE_ML, filename, shapes, image_path,
+                                   LabelFile.image_shape_of(image_path, image_data), class_list)
 
     def save_pascal_voc_format(self, filename, shapes, image_path, image_data,
                                line_color=None, fill_color=None, database_src=None):
-        img_folder_path = os.path.dirname(image_path)
-        img_folder_name = os.path.split(img_folder_path)[-1]
-        img_file_name = os.path.basename(image_path)
-        # imgFileNameWithoutExt = os.path.splitext(img_file_name)[0]
-        # Read from file path because self.imageData might be empty if saving to
-        # Pascal format
-        if isinstance(image_data, QImage):
-            image = image_data
-        else:
-            image = QImage()
-            image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
-        writer = PascalVocWriter(img_folder_name, img_file_name,
-                                 image_shape, local_img_path=image_path)
-        writer.verified = self.verified
-
-        for shape in shapes:
-            points = shape['points']
-            label = shape['label']
-            # Add Chris
-            difficult = int(shape['difficult'])
-            bnd_box = LabelFile.convert_points_to_bnd_box(points)
-            writer.add_bnd_box(bnd_box[0], bnd_box[1], bnd_box[2], bnd_box[3], label, difficult)
-
-        writer.save(target_file=filename)
-        return
+        self.save_with_image_shape(LabelFileFormat.PASCAL_VOC, filename, shapes, image_path,
+                                   LabelFile.image_shape_of(image_path, image_data))
 
     def save_yolo_format(self, filename, shapes, image_path, image_data, class_list,
                          line_color=None, fill_color=None, database_src=None):
-        img_folder_path = os.path.dirname(image_path)
-        img_folder_name = os.path.split(img_folder_path)[-1]
+        self.save_with_image_shape(LabelFileFormat.YOLO, filename, shapes, image_path,
+                                   LabelFile.image_shape_of(image_path, image_data), class_list)
+
+    def save_with_image_shape(self, label_format, filename, shapes, image_path, image_shape, class_list=None,
+                              write_class_file=True):
+        """Save `shapes` of an image whose [height, width, depth] is already known.
+
+        Writes through the format writers directly, so the image is never decoded.
+        """
+        img_folder_name = os.path.basename(os.path.dirname(image_path))
         img_file_name = os.path.basename(image_path)
-        # imgFileNameWithoutExt = os.path.splitext(img_file_name)[0]
-        # Read from file path because self.imageData might be empty if saving to
-        # Pascal format
-        if isinstance(image_data, QImage):
-            image = image_data
-        else:
-            image = QImage()
-            image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
-        writer = YOLOWriter(img_folder_name, img_file_name,
-                            image_shape, local_img_path=image_path)
+        match label_format:
+            case LabelFileFormat.CREATE_ML:
+                writer = CreateMLWriter(img_folder_name, img_file_name,
+                                        image_shape, shapes, filename, local_img_path=image_path)
+                writer.verified = self.verified
+                writer.write()
+                return
+            case LabelFileFormat.PASCAL_VOC:
+                writer = PascalVocWriter(img_folder_name, img_file_name,
+                                         image_shape, local_img_path=image_path)
+            case LabelFileFormat.YOLO:
+                writer = YOLOWriter(img_folder_name, img_file_name,
+                                    image_shape, local_img_path=image_path)
+            case _:
+                raise ValueError(f"Unknown label file format: {label_format}")
         writer.verified = self.verified
 
         for shape in shapes:
@@ -125,8 +102,22 @@ class LabelFile(object):
             bnd_box = LabelFile.convert_points_to_bnd_box(points)
             writer.add_bnd_box(bnd_box[0], bnd_box[1], bnd_box[2], bnd_box[3], label, difficult)
 
-        writer.save(target_file=filename, class_list=class_list)
-        return
+        if label_format == LabelFileFormat.YOLO:
+            writer.save(target_file=filename, class_list=class_list, write_class_file=write_class_file)
+        else:
+            writer.save(target_file=filename)
+
+    @staticmethod
+    def image_shape(image):
+        return [image.height(), image.width(),
+                1 if image.isGrayscale() else 3]
+
+    @staticmethod
+    def image_shape_of(image_path, image_data=None):
+        """[height, width, depth] of a QImage the GUI already loaded, or else from the header of `image_path`."""
+        if image_data is not None and hasattr(image_data, 'isGrayscale'):
+            return LabelFile.image_shape(image_data)
+        return read_image_shape(image_path)
 
     def toggle_verify(self):
         self.verified = not self.verified
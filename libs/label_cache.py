@@ -0,0 +1,334 @@
+"""Persistent cache of the boxes read from the label files of a dataset.
+
+Parsing the label file of every image again each time a large dataset is
+opened is slow, so the boxes read from each file are kept in the user cache
+directory: a table with one row per image (modification time and size of its
+label file, where its boxes start and how many there are, image size,
+verified flag) and packed columns of all boxes as float32 pixel corners,
+class ids and difficult flags. The columns are memory-mapped, so the boxes
+of an image are a slice of them, and a row is only used while its label file
+still has the recorded modification time and size.
+
+Box columns are only appended to. The table, the paths and the number of
+valid boxes are written together to one index file, which is replaced
+atomically by flush(); boxes appended after the last flush are dropped when
+the cache is opened again. Once more than half of the boxes belong to
+replaced rows, flush() writes compacted columns under a new generation.
+"""
+
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+CACHE_VERSION = 1
+# Replaced boxes are only compacted away once there are this many
+COMPACT_MIN_BOXES = 100000
+
+TABLE_DTYPE = np.dtype([
+    ('label_mtime', '<i8'),
+    ('label_size', '<i8'),
+    # Of the YOLO class list the boxes were named with, 0 for other formats
+    ('class_mtime', '<i8'),
+    ('start', '<i8'),
+    ('count', '<i4'),
+    ('height', '<i4'),
+    ('width', '<i4'),
+    ('depth', 'i1'),
+    ('verified', '?'),
+])
+# Column name -> (dtype, values per box)
+COLUMNS = {
+    'boxes': (np.dtype('<f4'), 4),
+    'class_ids': (np.dtype('<i4'), 1),
+    'difficult': (np.dtype('?'), 1),
+}
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'labelImg', 'labels')
+
+
+def _encode_paths(paths):
+    # NUL cannot be part of a path
+    return np.frombuffer('\0'.join(paths).encode('utf-8', 'surrogateescape'), dtype=np.uint8)
+
+
+def _decode_paths(data, count):
+    if not count:
+        return []
+    return data.tobytes().decode('utf-8', 'surrogateescape').split('\0')
+
+
+def _stamp(path):
+    """(modification time in ns, size) of `path`, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass
+class CachedLabels:
+    # Slices of the memory-mapped columns, valid until the cache is closed
+    boxes: np.ndarray
+    class_ids: np.ndarray
+    difficult: np.ndarray
+    classes: list
+    image_shape: list
+    verified: bool
+
+    def labels(self):
+        return [self.classes[i] for i in self.class_ids]
+
+    def shapes(self):
+        """Shape dicts, with the four corners of each box like the label file readers give them."""
+        return [
+            dict(label=label, points=[(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)],
+                 difficult=bool(difficult))
+            for label, (x_min, y_min, x_max, y_max), difficult
+            in zip(self.labels(), self.boxes.tolist(), self.difficult)
+        ]
+
+
+class LabelCache:
+    """Boxes of the label files of one dataset, cached in the user cache directory.
+
+    Like the DatasetIndex it is named after the dataset directory and paths
+    are stored relative to it. Safe to use from several threads.
+    """
+
+    def __init__(self, dataset_dir, cache_dir=None):
+        self.dataset_dir = os.path.abspath(dataset_dir)
+        cache_dir = cache_dir or default_cache_dir()
+        name = hashlib.blake2b(self.dataset_dir.encode('utf-8'), digest_size=10).hexdigest()
+        self.path = os.path.join(cache_dir, name)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._files = {}
+        self._maps = {}
+        self._dirty = False
+        try:
+            if os.path.isfile(self._index_path()):
+                self._load()
+            else:
+                self._reset()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Discarding the label cache of {self.dataset_dir}: {e}")
+            self._reset()
+        self._remove_stale_files()
+
+    def _reset(self):
+        self.generation = 0
+        self._table = np.zeros(0, dtype=TABLE_DTYPE)
+        self._size = 0
+        self._images = []
+        self._label_paths = []
+        self._rows = {}
+        self.classes = []
+        self._class_ids = {}
+        self._box_count = 0
+        self._dead_boxes = 0
+        if os.path.exists(self._index_path()):
+            os.remove(self._index_path())
+        for name in COLUMNS:
+            with open(self._column_path(name), 'wb'):
+                pass
+
+    def _index_path(self):
+        return os.path.join(self.path, 'index.npz')
+
+    def _column_path(self, name, generation=None):
+        return os.path.join(self.path, f'{name}-{self.generation if generation is None else generation}.bin')
+
+    def _load(self):
+        with np.load(self._index_path()) as data:
+            if int(data['version']) != CACHE_VERSION:
+                raise ValueError("written by another version of labelImg")
+            self.generation = int(data['generation'])
+            self._table = data['table']
+            self._size = len(self._table)
+            self._images = _decode_paths(data['images'], self._size)
+            self._label_paths = _decode_paths(data['label_paths'], self._size)
+            self.classes = _decode_paths(data['classes'], int(data['class_count']))
+            self._box_count = int(data['box_count'])
+        self._rows = {path: row for row, path in enumerate(self._images)}
+        self._class_ids = {name: i for i, name in enumerate(self.classes)}
+        self._dead_boxes = self._box_count - int(self._table['count'].sum())
+        for name, (dtype, width) in COLUMNS.items():
+            path = self._column_path(name)
+            # Drop the boxes appended after the last flush
+            if os.path.getsize(path) < self._box_count * width * dtype.itemsize:
+                raise ValueError(f"{os.path.basename(path)} is truncated")
+            os.truncate(path, self._box_count * width * dtype.itemsize)
+
+    def _remove_stale_files(self):
+        current = {os.path.basename(self._column_path(name)) for name in COLUMNS} | {'index.npz'}
+        for name in os.listdir(self.path):
+            if name not in current:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.dataset_dir)
+
+    def _column(self, name, end):
+        """The memory map of column `name`, remapped if it does not reach box `end` yet."""
+        column = self._maps.get(name)
+        if column is None or len(column) < end:
+            if name in self._files:
+                self._files[name].flush()
+            dtype, width = COLUMNS[name]
+            shape = (self._box_count, width) if width > 1 else (self._box_count,)
+            column = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=shape) \
+                if self._box_count else np.zeros(shape, dtype=dtype)
+            self._maps[name] = column
+        return column
+
+    def get(self, image_path, label_path, class_file=None):
+        """The cached labels of `image_path`, or None if `label_path` changed since they were stored.
+
+        `class_file` is the class list YOLO label files are read with.
+        """
+        stamp = _stamp(label_path)
+        class_stamp = _stamp(class_file) if class_file else None
+        if stamp is None:
+            return None
+        key = self._key(image_path)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None or self._label_paths[row] != self._key(label_path):
+                return None
+            entry = self._table[row]
+            if (int(entry['label_mtime']), int(entry['label_size'])) != stamp \
+                    or int(entry['class_mtime']) != (class_stamp[0] if class_stamp else 0):
+                return None
+            start = int(entry['start'])
+            end = start + int(entry['count'])
+            return CachedLabels(
+                boxes=self._column('boxes', end)[start:end],
+                class_ids=self._column('class_ids', end)[start:end],
+                difficult=self._column('difficult', end)[start:end],
+                classes=self.classes,
+                image_shape=[int(entry['height']), int(entry['width']), int(entry['depth'])],
+                verified=bool(entry['verified']),
+            )
+
+    def put(self, image_path, label_path, image_shape, shapes, verified, class_file=None):
+        """Store the shape dicts read from `label_path` for `image_path`.
+
+        Call it with the modification time and size the label file had when
+        it was read, that is right after reading it.
+        """
+        stamp = _stamp(label_path)
+        if stamp is None:
+            return
+        class_stamp = _stamp(class_file) if class_file else None
+        boxes = np.zeros((len(shapes), 4), dtype=np.float32)
+        for i, shape in enumerate(shapes):
+            xs = [p[0] for p in shape['points']]
+            ys = [p[1] for p in shape['points']]
+            boxes[i] = min(xs), min(ys), max(xs), max(ys)
+        difficult = np.asarray([bool(shape.get('difficult', False)) for shape in shapes], dtype=bool)
+
+        key = self._key(image_path)
+        with self._lock:
+            class_ids = np.asarray([self._class_id(shape['label']) for shape in shapes], dtype=np.int32)
+            for name, values in (('boxes', boxes), ('class_ids', class_ids), ('difficult', difficult)):
+                if name not in self._files:
+                    self._files[name] = open(self._column_path(name), 'ab')
+                self._files[name].write(values.astype(COLUMNS[name][0]).tobytes())
+
+            row = self._rows.get(key)
+            if row is None:
+                row = self._add_row(key)
+            else:
+                self._dead_boxes += int(self._table[row]['count'])
+            self._label_paths[row] = self._key(label_path)
+            self._table[row] = (stamp[0], stamp[1], class_stamp[0] if class_stamp else 0, self._box_count,
+                                len(shapes), image_shape[0], image_shape[1], image_shape[2] if len(image_shape) > 2 else 3,
+                                bool(verified))
+            self._box_count += len(shapes)
+            self._dirty = True
+
+    def _class_id(self, name):
+        if name not in self._class_ids:
+            self._class_ids[name] = len(self.classes)
+            self.classes.append(name)
+        return self._class_ids[name]
+
+    def _add_row(self, key):
+        if self._size == len(self._table):
+            self._table = np.resize(self._table, max(1024, 2 * len(self._table)))
+        row = self._size
+        self._size += 1
+        self._images.append(key)
+        self._label_paths.append('')
+        self._rows[key] = row
+        return row
+
+    def _compact(self):
+        """Rewrite the columns without the boxes of replaced rows, under the next generation."""
+        table = self._table[:self._size]
+        counts = table['count'].astype(np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        # Index of every live box in the old columns
+        order = np.repeat(table['start'] - starts, counts) + np.arange(int(counts.sum()), dtype=np.int64)
+        generation = self.generation + 1
+        for name in COLUMNS:
+            column = self._column(name, self._box_count)
+            with open(self._column_path(name, generation), 'wb') as f:
+                f.write(np.ascontiguousarray(column[order]).tobytes())
+        table['start'] = starts
+        return generation
+
+    def flush(self):
+        """Make everything stored so far survive the process."""
+        with self._lock:
+            if not self._dirty:
+                return
+            for f in self._files.values():
+                f.flush()
+            generation = self.generation
+            box_count = self._box_count
+            if self._dead_boxes > max(COMPACT_MIN_BOXES, box_count - self._dead_boxes):
+                generation = self._compact()
+                box_count -= self._dead_boxes
+            temp_path = self._index_path() + '.tmp'
+            with open(temp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    version=np.int32(CACHE_VERSION),
+                    generation=np.int64(generation),
+                    box_count=np.int64(box_count),
+                    table=self._table[:self._size],
+                    images=_encode_paths(self._images),
+                    label_paths=_encode_paths(self._label_paths),
+                    classes=_encode_paths(self.classes),
+                    class_count=np.int64(len(self.classes)),
+                )
+            os.replace(temp_path, self._index_path())
+            if generation != self.generation:
+                self._close_columns()
+                self.generation = generation
+                self._box_count = box_count
+                self._dead_boxes = 0
+                self._remove_stale_files()
+            self._dirty = False
+
+    def _close_columns(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._maps = {}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._close_columns()
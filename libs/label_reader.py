@@ -0,0 +1,91 @@
+import os
+
+from PyQt5.QtGui import QImage, QImageReader
+
+from libs.create_ml_io import CreateMLReader, JSON_EXT
+from libs.image_size import image_shape as read_image_shape
+from libs.pascal_voc_io import PascalVocReader, XML_EXT
+from libs.yolo_io import YoloReader, TXT_EXT
+
+
+class LabelReader:
+    """Reads the label files of images without touching the window.
+
+    It holds the label directory, label cache and YOLO class file the window
+    had when it was made, so a background thread reading through it keeps
+    using them even if the user picks another save directory meanwhile.
+    """
+
+    def __init__(self, label_dir=None, label_cache=None, class_file=None):
+        self.label_dir = label_dir
+        self.label_cache = label_cache
+        self.class_file = class_file
+
+    def annotation_paths(self, file_path):
+        """All label file paths that may hold annotations of `file_path`."""
+        base_paths = [os.path.splitext(file_path)[0]]
+        if self.label_dir is not None:
+            base_paths.insert(0, os.path.join(self.label_dir, os.path.basename(base_paths[0])))
+        return [base + ext for base in base_paths for ext in (XML_EXT, TXT_EXT, JSON_EXT)]
+
+    def label_path(self, file_path):
+        """The label file the annotations of `file_path` are read from, None if there is none."""
+        return next((p for p in self.annotation_paths(file_path) if os.path.isfile(p)), None)
+
+    def label_class_file(self, label_path):
+        """The class list YOLO label file `label_path` is read with, None for the other formats."""
+        if not label_path.endswith(TXT_EXT):
+            return None
+        return self.class_file or os.path.join(os.path.dirname(os.path.realpath(label_path)), "labels.txt")
+
+    def read_label_shapes(self, file_path):
+        """Shape dicts, [height, width, depth] and verified flag of `file_path` from its label file.
+
+        Only the image header is read. Returns None if the image has no
+        label file.
+        """
+        label_path = self.label_path(file_path)
+        if label_path is None:
+            return None
+        class_file = self.label_class_file(label_path)
+        if self.label_cache is not None:
+            cached = self.label_cache.get(file_path, label_path, class_file)
+            if cached is not None:
+                return cached.shapes(), cached.image_shape, cached.verified
+        try:
+            shape = read_image_shape(file_path)
+        except ValueError:
+            # A format only Qt knows
+            reader = QImageReader(file_path)
+            depth = 1 if reader.imageFormat() in (QImage.Format_Grayscale8, QImage.Format_Grayscale16) else 3
+            shape = [reader.size().height(), reader.size().width(), depth]
+        if label_path.endswith(XML_EXT):
+            reader = PascalVocReader(label_path)
+        elif label_path.endswith(TXT_EXT):
+            reader = YoloReader(label_path, shape, self.class_file)
+        else:
+            reader = CreateMLReader(label_path, file_path)
+        shapes = [
+            dict(label=label, points=points, difficult=difficult)
+            for label, points, _line_color, _fill_color, difficult in reader.get_shapes()
+        ]
+        if self.label_cache is not None:
+            self.label_cache.put(file_path, label_path, shape, shapes, reader.verified, class_file)
+        return shapes, shape, reader.verified
+
+    def cached_labels(self, file_path):
+        """CachedLabels of `file_path`, parsing its label file into the label cache first if it changed.
+
+        Returns None if the image has no label file or there is no label cache.
+        """
+        if self.label_cache is None:
+            return None
+        label_path = self.label_path(file_path)
+        if label_path is None:
+            return None
+        class_file = self.label_class_file(label_path)
+        cached = self.label_cache.get(file_path, label_path, class_file)
+        if cached is None:
+            self.read_label_shapes(file_path)
+            cached = self.label_cache.get(file_path, label_path, class_file)
+        return cached
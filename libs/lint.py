@@ -0,0 +1,386 @@
+"""Find and fix problems in a directory of label files.
+
+Checks every Pascal VOC, YOLO and CreateML file of a directory in parallel
+worker processes and reports all problems at once:
+
+    labelimg-lint labels/ -i images/
+    labelimg-lint labels/ -i images/ --fix
+
+--fix repairs the mechanical problems in place: boxes reaching outside the
+image are clipped, boxes without area are removed, comma decimal separators
+become points and a wrong Pascal VOC <size> is set to the size of the image.
+Unknown YOLO class indices, label files without an image and unreadable
+lines are only reported.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from lxml import etree
+
+from libs.convert import CHUNK_SIZE, CLASS_LIST_FILES, find_images, find_label_files, read_class_list
+from libs.image_size import image_shape
+from libs.labelFile import LabelFileFormat
+
+OUT_OF_BOUNDS = 'out-of-bounds'
+ZERO_AREA = 'zero-area'
+UNKNOWN_CLASS = 'unknown-class'
+COMMA_DECIMAL = 'comma-decimal'
+ORPHAN = 'orphan'
+SIZE_MISMATCH = 'size-mismatch'
+UNREADABLE = 'unreadable'
+FIXABLE = {OUT_OF_BOUNDS, ZERO_AREA, COMMA_DECIMAL, SIZE_MISMATCH}
+# YOLO files store 6 decimals, coordinates within this of the border are not outside
+YOLO_TOLERANCE = 1e-6
+
+
+@dataclass
+class LintIssue:
+    kind: str
+    # The label file
+    path: str
+    message: str
+    fixed: bool = False
+
+    @property
+    def fixable(self):
+        return self.kind in FIXABLE
+
+
+@dataclass
+class LintReport:
+    # Label files checked
+    files: int = 0
+    # Label files rewritten by --fix
+    fixed_files: int = 0
+    elapsed: float = 0.0
+    issues: list = field(default_factory=list)
+
+    def counts(self):
+        return Counter(issue.kind for issue in self.issues)
+
+    @property
+    def fixable(self):
+        return sum(1 for issue in self.issues if issue.fixable and not issue.fixed)
+
+    def summary(self):
+        lines = [f"Checked {self.files} label files in {self.elapsed:.2f} s, {len(self.issues)} issues"]
+        fixed = Counter(issue.kind for issue in self.issues if issue.fixed)
+        for kind, count in sorted(self.counts().items()):
+            lines.append(f"  {kind}: {count}" + (f" ({fixed[kind]} fixed)" if fixed[kind] else ""))
+        if self.fixed_files:
+            lines.append(f"Fixed {self.fixed_files} label files")
+        return '\n'.join(lines)
+
+
+def _check_box(box, width, height, tolerance=0.0):
+    """(issue kind or None, box clipped to a `width` x `height` image) of an x_min, y_min, x_max, y_max box.
+
+    The size is 0 when it is not known, then only the area is checked.
+    """
+    x_min, y_min, x_max, y_max = box
+    if x_max <= x_min or y_max <= y_min:
+        return ZERO_AREA, box
+    if not width or not height:
+        return None, box
+    clipped = (max(x_min, 0), max(y_min, 0), min(x_max, width), min(y_max, height))
+    if clipped[2] <= clipped[0] or clipped[3] <= clipped[1]:
+        return ZERO_AREA, clipped
+    if x_min < -tolerance or y_min < -tolerance or x_max > width + tolerance or y_max > height + tolerance:
+        return OUT_OF_BOUNDS, clipped
+    return None, box
+
+
+def _box_message(kind, where, box, size=''):
+    if kind == ZERO_AREA:
+        return f"{where} has no area inside the image" if box[2] > box[0] and box[3] > box[1] \
+            else f"{where} has no area"
+    return f"{where} reaches outside the {size}image"
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _write(path, data):
+    # Replaced at once, a crash never leaves half a label file
+    temp_path = path + '.lint'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _lint_yolo(label_path, image_path, class_list, fix):
+    issues = []
+    with open(label_path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    out = []
+    changed = False
+    for number, line in enumerate(lines, 1):
+        where = f"line {number}"
+        if not line.strip():
+            continue
+        text = line.replace(',', '.')
+        fields = text.split()
+        try:
+            if len(fields) != 5:
+                raise ValueError
+            class_index = int(fields[0])
+            x, y, w, h = map(float, fields[1:])
+        except ValueError:
+            issues.append(LintIssue(UNREADABLE, label_path, f"{where} is not 'class x_center y_center width height'"))
+            out.append(line)
+            continue
+        # Only once the replaced line reads, an unreadable line is kept as it was
+        if text != line:
+            issues.append(LintIssue(COMMA_DECIMAL, label_path, f"{where} uses commas as decimal separators"))
+        if class_list and not 0 <= class_index < len(class_list):
+            issues.append(LintIssue(UNKNOWN_CLASS, label_path,
+                                    f"{where} has class index {class_index}, {len(class_list)} classes are known"))
+        kind, box = _check_box((x - w / 2, y - h / 2, x + w / 2, y + h / 2), 1, 1, YOLO_TOLERANCE)
+        if kind is not None:
+            issues.append(LintIssue(kind, label_path, _box_message(kind, where, box)))
+        if kind == ZERO_AREA:
+            changed = True
+            continue
+        if kind == OUT_OF_BOUNDS:
+            x_min, y_min, x_max, y_max = box
+            text = "%d %.6f %.6f %.6f %.6f" % (class_index, (x_min + x_max) / 2, (y_min + y_max) / 2,
+                                               x_max - x_min, y_max - y_min)
+        changed = changed or text != line
+        out.append(text)
+    if fix and changed:
+        _write(label_path, ''.join(line + '\n' for line in out).encode('utf-8'))
+    return issues, fix and changed
+
+
+def _lint_voc(label_path, image_path, class_list, fix):
+    issues = []
+    with open(label_path, 'rb') as f:
+        data = f.read()
+    root = etree.fromstring(data)
+    changed = False
+
+    width = height = 0
+    size = root.find('size')
+    if size is not None:
+        try:
+            width = float(size.findtext('width').replace(',', '.'))
+            height = float(size.findtext('height').replace(',', '.'))
+        except (AttributeError, ValueError):
+            issues.append(LintIssue(UNREADABLE, label_path, "<size> has no readable width and height"))
+    if image_path is not None:
+        try:
+            actual_height, actual_width = image_shape(image_path)[:2]
+        except (OSError, ValueError):
+            pass
+        else:
+            if (width, height) != (actual_width, actual_height):
+                issues.append(LintIssue(SIZE_MISMATCH, label_path,
+                                        f"<size> is {width:g}x{height:g}, the image is {actual_width}x{actual_height}"))
+                if size is None:
+                    size = etree.SubElement(root, 'size')
+                for key, value in (('width', actual_width), ('height', actual_height)):
+                    if size.find(key) is None:
+                        etree.SubElement(size, key)
+                    size.find(key).text = str(value)
+                width, height = actual_width, actual_height
+                changed = True
+
+    for index, obj in enumerate(root.findall('object'), 1):
+        where = f"box {index} ({obj.findtext('name')})"
+        bnd_box = obj.find('bndbox')
+        corners = [bnd_box.find(key) if bnd_box is not None else None for key in ('xmin', 'ymin', 'xmax', 'ymax')]
+        if any(corner is None or not corner.text for corner in corners):
+            issues.append(LintIssue(UNREADABLE, label_path, f"{where} has no complete <bndbox>"))
+            continue
+        if any(',' in corner.text for corner in corners):
+            issues.append(LintIssue(COMMA_DECIMAL, label_path, f"{where} uses commas as decimal separators"))
+            for corner in corners:
+                corner.text = corner.text.replace(',', '.')
+            changed = True
+        try:
+            box = tuple(float(corner.text) for corner in corners)
+        except ValueError:
+            issues.append(LintIssue(UNREADABLE, label_path, f"{where} has coordinates that are not numbers"))
+            continue
+        kind, clipped = _check_box(box, width, height)
+        if kind is None:
+            continue
+        issues.append(LintIssue(kind, label_path, _box_message(kind, where, box, f'{width:g}x{height:g} ')))
+        if kind == ZERO_AREA:
+            # Keep the indentation of what follows
+            previous = obj.getprevious()
+            if previous is not None:
+                previous.tail = obj.tail
+            obj.getparent().remove(obj)
+        else:
+            for corner, value in zip(corners, clipped):
+                corner.text = _number(value)
+        changed = True
+    if fix and changed:
+        text = etree.tostring(root, encoding='utf-8', xml_declaration=data.startswith(b'<?xml'))
+        _write(label_path, text + b'\n' if data.endswith(b'\n') else text)
+    return issues, fix and changed
+
+
+def _lint_create_ml(label_path, image_dir, class_list, fix):
+    issues = []
+    with open(label_path, encoding='utf-8') as f:
+        images = json.load(f)
+    if not isinstance(images, list):
+        # Some other JSON file, e.g. an exported COCO file
+        return issues, False
+    changed = False
+    for image in images:
+        image_path = os.path.join(image_dir, image.get('image', ''))
+        width = height = 0
+        try:
+            height, width = image_shape(image_path)[:2]
+        except OSError:
+            issues.append(LintIssue(ORPHAN, label_path, f"image {image.get('image')} not found in {image_dir}"))
+        except ValueError:
+            pass
+        annotations = []
+        for index, annotation in enumerate(image.get('annotations', []), 1):
+            where = f"{image.get('image')}: box {index} ({annotation.get('label')})"
+            try:
+                c = annotation['coordinates']
+                x, y, w, h = float(c['x']), float(c['y']), float(c['width']), float(c['height'])
+            except (KeyError, TypeError, ValueError):
+                issues.append(LintIssue(UNREADABLE, label_path, f"{where} has no readable coordinates"))
+                annotations.append(annotation)
+                continue
+            kind, box = _check_box((x - w / 2, y - h / 2, x + w / 2, y + h / 2), width, height)
+            if kind is not None:
+                issues.append(LintIssue(kind, label_path, _box_message(kind, where, box, f'{width:g}x{height:g} ')))
+                changed = True
+            if kind == ZERO_AREA:
+                continue
+            if kind == OUT_OF_BOUNDS:
+                x_min, y_min, x_max, y_max = box
+                annotation['coordinates'] = {'x': (x_min + x_max) / 2, 'y': (y_min + y_max) / 2,
+                                             'width': x_max - x_min, 'height': y_max - y_min}
+            annotations.append(annotation)
+        image['annotations'] = annotations
+    if fix and changed:
+        _write(label_path, json.dumps(images).encode('utf-8'))
+    return issues, fix and changed
+
+
+# (image dir, class list, fix) of the current worker, set by _init_worker
+_worker_args = None
+# Image name without extension -> path, listed by the first chunk of the worker
+_worker_images = None
+
+
+def _init_worker(image_dir, class_list, fix):
+    # Must not fail: the pool replaces workers whose initializer raises, forever
+    global _worker_args
+    _worker_args = (image_dir, class_list, fix)
+
+
+def _lint_chunk(label_paths):
+    """(issues, fixed file count) of a chunk of label files."""
+    global _worker_images
+    image_dir, class_list, fix = _worker_args
+    if _worker_images is None:
+        _worker_images = find_images(image_dir) if os.path.isdir(image_dir) else {}
+    issues = []
+    fixed_files = 0
+    for label_path in label_paths:
+        try:
+            if label_path.lower().endswith(LabelFileFormat.CREATE_ML.extension()):
+                file_issues, fixed = _lint_create_ml(label_path, image_dir, class_list, fix)
+            else:
+                image_path = _worker_images.get(os.path.splitext(os.path.basename(label_path))[0])
+                lint_file = _lint_voc if label_path.lower().endswith(LabelFileFormat.PASCAL_VOC.extension()) \
+                    else _lint_yolo
+                file_issues, fixed = lint_file(label_path, image_path, class_list, fix)
+                if image_path is None:
+                    file_issues.insert(0, LintIssue(ORPHAN, label_path, f"no image of this name in {image_dir}"))
+        except Exception as e:
+            file_issues, fixed = [LintIssue(UNREADABLE, label_path, str(e))], False
+        if fixed:
+            fixed_files += 1
+            for issue in file_issues:
+                issue.fixed = issue.fixable
+        issues.extend(file_issues)
+    return issues, fixed_files
+
+
+def lint(label_dir, image_dir=None, class_list=None, fix=False, workers=None, progress=None):
+    """Check every label file in `label_dir`, fixing the mechanical problems in place if `fix` is set.
+
+    Images are looked up by name in `image_dir` (default: `label_dir`).
+    YOLO class indices are checked against `class_list`, by default the
+    labels.txt of `label_dir` if there is one. `progress(done, total)` is
+    called as chunks finish. Returns a LintReport.
+    """
+    image_dir = image_dir or label_dir
+    workers = workers or os.cpu_count() or 1
+    if class_list is None:
+        class_file = next((os.path.join(label_dir, name) for name in CLASS_LIST_FILES
+                           if os.path.isfile(os.path.join(label_dir, name))), None)
+        class_list = read_class_list(class_file) if class_file else []
+    label_paths = sorted(path for label_format in LabelFileFormat
+                         for path in find_label_files(label_dir, label_format))
+    report = LintReport(files=len(label_paths))
+    chunks = [label_paths[i:i + CHUNK_SIZE] for i in range(0, len(label_paths), CHUNK_SIZE)]
+    init_args = (image_dir, list(class_list), fix)
+    start = time.perf_counter()
+    if workers > 1 and len(chunks) > 1:
+        # Spawned like the other worker pools, a forked Qt process is not safe
+        pool = multiprocessing.get_context('spawn').Pool(min(workers, len(chunks)), _init_worker, init_args)
+        results = pool.imap_unordered(_lint_chunk, chunks)
+    else:
+        pool = None
+        _init_worker(*init_args)
+        results = map(_lint_chunk, chunks)
+    try:
+        done = 0
+        for issues, fixed_files in results:
+            report.issues.extend(issues)
+            report.fixed_files += fixed_files
+            done += 1
+            if progress is not None:
+                progress(min(done * CHUNK_SIZE, report.files), report.files)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    report.issues.sort(key=lambda issue: issue.path)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='labelimg-lint', description=__doc__.split('\n\n')[0])
+    parser.add_argument("label_dir", help="Directory with the label files to check")
+    parser.add_argument("-i", "--image-dir", help="Directory with the images (default: label_dir)")
+    parser.add_argument("-c", "--classes", help="Class list of the YOLO files (default: labels.txt in label_dir)")
+    parser.add_argument("--fix", action="store_true",
+                        help="Clip boxes to the image, remove boxes without area, replace decimal commas and "
+                             "correct Pascal VOC <size>, in place")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+    try:
+        class_list = read_class_list(args.classes) if args.classes else None
+        report = lint(args.label_dir, args.image_dir, class_list, args.fix, args.jobs)
+    except (OSError, ValueError) as e:
+        sys.exit(f"labelimg-lint: {e}")
+    for issue in report.issues:
+        print(f"{issue.path}: {issue.kind}: {issue.message}" + (" (fixed)" if issue.fixed else ""))
+    print(report.summary())
+    return 1 if any(not issue.fixed for issue in report.issues) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import collections
+import threading
+
+
+class PreAnnotationWorker:
+    """Runs the model ahead of the user on the images they will open next.
+
+    `schedule` replaces the queue with new paths in the order they should be
+    processed, so jumping elsewhere in the list drops the lookahead of the
+    previous position. Raw detections of the `capacity` most recently
+    finished images are kept for `get`; `on_ready(path)` is called from the
+    worker thread whenever an image is done.
+    """
+
+    def __init__(self, get_annotator, on_ready=None, capacity=64):
+        self.get_annotator = get_annotator
+        self.on_ready = on_ready
+        self.capacity = capacity
+        self._pending = collections.deque()
+        self._results = collections.OrderedDict()
+        self._condition = threading.Condition()
+        # Bumped by clear() so results of an outdated model are dropped
+        self._generation = 0
+        self._stopped = False
+        self._thread = None
+
+    def schedule(self, paths):
+        with self._condition:
+            self._pending = collections.deque(p for p in paths if p not in self._results)
+            if self._pending and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='labelImg-pre-annotate', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def get(self, path):
+        """Raw (detections, (height, width)) of `path`, or None if it has not been processed."""
+        with self._condition:
+            result = self._results.get(path)
+            if result is not None:
+                self._results.move_to_end(path)
+            return result
+
+    def clear(self):
+        """Forget all results and pending work, e.g. after the model changed."""
+        with self._condition:
+            self._pending.clear()
+            self._results.clear()
+            self._generation += 1
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                path = self._pending.popleft()
+                generation = self._generation
+
+            try:
+                annotator = self.get_annotator()
+            except (FileNotFoundError, ImportError) as e:
+                print(f"Pre-annotation stopped: {e}")
+                with self._condition:
+                    self._pending.clear()
+                continue
+            try:
+                result = annotator.detect_batch([path])[0]
+            except Exception as e:
+                print(f"Pre-annotation of {path} failed: {e}")
+                continue
+
+            with self._condition:
+                if generation != self._generation:
+                    continue
+                self._results[path] = result
+                while len(self._results) > self.capacity:
+                    self._results.popitem(last=False)
+            if self.on_ready is not None:
+                self.on_ready(path)
@@ -0,0 +1,174 @@
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from libs.inference_backends import OnnxRuntimeBackend, create_backend, preprocess
+from libs.video_source import imread
+
+QUANTIZED_DIR_NAME = 'quantized'
+QUANTIZED_SUFFIX = '.int8.onnx'
+
+
+def quantized_model_path(model_path):
+    """Where the int8 version of `model_path` is stored: a subdirectory the model lookup does not search."""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(os.path.dirname(model_path), QUANTIZED_DIR_NAME, stem + QUANTIZED_SUFFIX)
+
+
+def sample_images(image_paths, count, seed=0):
+    """A reproducible random sample of at most `count` images."""
+    image_paths = list(image_paths)
+    if len(image_paths) <= count:
+        return image_paths
+    return sorted(random.Random(seed).sample(image_paths, count))
+
+
+def export_onnx(model_path):
+    """Path of an FP32 ONNX version of `model_path`, exporting `.pt` weights with ultralytics."""
+    if model_path.lower().endswith('.onnx'):
+        return model_path
+    from ultralytics import YOLO
+    exported = YOLO(model_path).export(format='onnx', dynamic=True)
+    # Keep the export out of the model directory, where it would be picked up instead of the .pt file
+    onnx_path = os.path.join(os.path.dirname(quantized_model_path(model_path)), os.path.basename(exported))
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    os.replace(exported, onnx_path)
+    return onnx_path
+
+
+class CalibrationReader:
+    """Feeds preprocessed dataset images to the ONNX Runtime calibrator one at a time.
+
+    Implements the interface of onnxruntime.quantization.CalibrationDataReader.
+    """
+
+    def __init__(self, image_paths, input_name, input_size):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.input_size = input_size
+        self._next = 0
+
+    def get_next(self):
+        import numpy as np
+        while self._next < len(self.image_paths):
+            image = imread(self.image_paths[self._next])
+            self._next += 1
+            if image is not None:
+                blob, _, _ = preprocess(image, self.input_size)
+                return {self.input_name: blob[None].astype(np.float32)}
+        return None
+
+    def rewind(self):
+        self._next = 0
+
+
+def quantize_model(model_path, calibration_images, output_path=None, static=True):
+    """Write an int8 version of `model_path` and return its path.
+
+    Static quantization calibrates the activation ranges on
+    `calibration_images` and quantizes convolutions as well, which is what
+    makes YOLO models faster on the CPU. Dynamic quantization needs no
+    calibration but only covers MatMul-like operators.
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType
+    from onnxruntime.quantization import quantize_dynamic, quantize_static
+
+    onnx_path = export_onnx(model_path)
+    output_path = output_path or quantized_model_path(model_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if not static:
+        quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QInt8)
+        return output_path
+
+    fp32 = OnnxRuntimeBackend(onnx_path)
+    prepared_path = output_path + '.prepared'
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=True)
+    except Exception as e:
+        print(f"Quantizing without pre-processing: {e}")
+        prepared_path = onnx_path
+    quantize_static(
+        prepared_path,
+        output_path,
+        CalibrationReader(calibration_images, fp32.input_name, fp32.input_size),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    if prepared_path != onnx_path:
+        os.remove(prepared_path)
+    return output_path
+
+
+@dataclass
+class QuantizationReport:
+    images: int
+    fp32_images_per_second: float
+    int8_images_per_second: float
+    # Mean over the images of 2 * matched boxes / (FP32 boxes + int8 boxes)
+    box_agreement: float
+    # Mean IoU of the matched boxes
+    matched_iou: float
+    fp32_boxes: int
+    int8_boxes: int
+
+    @property
+    def speedup(self):
+        return self.int8_images_per_second / self.fp32_images_per_second if self.fp32_images_per_second else 0.0
+
+    def summary(self):
+        return (
+            "Compared on %d images:\n"
+            "FP32: %.1f images/s, %d boxes\n"
+            "int8: %.1f images/s, %d boxes (%.2fx)\n"
+            "Box agreement: %.1f%% (mean IoU of matched boxes %.2f)"
+        ) % (
+            self.images, self.fp32_images_per_second, self.fp32_boxes,
+            self.int8_images_per_second, self.int8_boxes, self.speedup,
+            self.box_agreement * 100, self.matched_iou,
+        )
+
+
+def _timed_predictions(backend, images, conf_threshold):
+    backend.predict(images[:1], conf_threshold)
+    start = time.perf_counter()
+    detections = [backend.predict([image], conf_threshold)[0][0] for image in images]
+    return detections, len(images) / max(time.perf_counter() - start, 1e-9)
+
+
+def compare_models(reference_path, quantized_path, image_paths, conf_threshold=0.25, iou_threshold=0.5):
+    """Measure speed and box agreement of the int8 model against the original model."""
+    import numpy as np
+    from libs.box_ops import box_iou, greedy_matching
+
+    images = [image for image in (imread(path) for path in image_paths) if image is not None]
+    if not images:
+        raise ValueError("None of the sample images could be read")
+    reference, reference_speed = _timed_predictions(create_backend(reference_path), images, conf_threshold)
+    quantized, quantized_speed = _timed_predictions(OnnxRuntimeBackend(quantized_path), images, conf_threshold)
+
+    agreements = []
+    matched_ious = []
+    for expected, actual in zip(reference, quantized):
+        if not len(expected) and not len(actual):
+            agreements.append(1.0)
+            continue
+        iou = box_iou(actual[:, :4], expected[:, :4])
+        iou[actual[:, 5][:, None] != expected[:, 5][None, :]] = 0
+        # One to one, so two int8 boxes on the same object do not both count as agreeing
+        _, _, matched = greedy_matching(iou, iou_threshold)
+        agreements.append(2 * len(matched) / (len(expected) + len(actual)))
+        matched_ious.extend(matched.tolist())
+
+    return QuantizationReport(
+        images=len(images),
+        fp32_images_per_second=reference_speed,
+        int8_images_per_second=quantized_speed,
+        box_agreement=float(np.mean(agreements)),
+        matched_iou=float(np.mean(matched_ious)) if matched_ious else 0.0,
+        fp32_boxes=sum(len(d) for d in reference),
+        int8_boxes=sum(len(d) for d in quantized),
+    )
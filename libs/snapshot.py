@@ -0,0 +1,237 @@
+"""All boxes of a dataset in one columnar file.
+
+A snapshot has one row per box: image id, class id, x_min, y_min, x_max,
+y_max in pixels as float32, difficult and verified. Next to it are a table
+of the images (path relative to the dataset root, width, height) and the
+class names. `.npz` snapshots are stored uncompressed, so DatasetSnapshot
+memory-maps their arrays straight from the file; `.parquet` snapshots need
+pyarrow.
+"""
+
+import array
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSIONS = ('.npz', '.parquet')
+
+
+class SnapshotBuilder:
+    """Collects the boxes of a dataset image by image and writes them as a snapshot."""
+
+    def __init__(self, root, class_list=None):
+        self.root = os.path.abspath(root)
+        self.classes = {}
+        for name in class_list or []:
+            self.class_id(name)
+        self.images = []
+        self.widths = array.array('i')
+        self.heights = array.array('i')
+        self.image_ids = array.array('i')
+        self.class_ids = array.array('i')
+        self.boxes = array.array('f')
+        self.difficult = array.array('b')
+        self.verified = array.array('b')
+
+    def class_id(self, name):
+        if name not in self.classes:
+            self.classes[name] = len(self.classes)
+        return self.classes[name]
+
+    def add_image(self, image_path, image_shape, shapes, verified=False):
+        """Add an image of [height, width, ...] `image_shape` with its shape dicts."""
+        boxes = []
+        for shape in shapes:
+            xs = [p[0] for p in shape['points']]
+            ys = [p[1] for p in shape['points']]
+            boxes.append((min(xs), min(ys), max(xs), max(ys)))
+        self.add_boxes(image_path, image_shape, [shape['label'] for shape in shapes], boxes,
+                       [bool(shape.get('difficult', False)) for shape in shapes], verified)
+
+    def add_boxes(self, image_path, image_shape, labels, boxes, difficult, verified=False):
+        """Add an image with the (N, 4) corners of its boxes, their labels and difficult flags."""
+        image_id = len(self.images)
+        self.images.append(os.path.relpath(os.path.abspath(image_path), self.root).replace(os.sep, '/'))
+        self.heights.append(int(image_shape[0]))
+        self.widths.append(int(image_shape[1]))
+        count = len(labels)
+        self.image_ids.extend([image_id] * count)
+        self.class_ids.extend([self.class_id(label) for label in labels])
+        self.boxes.frombytes(np.asarray(boxes, dtype=np.float32).tobytes())
+        self.difficult.frombytes(np.asarray(difficult, dtype=np.int8).tobytes())
+        self.verified.extend([bool(verified)] * count)
+
+    def arrays(self):
+        return dict(
+            version=np.int32(SNAPSHOT_VERSION),
+            root=np.str_(self.root),
+            images=np.asarray(self.images, dtype=str),
+            widths=np.frombuffer(self.widths, dtype=np.int32),
+            heights=np.frombuffer(self.heights, dtype=np.int32),
+            classes=np.asarray(list(self.classes), dtype=str),
+            image_id=np.frombuffer(self.image_ids, dtype=np.int32),
+            class_id=np.frombuffer(self.class_ids, dtype=np.int32),
+            boxes=np.frombuffer(self.boxes, dtype=np.float32).reshape(-1, 4),
+            difficult=np.frombuffer(self.difficult, dtype=np.int8).astype(bool),
+            verified=np.frombuffer(self.verified, dtype=np.int8).astype(bool),
+        )
+
+    def save(self, path):
+        """Write the snapshot to `path`, as Parquet if it ends with .parquet and as .npz otherwise."""
+        arrays = self.arrays()
+        if path.lower().endswith('.parquet'):
+            _save_parquet(path, arrays)
+        else:
+            # Uncompressed, every array stays memory-mappable
+            np.savez(path, **arrays)
+        return len(arrays['image_id'])
+
+
+def _save_parquet(path, arrays):
+    import pandas as pd
+    boxes = arrays['boxes']
+    box_images = arrays['image_id']
+    # Images without boxes keep a row with class id -1, so the image table survives
+    empty = np.setdiff1d(np.arange(len(arrays['images']), dtype=np.int32), box_images)
+    image_id = np.concatenate([box_images, empty])
+    class_id = np.concatenate([arrays['class_id'], np.full(len(empty), -1, dtype=np.int32)])
+    boxes = np.concatenate([boxes, np.full((len(empty), 4), np.nan, dtype=np.float32)])
+    order = np.argsort(image_id, kind='stable')
+    classes = np.append(arrays['classes'], '')
+    frame = pd.DataFrame({
+        'image_id': image_id[order],
+        'image': pd.Categorical.from_codes(image_id[order], arrays['images']),
+        'width': arrays['widths'][image_id[order]],
+        'height': arrays['heights'][image_id[order]],
+        'class_id': class_id[order],
+        'label': pd.Categorical.from_codes(class_id[order] % len(classes), classes),
+        'x_min': boxes[order, 0], 'y_min': boxes[order, 1], 'x_max': boxes[order, 2], 'y_max': boxes[order, 3],
+        'difficult': np.concatenate([arrays['difficult'], np.zeros(len(empty), dtype=bool)])[order],
+        'verified': np.concatenate([arrays['verified'], np.zeros(len(empty), dtype=bool)])[order],
+    })
+    frame.attrs['root'] = str(arrays['root'])
+    frame.attrs['classes'] = arrays['classes'].tolist()
+    frame.to_parquet(path, index=False)
+
+
+def _load_parquet(path):
+    import pandas as pd
+    frame = pd.read_parquet(path)
+    images = frame.drop_duplicates('image_id').sort_values('image_id')
+    boxes = frame[frame['class_id'] >= 0]
+    classes = frame.attrs.get('classes')
+    if classes is None:
+        # Written without metadata, only the classes that have boxes are known
+        labels = boxes.drop_duplicates('class_id').sort_values('class_id')
+        classes = np.full(int(labels['class_id'].max()) + 1 if len(labels) else 0, '', dtype=object)
+        classes[labels['class_id'].to_numpy()] = labels['label'].astype(str).to_numpy()
+    return dict(
+        version=np.int32(SNAPSHOT_VERSION),
+        root=np.str_(frame.attrs.get('root', os.path.dirname(os.path.abspath(path)))),
+        images=images['image'].astype(str).to_numpy(dtype=str),
+        widths=images['width'].to_numpy(dtype=np.int32),
+        heights=images['height'].to_numpy(dtype=np.int32),
+        classes=np.asarray(classes, dtype=str),
+        image_id=boxes['image_id'].to_numpy(dtype=np.int32),
+        class_id=boxes['class_id'].to_numpy(dtype=np.int32),
+        boxes=boxes[['x_min', 'y_min', 'x_max', 'y_max']].to_numpy(dtype=np.float32),
+        difficult=boxes['difficult'].to_numpy(dtype=bool),
+        verified=boxes['verified'].to_numpy(dtype=bool),
+    )
+
+
+def _load_npz(path, mmap):
+    """The arrays of an .npz file, memory-mapped where the file allows it."""
+    if not mmap:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as raw:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(archive.open(info))
+                continue
+            # The array data follows the local file header and the .npy header
+            raw.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', raw.read(30)[26:30])
+            raw.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(raw)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(raw)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(raw)
+            if dtype.hasobject or not shape or not np.prod(shape):
+                arrays[name] = np.load(archive.open(info))
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=raw.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+class DatasetSnapshot:
+    """Read access to a snapshot, without touching any label file.
+
+    Box rows are ordered by image, so the boxes of one image are a slice of
+    the box arrays.
+    """
+
+    def __init__(self, arrays):
+        if int(arrays['version']) > SNAPSHOT_VERSION:
+            raise ValueError("The snapshot was written by a newer version of labelImg")
+        self.root = str(arrays['root'])
+        self.images = arrays['images']
+        self.widths = arrays['widths']
+        self.heights = arrays['heights']
+        self.classes = arrays['classes']
+        self.image_id = arrays['image_id']
+        self.class_id = arrays['class_id']
+        self.boxes = arrays['boxes']
+        self.difficult = arrays['difficult']
+        self.verified = arrays['verified']
+        self._offsets = None
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        if path.lower().endswith('.parquet'):
+            return cls(_load_parquet(path))
+        return cls(_load_npz(path, mmap))
+
+    def __len__(self):
+        return len(self.image_id)
+
+    @property
+    def image_count(self):
+        return len(self.images)
+
+    def image_path(self, index):
+        return os.path.join(self.root, *str(self.images[index]).split('/'))
+
+    def image_rows(self, index):
+        """The slice of the box rows of image `index`."""
+        if self._offsets is None:
+            self._offsets = np.searchsorted(self.image_id, np.arange(self.image_count + 1))
+        return slice(int(self._offsets[index]), int(self._offsets[index + 1]))
+
+    def labels(self):
+        """The class name of every box."""
+        return self.classes[self.class_id]
+
+    def normalized_boxes(self):
+        """(N, 4) boxes divided by the size of their image."""
+        scale = np.stack([self.widths, self.heights], axis=1).astype(np.float32)[self.image_id]
+        return np.asarray(self.boxes) / np.tile(scale, 2)
+
+    def to_frame(self):
+        import pandas as pd
+        boxes = np.asarray(self.boxes)
+        return pd.DataFrame({
+            'image': self.images[self.image_id],
+            'label': self.labels(),
+            'x_min': boxes[:, 0], 'y_min': boxes[:, 1], 'x_max': boxes[:, 2], 'y_max': boxes[:, 3],
+            'difficult': np.asarray(self.difficult),
+            'verified': np.asarray(self.verified),
+        })
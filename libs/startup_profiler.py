@@ -0,0 +1,76 @@
+import builtins
+import sys
+import threading
+import time
+
+PROFILE_STARTUP_FLAG = '--profile-startup'
+
+
+class StartupProfiler:
+    """Breaks down startup time into module imports and named milestones.
+
+    Every import of a module that is not loaded yet is timed, both inclusive
+    of the modules it pulls in and on its own, so regressions such as a heavy
+    dependency imported at module level show up at the top of the report.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # module name -> [inclusive seconds, own seconds]
+        self.imports = {}
+        self.marks = []
+        self._local = threading.local()
+        self._original_import = None
+
+    @classmethod
+    def from_argv(cls, argv):
+        """Return an installed profiler if `--profile-startup` was passed, None otherwise."""
+        if PROFILE_STARTUP_FLAG not in argv:
+            return None
+        profiler = cls()
+        profiler.install()
+        return profiler
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.start))
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            timing = self.imports.setdefault(name, [0.0, 0.0])
+            timing[0] += elapsed
+            timing[1] += elapsed - children
+
+    def report(self, top=25, file=None):
+        file = file or sys.stdout
+        total = time.perf_counter() - self.start
+        print("Startup profile: %.1f ms" % (total * 1000), file=file)
+        for name, at in self.marks:
+            print("  %9.1f ms  %s" % (at * 1000, name), file=file)
+        print("Slowest imports (inclusive ms, own ms, module):", file=file)
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (inclusive, own) in slowest[:top]:
+            print("  %9.1f %9.1f  %s" % (inclusive * 1000, own * 1000, name), file=file)
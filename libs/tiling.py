@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from libs.box_ops import batched_nms, box_iou
+
+MERGE_METHODS = ('nms', 'wbf')
+
+
+@dataclass(frozen=True)
+class TilingConfig:
+    """Settings of sliced inference.
+
+    Images larger than `tile_size` are cut into `tile_size` squares that
+    overlap by the `overlap` fraction. Boxes found in the tiles, and in the
+    whole image if `full_image` is set, are merged with NMS or weighted boxes
+    fusion ('wbf') at `iou_threshold`.
+    """
+    tile_size: int = 640
+    overlap: float = 0.2
+    merge: str = 'nms'
+    iou_threshold: float = 0.5
+    full_image: bool = True
+
+    def cache_key(self):
+        """Distinguishes cached detections made with different tiling settings."""
+        return 'tiles-%d-%g-%s-%g-%d' % (
+            self.tile_size, self.overlap, self.merge, self.iou_threshold, self.full_image)
+
+
+def tile_windows(height, width, tile_size, overlap):
+    """(K, 4) x1, y1, x2, y2 windows of at most `tile_size` covering the image.
+
+    The last row and column of tiles are aligned with the image border, so
+    no tile is smaller than `tile_size` unless the image is.
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        return np.append(np.arange(0, length - tile_size, stride), length - tile_size)
+
+    ys, xs = np.meshgrid(starts(height), starts(width), indexing='ij')
+    x1 = xs.ravel()
+    y1 = ys.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+
+def weighted_boxes_fusion(boxes, scores, class_ids, iou_threshold=0.5):
+    """Fuse overlapping boxes of the same class into their score-weighted average.
+
+    Returns (N, 6) x1, y1, x2, y2, confidence, class id rows; the confidence
+    of a fused box is the highest confidence in its cluster.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32)
+    class_ids = np.asarray(class_ids, dtype=np.float32)
+    order = np.argsort(-scores, kind='stable')
+    fused = []
+    while order.size:
+        best = order[0]
+        same_class = class_ids[order] == class_ids[best]
+        overlap = box_iou(boxes[best], boxes[order])[0] > iou_threshold
+        cluster = order[same_class & overlap]
+        weights = scores[cluster]
+        box = (boxes[cluster] * weights[:, None]).sum(axis=0) / weights.sum()
+        fused.append(np.append(box, [scores[best], class_ids[best]]))
+        order = order[~(same_class & overlap)]
+    return np.asarray(fused, dtype=np.float32).reshape(-1, 6)
+
+
+def merge_detections(detections, config):
+    """Merge the (N, 6) detections of all tiles into one set of boxes."""
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    if config.merge == 'wbf':
+        return weighted_boxes_fusion(detections[:, :4], detections[:, 4], detections[:, 5], config.iou_threshold)
+    keep = batched_nms(detections[:, :4], detections[:, 4], detections[:, 5], config.iou_threshold)
+    return detections[keep]
+
+
+def detect_tiled(predict, image, config, conf_threshold, batch_size=16):
+    """Run `predict` on overlapping tiles of `image` and return full-image detections.
+
+    `predict` is an InferenceBackend.predict. Tiles are passed to it in batches
+    of `batch_size`, so the backend spreads each batch over the CPU cores.
+    """
+    height, width = image.shape[:2]
+    if height <= config.tile_size and width <= config.tile_size:
+        return predict([image], conf_threshold)[0][0]
+
+    windows = tile_windows(height, width, config.tile_size, config.overlap)
+    parts = []
+    for i in range(0, len(windows), batch_size):
+        batch = windows[i:i + batch_size]
+        tiles = [np.ascontiguousarray(image[y1:y2, x1:x2]) for x1, y1, x2, y2 in batch]
+        for (detections, _), (x1, y1, _, _) in zip(predict(tiles, conf_threshold), batch):
+            detections = detections.copy()
+            detections[:, [0, 2]] += x1
+            detections[:, [1, 3]] += y1
+            parts.append(detections)
+    if config.full_image:
+        # Objects larger than a tile are only found whole in the downscaled image
+        parts.append(predict([image], conf_threshold)[0][0])
+    return merge_detections(np.concatenate(parts), config)
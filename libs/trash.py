@@ -0,0 +1,64 @@
+import os
+import queue
+import shutil
+import threading
+
+TRASH_DIR_NAME = '.labelImg_trash'
+
+
+class Trash:
+    """Moves deleted images and label files into a recoverable trash folder.
+
+    Deletions are queued and flushed in batches by a background thread, so
+    removing an image from the GUI never waits on the file system.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='labelImg-trash', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def trash_dir(root):
+        return os.path.join(root, TRASH_DIR_NAME)
+
+    def put(self, path, root):
+        """Schedule `path` to be moved into the trash folder of `root`."""
+        self._queue.put((path, root))
+
+    def flush(self):
+        """Block until every scheduled file has been moved."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever piled up meanwhile so bursts are moved in one go.
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for path, root in batch:
+                try:
+                    self._move(path, root)
+                except OSError as e:
+                    print(f"Failed to move {path} to trash: {e}")
+                finally:
+                    self._queue.task_done()
+
+    def _move(self, path, root):
+        if not os.path.exists(path):
+            return
+        rel_path = os.path.relpath(path, root)
+        if rel_path.startswith(os.pardir):
+            rel_path = os.path.basename(path)
+        target = os.path.join(self.trash_dir(root), rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        base, ext = os.path.splitext(target)
+        counter = 1
+        while os.path.exists(target):
+            target = f"{base}_{counter}{ext}"
+            counter += 1
+        shutil.move(path, target)
+        print(f"Moved to trash: {path} -> {target}")
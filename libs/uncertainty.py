@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def binary_entropy(p):
+    """Entropy in bits of a detection being right with confidence `p`, 1 at 0.5 and 0 at 0 or 1."""
+    p = np.clip(np.asarray(p, dtype=np.float64), 1e-7, 1 - 1e-7)
+    return -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+
+
+def uncertainty_scores(confidences):
+    """Uncertainty of each image from the raw confidences of its detections.
+
+    `confidences` holds one array per image, of the candidate detections
+    around the confidence threshold. An image scores as high as its most
+    ambiguous candidate, so images with boxes the model could not decide on
+    come first; images without any candidate score 0.
+    """
+    counts = np.fromiter((len(c) for c in confidences), dtype=np.int64, count=len(confidences))
+    scores = np.zeros(len(confidences))
+    if not counts.sum():
+        return scores
+    entropy = binary_entropy(np.concatenate([np.asarray(c, dtype=np.float32) for c in confidences]))
+    has_detections = counts > 0
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    scores[has_detections] = np.maximum.reduceat(entropy, starts[has_detections])
+    return scores
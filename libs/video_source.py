@@ -0,0 +1,292 @@
+import bisect
+import collections
+import hashlib
+import os
+import re
+import threading
+
+VIDEO_EXTENSIONS = ('.avi', '.m4v', '.mkv', '.mov', '.mp4', '.mpeg', '.mpg', '.webm', '.wmv')
+# Frames are listed as `<video file>_<frame index>.png`, which gives every frame its own label file name
+FRAME_EXTENSION = '.png'
+_FRAME_PATH = re.compile(r'^(?P<video>.+)_(?P<index>\d+)%s$' % re.escape(FRAME_EXTENSION))
+# Without a seek index, frames at most this far ahead are reached by decoding forward instead of seeking
+FORWARD_DECODE_LIMIT = 30
+# Videos kept open for decoding; the least recently used one is closed beyond that
+MAX_OPEN_VIDEOS = 8
+
+
+def default_index_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'labelImg', 'video')
+
+
+def is_video_file(path):
+    return isinstance(path, str) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def frame_path(video_path, index, width=6):
+    return '%s_%0*d%s' % (video_path, width, index, FRAME_EXTENSION)
+
+
+def parse_frame_path(path):
+    """(video path, frame index) of a frame path, or None for any other path."""
+    if not isinstance(path, str):
+        return None
+    match = _FRAME_PATH.match(path)
+    if match is None or not is_video_file(match.group('video')):
+        return None
+    return match.group('video'), int(match.group('index'))
+
+
+def is_frame_path(path):
+    return parse_frame_path(path) is not None
+
+
+def frame_paths(video_path, frame_count):
+    width = max(6, len(str(max(frame_count - 1, 0))))
+    return [frame_path(video_path, i, width) for i in range(frame_count)]
+
+
+def _index_path(video_path, index_dir):
+    stat = os.stat(video_path)
+    key = '%s:%d:%d' % (video_path, stat.st_size, stat.st_mtime_ns)
+    return os.path.join(index_dir, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest() + '.npy')
+
+
+def video_frame_paths(video_path, index_dir=None):
+    """Paths of the frames of a video, counted without keeping it open.
+
+    The count comes from the stored seek index or the container header; only
+    videos that tell neither are opened as a VideoSource, which reads the
+    whole file once to build the index.
+    """
+    import cv2
+    import numpy as np
+    video_path = os.path.abspath(video_path)
+    try:
+        # The last entry of the seek index is the number of frames
+        return frame_paths(video_path, int(np.load(_index_path(video_path, index_dir or default_index_dir()))[-1]))
+    except (OSError, ValueError, IndexError):
+        pass
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            raise IOError("Unable to open video %s" % video_path)
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
+    if frame_count > 0:
+        return frame_paths(video_path, frame_count)
+    return open_video(video_path).frame_paths()
+
+
+class VideoSource:
+    """Frames of a video file, decoded with OpenCV only when they are needed.
+
+    A seek index of the keyframes is built once per video by reading the
+    packets without decoding them, in the background, and kept in the cache
+    directory. A frame is then reached by seeking to the keyframe before it
+    and decoding forward, or by decoding forward from the previous frame
+    when that is closer. The `cache_size` most recent frames are kept, and
+    `prefetch` decodes the neighbours of the current frame in the background.
+    """
+
+    def __init__(self, path, index_dir=None, cache_size=16):
+        import cv2
+        self.path = os.path.abspath(path)
+        self.index_dir = index_dir or default_index_dir()
+        self.cache_size = cache_size
+        self._capture = cv2.VideoCapture(self.path)
+        if not self._capture.isOpened():
+            raise IOError("Unable to open video %s" % path)
+        self.frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # Index of the frame the next read returns, None when unknown
+        self._position = 0
+        self._lock = threading.Lock()
+        self._frames = collections.OrderedDict()
+        self._keyframes = None
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._prefetcher = None
+
+        if not self._load_index():
+            if self.frame_count > 0:
+                threading.Thread(target=self._build_index, name='labelImg-video-index', daemon=True).start()
+            else:
+                # The container does not tell the length, only the index does
+                self._build_index()
+
+    def frame_paths(self):
+        return frame_paths(self.path, self.frame_count)
+
+    def _index_path(self):
+        return _index_path(self.path, self.index_dir)
+
+    def _load_index(self):
+        import numpy as np
+        try:
+            index = np.load(self._index_path())
+        except (OSError, ValueError):
+            return False
+        # The last entry is the number of frames
+        self._keyframes = index[:-1].tolist()
+        self.frame_count = int(index[-1])
+        return True
+
+    def _build_index(self):
+        import cv2
+        import numpy as np
+        # CAP_PROP_FORMAT -1 hands out the raw packets, nothing is decoded
+        capture = cv2.VideoCapture(self.path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        keyframes = []
+        count = 0
+        try:
+            while capture.grab():
+                if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(count)
+                count += 1
+        finally:
+            capture.release()
+        if not count or not keyframes or keyframes[0] != 0:
+            print(f"No seek index for {self.path}, seeking by frame number")
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            np.save(self._index_path(), np.asarray(keyframes + [count], dtype=np.int64))
+        except OSError as e:
+            print(f"Unable to store the seek index of {self.path}: {e}")
+        self._keyframes = keyframes
+        if self.frame_count <= 0:
+            self.frame_count = count
+
+    def _seek_plan(self, index):
+        """(frame to seek to, first frame from which decoding forward to `index` is cheaper than seeking)."""
+        keyframes = self._keyframes
+        if keyframes is None:
+            # OpenCV finds the keyframe itself, only slower
+            return index, max(0, index - FORWARD_DECODE_LIMIT)
+        keyframe = keyframes[bisect.bisect_right(keyframes, index) - 1]
+        return keyframe, keyframe
+
+    def _decode(self, index):
+        import cv2
+        with self._lock:
+            if index in self._frames:
+                return self._frames[index]
+            seek_to, forward_from = self._seek_plan(index)
+            if self._position is None or not forward_from <= self._position <= index:
+                if not self._capture.set(cv2.CAP_PROP_POS_FRAMES, seek_to):
+                    self._position = None
+                    return None
+                self._position = seek_to
+            while self._position < index:
+                if not self._capture.grab():
+                    self._position = None
+                    return None
+                self._position += 1
+            ok, frame = self._capture.read()
+            self._position = index + 1 if ok else None
+            if not ok:
+                return None
+            self._frames[index] = frame
+            while len(self._frames) > self.cache_size:
+                self._frames.popitem(last=False)
+            return frame
+
+    def read(self, index):
+        """The BGR frame at `index`, or None if it cannot be decoded."""
+        with self._lock:
+            frame = self._frames.get(index)
+            if frame is not None:
+                self._frames.move_to_end(index)
+                return frame
+        if index < 0:
+            return None
+        return self._decode(index)
+
+    def prefetch(self, index, ahead=4, behind=1):
+        """Decode the frames around `index` in the background, the next ones first."""
+        wanted = list(range(index + 1, index + ahead + 1)) + list(range(index - behind, index))
+        with self._condition:
+            self._pending = collections.deque(i for i in wanted if 0 <= i < self.frame_count)
+            if self._pending and self._prefetcher is None:
+                self._prefetcher = threading.Thread(target=self._run_prefetch, name='labelImg-video-prefetch',
+                                                    daemon=True)
+                self._prefetcher.start()
+            self._condition.notify()
+
+    def _run_prefetch(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                index = self._pending.popleft()
+            # One frame per lock so reads from the GUI wait for a single decode at most
+            self._decode(index)
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+        with self._lock:
+            self._capture.release()
+            self._frames.clear()
+
+
+# Most recently used last
+_sources = collections.OrderedDict()
+_sources_lock = threading.Lock()
+
+
+def open_video(path):
+    """The shared VideoSource of `path`.
+
+    At most MAX_OPEN_VIDEOS are kept open, the least recently used one is
+    closed when another video is opened.
+    """
+    path = os.path.abspath(path)
+    evicted = []
+    with _sources_lock:
+        source = _sources.get(path)
+        if source is None:
+            source = _sources[path] = VideoSource(path)
+            while len(_sources) > MAX_OPEN_VIDEOS:
+                evicted.append(_sources.popitem(last=False)[1])
+        else:
+            _sources.move_to_end(path)
+    for old in evicted:
+        old.close()
+    return source
+
+
+def close_videos():
+    with _sources_lock:
+        sources = list(_sources.values())
+        _sources.clear()
+    for source in sources:
+        source.close()
+
+
+def read_frame(path):
+    """The BGR frame a frame path refers to, or None if it cannot be decoded."""
+    video_path, index = parse_frame_path(path)
+    try:
+        return open_video(video_path).read(index)
+    except IOError as e:
+        print(e)
+        return None
+
+
+def imread(path):
+    """cv2.imread that also reads the frames of videos."""
+    if is_frame_path(path):
+        return read_frame(path)
+    import cv2
+    return cv2.imread(os.fspath(path))
@@ -51,7 +51,7 @@ class YOLOWriter:
 
         return class_index, x_center, y_center, w, h
 
-    def save(self, class_list=None, target_file=None):
+    def save(self, class_list=None, target_file=None, write_class_file=True):
         if class_list is None:
             class_list = []
         if target_file is None:
@@ -59,35 +59,25 @@ class YOLOWriter:
 
         assert len(class_list) != list(set(class_list)), f"class_list does not have unique values: {class_list}"
 
-        if target_file is None:
-            out_file = open(
-            self.filename + TXT_EXT, 'w', encoding=ENCODE_METHOD)
-            classes_file = os.path.join(os.path.dirname(os.path.abspath(self.filename)), "labels.txt")
-            out_class_file = open(classes_file, 'w')
-
-        else:
-            out_file = codecs.open(target_file, 'w', encoding=ENCODE_METHOD)
-            classes_file = os.path.join(os.path.dirname(os.path.abspath(target_file)), "labels.txt")
-            out_class_file = open(classes_file, 'w')
-
-
+        out_file = codecs.open(target_file, 'w', encoding=ENCODE_METHOD)
         for box in self.box_list:
             class_index, x_center, y_center, w, h = self.bnd_box_to_yolo_line(box, class_list)
             # print (classIndex, x_center, y_center, w, h)
             # print (out_class_file)
             out_file.write("%d %.6f %.6f %.6f %.6f\n" % (class_index, x_center, y_center, w, h))
 
-        # print (classList)
-        # print (out_class_file)
-        for c in class_list:
-            out_class_file.write(c+'\n')
-
-        out_class_file.close()
         out_file.close()
 
+        # Batch conversions write the shared class list once themselves
+        if write_class_file:
+            classes_file = os.path.join(os.path.dirname(os.path.abspath(target_file)), "labels.txt")
+            with open(classes_file, 'w') as out_class_file:
+                for c in class_list:
+                    out_class_file.write(c + '\n')
+
 class YoloReader:
 
-    def __init__(self, file_path, image, class_list_path=None):
+    def __init__(self, file_path, image_shape, class_list_path=None, classes=None):
         # shapes type:
         # [labbel, [(x1,y1), (x2,y2), (x3,y3), (x4,y4)], color, color, difficult]
         self.shapes = []
@@ -101,12 +91,16 @@ class YoloReader:
 
         # print (file_path, self.class_list_path)
 
-        classes_file = open(self.class_list_path, 'r')
-        self.classes = classes_file.read().strip('\n').split('\n')
+        if classes is not None:
+            # A class list already read by the caller, shared by many label files
+            self.classes = list(classes)
+        else:
+            classes_file = open(self.class_list_path, 'r')
+            self.classes = classes_file.read().strip('\n').split('\n')
         # print (self.classes)
 
-        img_size = [image.height(), image.width(),
-                    1 if image.isGrayscale() else 3]
+        # [height, width, depth] of the image, see LabelFile.image_shape
+        img_size = list(image_shape)
 
         self.img_size = img_size
 
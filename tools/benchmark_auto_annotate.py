@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure YOLO auto-annotation throughput (images/s) for different numbers of
+worker processes on this machine. Labels are written to a temporary
+directory and the detection cache is disabled, so every run does the same work.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.auto_annotate import YOLOAutoAnnotator
+from libs.batch_annotate import BatchAnnotationEngine, ShardedAnnotationEngine, default_threads_per_worker
+from libs.labelFile import LabelFileFormat
+
+IMAGE_EXTENSIONS = ('.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+
+
+def find_images(image_dir, limit):
+    images = []
+    for root, _dirs, files in os.walk(image_dir):
+        images.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    images.sort()
+    return images[:limit] if limit else images
+
+
+def benchmark(annotator, images, workers, batch_size, threads):
+    with tempfile.TemporaryDirectory() as label_dir:
+        if workers == 0:
+            engine = BatchAnnotationEngine(annotator, LabelFileFormat.YOLO, label_dir, batch_size=batch_size)
+        else:
+            engine = ShardedAnnotationEngine(
+                annotator, LabelFileFormat.YOLO, label_dir, batch_size=batch_size,
+                workers=workers, threads_per_worker=threads)
+        return engine.run(images)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("image_dir", help="Directory with the images to annotate")
+    parser.add_argument("-m", "--model-dir", default="yolo_model", help="Directory with the .onnx or .pt model")
+    parser.add_argument("-w", "--workers", default="0,1,2,4",
+                        help="Comma separated worker counts, 0 runs the model in this process")
+    parser.add_argument("-b", "--batch-size", type=int, default=8)
+    parser.add_argument("-t", "--threads", type=int, default=None,
+                        help="Inference threads per worker (default: CPU cores / workers)")
+    parser.add_argument("-n", "--limit", type=int, default=200, help="Number of images to use, 0 for all")
+    args = parser.parse_args()
+
+    images = find_images(args.image_dir, args.limit)
+    if not images:
+        sys.exit(f"No images found in {args.image_dir}")
+    annotator = YOLOAutoAnnotator(args.model_dir)
+    annotator.warm_up()
+
+    print(f"{len(images)} images, batch size {args.batch_size}, {os.cpu_count()} CPU cores")
+    print(f"{'workers':>8} {'threads':>8} {'seconds':>9} {'images/s':>9} {'failed':>7}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        threads = args.threads or default_threads_per_worker(workers)
+        result = benchmark(annotator, images, workers, args.batch_size, threads)
+        print(f"{workers:>8} {threads if workers else '-':>8} {result.elapsed:>9.2f} "
+              f"{result.images_per_second:>9.1f} {result.failed:>7}")
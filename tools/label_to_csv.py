@@ -9,124 +9,203 @@ Time: 2021.02.06
 """
 
 import os
+import sys
 import argparse
 import codecs
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
-
-def txt2csv(location, training_dir, path_prefix):
-    # Return list
-    temp_res = []
-
-    # Run through all the files
-    for file in os.listdir(location):
-        # Check the file name ends with txt
-        #  and not class.txt
-        if (not file.endswith(".txt")) | \
-                (file == "classes.txt"):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Label files handed to a worker process at once
+DEFAULT_BATCH_SIZE = 2000
+# Class lists written next to YOLO label files, not labels themselves
+CLASS_LIST_FILES = ("classes.txt", "labels.txt")
+
+
+def to_rows(training_dir, path_prefix, stems, labels, boxes):
+    """Build the csv rows of N boxes.
+
+    `training_dir` and `path_prefix` are shared by all boxes or given per box,
+    `stems` are the image names without extension, `boxes` an (N, 4) array of
+    normalized x_min, y_min, x_max, y_max. The unused corners stay blank.
+    """
+    count = len(labels)
+    blank = np.full(count, "", dtype=object)
+    prefixes = pd.Series(np.broadcast_to(np.asarray(path_prefix, dtype=object), (count,)), dtype=object)
+    return pd.DataFrame({
+        "set": np.broadcast_to(np.asarray(training_dir, dtype=object), (count,)).astype(str),
+        # gs://prefix/name/{image_name}
+        "path": (prefixes + "/" + pd.Series(np.asarray(stems, dtype=object), dtype=object) + ".jpg").to_numpy(),
+        "label": labels,
+        "x_min": boxes[:, 0], "y_min": boxes[:, 1],
+        "lower_left_x": blank, "lower_left_y": blank,
+        "x_max": boxes[:, 2], "y_max": boxes[:, 3],
+        "upper_right_x": blank, "upper_right_y": blank,
+    })
+
+
+def txt2csv(files, training_dir, path_prefix, class_labels):
+    # Collect the numbers of all files first, then convert them in one go
+    values = []
+    stems = []
+    for file_whole_name in files:
+        with open(file_whole_name, encoding="utf8") as f:
+            lines = [line.split() for line in f.read().splitlines()]
+        lines = [(number, fields) for number, fields in enumerate(lines, 1) if fields]
+        bad = next((number for number, fields in lines if len(fields) != 5), None)
+        if bad is not None:
+            print(f"Skipping {file_whole_name}: not 5 values on line {bad}")
             continue
+        try:
+            numbers = np.asarray([fields for _, fields in lines], dtype=np.float64).reshape(-1, 5)
+        except ValueError as e:
+            print(f"Skipping {file_whole_name}: {e}")
+            continue
+        values.append(numbers)
+        stems.extend([os.path.splitext(os.path.basename(file_whole_name))[0]] * len(numbers))
 
-        # Get the file name
-        file_whole_name = f"{location}/{file}"
-
-        # Read in txt as csv
-        df_txt = pd.read_csv(file_whole_name, sep=" ", header=None)
-
-        # Create data for each labels
-        for index, row in df_txt.iterrows():
-            # Temp array for csv, initialized by the training types
-            temp_csv = [str(training_dir)]
-
-            # gs://prefix/name/{image_name}
-            cloud_path = f"{path_prefix}/{os.path.splitext(file)[0]}.jpg"
-            temp_csv.append(cloud_path)
-
-            # Class label
-            temp_csv.append(class_labels[int(row[0])])
-
-            # Add the upper left coordinate
-            x_min = min(max(0.0, row[1] - row[3] / 2), 1.0)
-            y_min = min(max(0.0, row[2] - row[4] / 2), 1.0)
-            temp_csv.extend([x_min, y_min])
-
-            # Add the lower left coordinate (not necessary, left blank)
-            temp_csv.extend(["", ""])
-
-            # Add the lower right coordinate
-            x_max = min(max(0.0, row[1] + row[3] / 2), 1.0)
-            y_max = min(max(0.0, row[2] + row[4] / 2), 1.0)
-            temp_csv.extend([x_max, y_max])
-
-            # Add the upper right coordinate (not necessary, left blank)
-            temp_csv.extend(["", ""])
-
-            # Append to the res
-            temp_res.append(temp_csv)
+    rows = np.concatenate(values) if values else np.zeros((0, 5))
+    class_ids = rows[:, 0].astype(np.int64)
+    known = np.asarray(class_labels + [""], dtype=object)
+    labels = known[np.minimum(class_ids, len(class_labels))]
+    for class_id in np.unique(class_ids[class_ids >= len(class_labels)]):
+        print(f"Warning: Class index {class_id} is not in the class list, using Class_{class_id}")
+        labels[class_ids == class_id] = f"Class_{class_id}"
 
-    return temp_res
+    # Center, size to corners, clamped to the image
+    half = rows[:, 3:5] / 2
+    boxes = np.clip(np.concatenate([rows[:, 1:3] - half, rows[:, 1:3] + half], axis=1), 0.0, 1.0)
+    return to_rows(training_dir, path_prefix, stems, labels, boxes)
 
 
-def xml2csv(location, training_dir, path_prefix):
+def xml2csv(files, training_dir, path_prefix, class_labels=None):
     # To parse the xml files
     import xml.etree.ElementTree as ET
 
-    # Return list
-    temp_res = []
-
-    # Run through all the files
-    for file in os.listdir(location):
-        # Check the file name ends with xml
-        if not file.endswith(".xml"):
+    stems = []
+    labels = []
+    corners = []
+    sizes = []
+    for file_whole_name in files:
+        try:
+            root = ET.parse(file_whole_name).getroot()
+
+            # Get the width, height of images
+            #  to normalize the bounding boxes
+            size = root.find("size")
+            width, height = float(size.find("width").text), float(size.find("height").text)
+            stem = os.path.splitext(os.path.basename(file_whole_name))[0]
+
+            # Find all the bounding objects of the file before adding any
+            file_labels = []
+            file_corners = []
+            for label_object in root.findall("object"):
+                bounding_box = label_object.find("bndbox")
+                file_labels.append(label_object.find("name").text)
+                file_corners.append([float(bounding_box.find(key).text) for key in ("xmin", "ymin", "xmax", "ymax")])
+        except (ET.ParseError, AttributeError, TypeError, ValueError) as e:
+            print(f"Skipping {file_whole_name}: {e}")
             continue
+        stems.extend([stem] * len(file_labels))
+        labels.extend(file_labels)
+        corners.extend(file_corners)
+        sizes.extend([(width, height)] * len(file_labels))
+
+    boxes = np.asarray(corners, dtype=np.float64).reshape(-1, 4)
+    boxes /= np.tile(np.asarray(sizes, dtype=np.float64).reshape(-1, 2), 2)
+    return to_rows(training_dir, path_prefix, stems, np.asarray(labels, dtype=object), boxes)
+
+
+CONVERTERS = {"txt": txt2csv, "xml": xml2csv}
+# -l is a dataset snapshot written by labelImg instead of a label directory
+SNAPSHOT_MODE = "snapshot"
+# Rows converted and written at once from a snapshot
+SNAPSHOT_CHUNK_ROWS = 100000
+
+
+def snapshot2csv(snapshot_path, output, prefix):
+    """Write the rows of a dataset snapshot (see libs/snapshot.py) to `output` without opening any label file.
+
+    The image paths in the snapshot follow the label tree, <training type>/<class>/<image>.
+    """
+    from libs.snapshot import DatasetSnapshot
+
+    snapshot = DatasetSnapshot.load(snapshot_path)
+    parts = [str(path).split("/") for path in snapshot.images]
+    training_dirs = np.asarray([p[0] if len(p) > 2 else "" for p in parts], dtype=object)
+    path_prefixes = np.asarray([f"{prefix}/{p[-2]}" if len(p) > 1 else prefix for p in parts], dtype=object)
+    stems = np.asarray([os.path.splitext(p[-1])[0] for p in parts], dtype=object)
+
+    with open(output, "w", newline="", encoding="utf8") as out_file:
+        for start in range(0, len(snapshot), SNAPSHOT_CHUNK_ROWS):
+            rows = slice(start, start + SNAPSHOT_CHUNK_ROWS)
+            image_id = np.asarray(snapshot.image_id[rows])
+            size = np.stack([snapshot.widths, snapshot.heights], axis=1)[image_id]
+            boxes = np.clip(np.asarray(snapshot.boxes[rows]) / np.tile(size, 2), 0.0, 1.0)
+            labels = snapshot.classes[np.asarray(snapshot.class_id[rows])].astype(object)
+            to_rows(training_dirs[image_id], path_prefixes[image_id], stems[image_id], labels, boxes) \
+                .to_csv(out_file, index=False, header=False)
+    return len(snapshot)
+
+
+def find_batches(location, mode, prefix, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield (label files, training type, cloud path prefix) batches of the label directory tree."""
+    for training_type_dir in sorted(os.listdir(location)):
+        # Get the dirname
+        dir_name = os.path.join(location, training_type_dir)
 
-        # Get the file name
-        file_whole_name = f"{location}/{file}"
-
-        # Open the xml name
-        tree = ET.parse(file_whole_name)
-        root = tree.getroot()
-
-        # Get the width, height of images
-        #  to normalize the bounding boxes
-        size = root.find("size")
-        width, height = float(size.find("width").text), float(size.find("height").text)
-
-        # Find all the bounding objects
-        for label_object in root.findall("object"):
-            # Temp array for csv, initialized by the training types
-            temp_csv = [str(training_dir)]
-
-            # gs://prefix/name/{image_name}
-            cloud_path = f"{path_prefix}/{os.path.splitext(file)[0]}.jpg"
-            temp_csv.append(cloud_path)
-
-            # Class label
-            temp_csv.append(label_object.find("name").text)
-
-            # Bounding box coordinate
-            bounding_box = label_object.find("bndbox")
-
-            # Add the upper left coordinate
-            x_min = float(bounding_box.find("xmin").text) / width
-            y_min = float(bounding_box.find("ymin").text) / height
-            temp_csv.extend([x_min, y_min])
-
-            # Add the lower left coordinate (not necessary, left blank)
-            temp_csv.extend(["", ""])
-
-            # Add the lower right coordinate
-            x_max = float(bounding_box.find("xmax").text) / width
-            y_max = float(bounding_box.find("ymax").text) / height
-            temp_csv.extend([x_max, y_max])
+        # Check whether is dir
+        if not os.path.isdir(dir_name):
+            continue
 
-            # Add the upper right coordinate (not necessary, left blank)
-            temp_csv.extend(["", ""])
+        for class_type_dir in sorted(os.listdir(dir_name)):
+            class_dir = os.path.join(dir_name, class_type_dir)
 
-            # Append to the res
-            temp_res.append(temp_csv)
+            # Check whether is dir
+            if not os.path.isdir(class_dir):
+                continue
 
-    return temp_res
+            files = sorted(
+                os.path.join(class_dir, file) for file in os.listdir(class_dir)
+                if file.endswith("." + mode) and file not in CLASS_LIST_FILES
+            )
+            for i in range(0, len(files), batch_size):
+                yield files[i:i + batch_size], training_type_dir, f"{prefix}/{class_type_dir}"
+
+
+def _convert_batch(job):
+    mode, files, training_dir, path_prefix, class_labels = job
+    try:
+        return CONVERTERS[mode](files, training_dir, path_prefix, class_labels)
+    except Exception as e:
+        # A file the converter did not expect, the other batches are still written
+        print(f"Skipping {len(files)} files from {files[0]} to {files[-1]}: {e}")
+        return None
+
+
+def convert(location, mode, output, class_labels, prefix, jobs=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Convert all label files under `location` to `output`, returning the number of rows.
+
+    Batches of files are converted in `jobs` processes and their rows are
+    appended to the csv in order as they come in, so memory use does not
+    grow with the size of the dataset.
+    """
+    batches = (
+        (mode, files, training_dir, path_prefix, class_labels)
+        for files, training_dir, path_prefix in find_batches(location, mode, prefix, batch_size)
+    )
+    rows = 0
+    with open(output, "w", newline="", encoding="utf8") as out_file, \
+            ProcessPoolExecutor(max_workers=jobs) as executor:
+        for frame in executor.map(_convert_batch, batches):
+            if frame is None:
+                continue
+            frame.to_csv(out_file, index=False, header=False)
+            rows += len(frame)
+    return rows
 
 
 if __name__ == "__main__":
@@ -143,7 +222,8 @@ if __name__ == "__main__":
     arg_p.add_argument("-m", "--mode",
                        type=str,
                        required=True,
-                       help="'xml' for converting from xml and 'txt' for converting from txt")
+                       help="'xml' for converting from xml, 'txt' for converting from txt and 'snapshot' "
+                            "for a dataset snapshot given as location")
     arg_p.add_argument("-o", "--output",
                        type=str,
                        default="res.csv",
@@ -152,8 +232,31 @@ if __name__ == "__main__":
                        type=str,
                        default=os.path.join("..", "data", "predefined_classes.txt"),
                        help="Label classes path")
+    arg_p.add_argument("-j", "--jobs",
+                       type=int,
+                       default=None,
+                       help="Number of worker processes (default: number of CPUs)")
+    arg_p.add_argument("-b", "--batch-size",
+                       type=int,
+                       default=DEFAULT_BATCH_SIZE,
+                       help="Label files converted per task")
     args = vars(arg_p.parse_args())
 
+    # Prefix of the cloud storage
+    ori_prefix = f"gs://{args['prefix']}"
+
+    if args["mode"] == SNAPSHOT_MODE:
+        rows = snapshot2csv(args["location"], args["output"], ori_prefix)
+        print(f"Wrote {rows} rows to {args['output']}")
+        exit(0)
+
+    if args["mode"] not in CONVERTERS:
+        print("Wrong argument for convert mode.\n"
+              "'xml' for converting from xml to csv\n"
+              "'txt' for converting from txt to csv\n"
+              "'snapshot' for converting a dataset snapshot to csv")
+        exit(1)
+
     # Class labels
     class_labels = []
 
@@ -167,49 +270,6 @@ if __name__ == "__main__":
         print(f"File: {args['classes']} not exists")
         exit(1)
 
-    # Prefix of the cloud storage
-    ori_prefix = f"gs://{args['prefix']}"
-
-    # Array for final csv file
-    res = []
-    # Get all the file in dir
-    for training_type_dir in os.listdir(args["location"]):
-        # Get the dirname
-        dir_name = f"{args['location']}/{training_type_dir}"
-
-        # Check whether is dir
-        if not os.path.isdir(dir_name):
-            continue
-            # Process the files
-
-        for class_type_dir in os.listdir(dir_name):
-
-            # Check whether is dir
-            if not os.path.isdir(dir_name):
-                continue
-
-            prefix = f"{ori_prefix}/{class_type_dir}"
-
-            # Convert the chosen extension to csv
-            if args["mode"] == "txt":
-                res.extend(txt2csv(f"{dir_name}/{class_type_dir}",
-                                   training_type_dir,
-                                   prefix))
-            elif args["mode"] == "xml":
-                res.extend(xml2csv(f"{dir_name}/{class_type_dir}",
-                                   training_type_dir,
-                                   prefix))
-            else:
-                print("Wrong argument for convert mode.\n"
-                      "'xml' for converting from xml to csv\n"
-                      "'txt' for converting from txt to csv")
-                exit(1)
-
-    # Write to the result csv
-    res_csv = pd.DataFrame(res,
-                           columns=["set", "path", "label",
-                                    "x_min", "y_min",
-                                    "x_max", "y_min",
-                                    "x_max", "y_max",
-                                    "x_min", "y_max"])
-    res_csv.to_csv("res.csv", index=False, header=False)
+    rows = convert(args["location"], args["mode"], args["output"], class_labels, ori_prefix,
+                   args["jobs"], max(1, args["batch_size"]))
+    print(f"Wrote {rows} rows to {args['output']}")
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rename images and their label files to <name>_<index>, keeping image and
+labels together.
+
+The whole plan is written to a journal before the first file is touched,
+so a run that stops halfway can be finished with --resume or undone with
+--rollback, and a finished run can be undone with --rollback as well.
+The <filename> and <path> of Pascal VOC files and the "image" of CreateML
+files are updated to the new image name: they are written under the new
+name and the old file is removed, so no file is ever half rewritten.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.convert import CLASS_LIST_FILES
+from libs.create_ml_io import JSON_EXT
+from libs.image_size import is_image_file
+from libs.pascal_voc_io import XML_EXT
+from libs.yolo_io import TXT_EXT
+
+LABEL_EXTENSIONS = (XML_EXT, TXT_EXT, JSON_EXT)
+JOURNAL_NAME = ".labelimg-rename.jsonl"
+JOURNAL_VERSION = 1
+# Files renamed per task
+DEFAULT_BATCH_SIZE = 2000
+# Suffix of the intermediate names when new names are taken by files still to be renamed
+TEMP_SUFFIX = ".labelimg-rename"
+# Suffix of label files being written, renamed to their name once complete
+PART_SUFFIX = ".part"
+
+# Steps recorded in the journal once every file went through them
+STAGED = "staged"
+RENAMED = "renamed"
+ROLLBACK = "rollback"
+UNSTAGED = "unstaged"
+
+
+class RenameError(Exception):
+    pass
+
+
+class Plan:
+    """Renames of image and label file pairs.
+
+    `pairs` are (old name, new name, image extension, label extensions),
+    names without extension. With `staged` set, some new names are taken by
+    files of the plan, and every file is first moved to an intermediate name.
+    """
+
+    def __init__(self, image_dir, label_dir, pairs, staged):
+        self.image_dir = os.path.abspath(image_dir)
+        self.label_dir = os.path.abspath(label_dir)
+        self.pairs = pairs
+        self.staged = staged
+
+    def files(self):
+        """(old path, new path, image names) of every image and label file.
+
+        The image names are (old, new) image file names for the label files
+        that name their image, None for the others.
+        """
+        for old, new, image_ext, label_exts in self.pairs:
+            yield os.path.join(self.image_dir, old + image_ext), os.path.join(self.image_dir, new + image_ext), None
+            names = (old + image_ext, new + image_ext)
+            for ext in label_exts:
+                yield (os.path.join(self.label_dir, old + ext), os.path.join(self.label_dir, new + ext),
+                       None if ext == TXT_EXT else names)
+
+    def write(self, journal_path):
+        with open(journal_path, "w", encoding="utf8") as f:
+            json.dump({"version": JOURNAL_VERSION, "image_dir": self.image_dir, "label_dir": self.label_dir,
+                       "staged": self.staged}, f)
+            f.write("\n")
+            f.writelines(json.dumps(pair) + "\n" for pair in self.pairs)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def read(journal_path):
+        """The plan of a journal and the steps it records as done."""
+        with open(journal_path, encoding="utf8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != JOURNAL_VERSION:
+                raise RenameError(f"{journal_path} was written by another version of this tool")
+            pairs = []
+            steps = set()
+            for line in f:
+                entry = json.loads(line)
+                if isinstance(entry, dict):
+                    steps.add(entry["step"])
+                else:
+                    pairs.append(tuple(entry))
+        return Plan(header["image_dir"], header["label_dir"], pairs, header["staged"]), steps
+
+
+def _record(journal_path, step):
+    with open(journal_path, "a", encoding="utf8") as f:
+        f.write(json.dumps({"step": step}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def make_plan(image_dir, label_dir, name, start=1, digits=0, unlabelled=False):
+    """Plan renaming the images of `image_dir` with their label files in `label_dir`, sorted by name.
+
+    Images without a label file are only renamed if `unlabelled` is set.
+    Returns the Plan and the warnings about files that are left alone.
+    """
+    warnings = []
+    images = {}
+    image_names = os.listdir(image_dir)
+    for file_name in image_names:
+        if is_image_file(file_name):
+            stem, ext = os.path.splitext(file_name)
+            images.setdefault(stem, []).append(ext)
+    labels = {}
+    label_names = os.listdir(label_dir)
+    for file_name in label_names:
+        stem, ext = os.path.splitext(file_name)
+        if ext in LABEL_EXTENSIONS and file_name not in CLASS_LIST_FILES:
+            labels.setdefault(stem, []).append(ext)
+
+    pairs = []
+    for stem in sorted(images):
+        if len(images[stem]) > 1:
+            # Their label files would belong to both
+            warnings.append(f"Skipping {stem}: more than one image named {stem} "
+                            f"({', '.join(sorted(images[stem]))})")
+            continue
+        label_exts = sorted(labels.get(stem, []))
+        if not label_exts and not unlabelled:
+            continue
+        pairs.append([stem, f"{name}_{len(pairs) + start:0{digits}d}", images[stem][0], label_exts])
+    # Files that already have their new name need no work
+    pairs = [pair for pair in pairs if pair[0] != pair[1]]
+    # An image or label file left where it is would share its name with a renamed image
+    moving = {pair[0] for pair in pairs}
+    staying = (set(images) | set(labels)) - moving
+    clashes = sorted(pair[1] for pair in pairs if pair[1] in staying)
+    if clashes:
+        raise RenameError(f"{len(clashes)} new names are used by images or label files that are not renamed, "
+                          f"e.g. {clashes[0]}")
+
+    plan = Plan(image_dir, label_dir, pairs, staged=False)
+    existing = {os.path.join(plan.image_dir, file_name) for file_name in image_names}
+    existing.update(os.path.join(plan.label_dir, file_name) for file_name in label_names)
+    old_paths = set()
+    new_paths = set()
+    for old_path, new_path, _names in plan.files():
+        old_paths.add(old_path)
+        new_paths.add(new_path)
+    taken = sorted((new_paths - old_paths) & existing)
+    if taken:
+        raise RenameError(f"{len(taken)} new names are taken by other files, e.g. {taken[0]}")
+    plan.staged = not new_paths.isdisjoint(old_paths)
+    if plan.staged:
+        in_the_way = sorted({path + TEMP_SUFFIX for path in old_paths} & existing)
+        if in_the_way:
+            raise RenameError(f"{in_the_way[0]} is in the way, it is left from another rename")
+    return plan, warnings
+
+
+def rename_image(data, is_xml, old_name, new_name):
+    """The Pascal VOC or CreateML file `data` naming the image `new_name` where it named `old_name`.
+
+    Anything else stays as it is, so renaming again changes nothing and
+    swapping the names undoes it.
+    """
+    if is_xml:
+        from lxml import etree
+
+        root = etree.fromstring(data)
+        changed = False
+        filename = root.find("filename")
+        if filename is not None and filename.text in (old_name, os.path.splitext(old_name)[0]):
+            filename.text = new_name if filename.text == old_name else os.path.splitext(new_name)[0]
+            changed = True
+        path = root.find("path")
+        if path is not None and path.text and os.path.basename(path.text) == old_name:
+            path.text = path.text[:len(path.text) - len(old_name)] + new_name
+            changed = True
+        if not changed:
+            return data
+        text = etree.tostring(root, encoding="utf-8", xml_declaration=data.startswith(b"<?xml"))
+        return text + b"\n" if data.endswith(b"\n") else text
+
+    images = json.loads(data)
+    if not isinstance(images, list):
+        return data
+    changed = False
+    for image in images:
+        if isinstance(image, dict) and image.get("image") == old_name:
+            image["image"] = new_name
+            changed = True
+    return json.dumps(images).encode("utf8") if changed else data
+
+
+def _move_batch(moves):
+    """Move the (source, target, image names) moves whose source is still there.
+
+    Label files with image names are written to the target with the image
+    renamed, then the source is removed; a crash in between leaves the
+    source to be moved again. The target is written under another name
+    first, so it is always complete. Returns how many files were moved.
+    """
+    moved = 0
+    for source, target, names in moves:
+        try:
+            if names is not None:
+                with open(source, "rb") as f:
+                    data = f.read()
+                renamed = rename_image(data, target.endswith(XML_EXT), *names)
+            if names is None or renamed is data:
+                os.rename(source, target)
+            else:
+                with open(target + PART_SUFFIX, "wb") as f:
+                    f.write(renamed)
+                os.rename(target + PART_SUFFIX, target)
+                os.remove(source)
+        except FileNotFoundError:
+            # Moved before the run was interrupted
+            continue
+        moved += 1
+    return moved
+
+
+def _move_all(moves, workers, batch_size):
+    """Carry out all `moves` in batches on `workers` processes; no two moves may share a file."""
+    batches = [moves[i:i + batch_size] for i in range(0, len(moves), batch_size)]
+    if len(batches) < 2 or workers == 1:
+        return sum(map(_move_batch, batches))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_move_batch, batches))
+
+
+def run(plan, journal_path, steps=frozenset(), workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Carry out `plan`, skipping the `steps` the journal already records as done."""
+    files = list(plan.files())
+    if plan.staged:
+        if STAGED not in steps:
+            _move_all([(old, old + TEMP_SUFFIX, None) for old, _new, _names in files], workers, batch_size)
+            _record(journal_path, STAGED)
+        moves = [(old + TEMP_SUFFIX, new, names) for old, new, names in files]
+    else:
+        moves = files
+    if RENAMED not in steps:
+        _move_all(moves, workers, batch_size)
+        _record(journal_path, RENAMED)
+
+
+def rollback(plan, journal_path, steps, workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Undo what the journal records, then remove the journal."""
+    if ROLLBACK not in steps:
+        _record(journal_path, ROLLBACK)
+    files = list(plan.files())
+    # Label files that were not renamed yet still name their old image and stay as they are
+    backward = [(new, old, None if names is None else names[::-1]) for old, new, names in files]
+    if plan.staged:
+        # Only once every file left its old name can a file at a new name be one of ours
+        if STAGED in steps and UNSTAGED not in steps:
+            _move_all([(new, old + TEMP_SUFFIX, None) for old, new, _names in files], workers, batch_size)
+            _record(journal_path, UNSTAGED)
+        backward = [(old + TEMP_SUFFIX, old, names) for _new, old, names in backward]
+    _move_all(backward, workers, batch_size)
+    # Label files an interrupted run was writing
+    for _old, new, names in files:
+        if names is not None and os.path.lexists(new + PART_SUFFIX):
+            os.remove(new + PART_SUFFIX)
+    os.remove(journal_path)
+
+
+def main(argv=None):
+    arg_p = argparse.ArgumentParser(description="Rename images and their label files to <name>_<index>")
+    arg_p.add_argument("image_dir", help="Directory with the images")
+    arg_p.add_argument("-l", "--label-dir", help="Directory with the label files (default: image_dir)")
+    arg_p.add_argument("-n", "--name", help="New name of the files, followed by _<index>")
+    arg_p.add_argument("-s", "--start", type=int, default=1, help="Index of the first file (default: 1)")
+    arg_p.add_argument("-d", "--digits", type=int, default=0, help="Pad the index with zeros to this many digits")
+    arg_p.add_argument("-a", "--all", action="store_true", help="Rename images without a label file as well")
+    arg_p.add_argument("--dry-run", action="store_true", help="Print the renames without touching any file")
+    arg_p.add_argument("--resume", action="store_true", help="Finish the rename the journal records")
+    arg_p.add_argument("--rollback", action="store_true", help="Undo the rename the journal records")
+    arg_p.add_argument("--journal", help=f"Journal file (default: image_dir/{JOURNAL_NAME})")
+    arg_p.add_argument("-j", "--jobs", type=int, default=None,
+                       help="Number of worker processes (default: number of CPUs)")
+    arg_p.add_argument("-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                       help="Files renamed per task")
+    args = arg_p.parse_args(argv)
+    journal_path = args.journal or os.path.join(args.image_dir, JOURNAL_NAME)
+    workers = args.jobs or os.cpu_count() or 1
+    batch_size = max(1, args.batch_size)
+
+    try:
+        if args.resume or args.rollback:
+            plan, steps = Plan.read(journal_path)
+            if args.rollback:
+                rollback(plan, journal_path, steps, workers, batch_size)
+                print(f"Rolled back the rename of {len(plan.pairs)} images")
+                return 0
+            if ROLLBACK in steps:
+                raise RenameError("the rename is being rolled back, finish that with --rollback")
+            run(plan, journal_path, steps, workers, batch_size)
+            print(f"Renamed {len(plan.pairs)} images and their label files")
+            return 0
+
+        if not args.name:
+            arg_p.error("--name is required for a new rename")
+        if os.path.exists(journal_path) and RENAMED not in Plan.read(journal_path)[1]:
+            raise RenameError(f"{journal_path} records an unfinished rename, use --resume or --rollback")
+        plan, warnings = make_plan(args.image_dir, args.label_dir or args.image_dir, args.name, args.start,
+                                   args.digits, args.all)
+        for warning in warnings:
+            print(warning, file=sys.stderr)
+        if args.dry_run:
+            for old, new, image_ext, label_exts in plan.pairs:
+                print(f"{old}{image_ext} -> {new}{image_ext}" +
+                      "".join(f", {old}{ext} -> {new}{ext}" for ext in label_exts))
+            print(f"Would rename {len(plan.pairs)} images and {sum(len(pair[3]) for pair in plan.pairs)} label files")
+            return 0
+        if not plan.pairs:
+            print("Nothing to rename")
+            return 0
+        plan.write(journal_path)
+        run(plan, journal_path, workers=workers, batch_size=batch_size)
+    except (OSError, ValueError, RenameError) as e:
+        sys.exit(f"rename_dataset.py: {e}")
+    print(f"Renamed {len(plan.pairs)} images and {sum(len(pair[3]) for pair in plan.pairs)} label files, "
+          f"undo with --rollback")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())